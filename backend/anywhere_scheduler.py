@@ -0,0 +1,185 @@
+# anywhere_scheduler.py
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from cache_key import CacheKey
+from config import settings
+from fare_model import FareDay
+from http_client import pobeda_http
+from rate_limiter import upstream_limiter
+
+logger = logging.getLogger(__name__)
+
+
+class AnywhereScheduler:
+    """Ограниченная очередь работ (направление, дата) для поиска "Куда угодно".
+
+    Вместо asyncio.gather по всем направлениям сразу - один пул воркеров
+    на весь поиск. Направления с прогретым кешем и низкой ценой идут первыми,
+    готовые направления отдаются сразу, как только все их даты получены.
+    """
+
+    def __init__(
+        self,
+        flight_service,
+        origin: str,
+        destinations: List[str],
+        dates: List[Dict],
+        promo_code: Optional[str] = None,
+        workers: int = None,
+        is_cancelled: Optional[Callable[[], Awaitable[bool]]] = None,
+    ):
+        self.flight_service = flight_service
+        self.origin = origin
+        self.destinations = list(dict.fromkeys(destinations))
+        self.dates = dates
+        self.promo_code = promo_code
+        self.workers = workers or settings.ANYWHERE_WORKERS
+        self.is_cancelled = is_cancelled
+        self.cancelled = False
+
+        self.stats = {
+            "destinations": len(self.destinations),
+            "units_total": len(self.destinations) * len(dates),
+            "units_cached": 0,
+            "upstream_calls": 0,
+            "upstream_failed": 0,
+            "upstream_blocked": 0,  # 403/429 по всему процессу за время поиска
+            "time_to_first_result": None,
+            "elapsed": None,
+        }
+
+    def _order_destinations(self, cached_counts: Dict[str, int], cached_best: Dict[str, Dict]) -> List[str]:
+        """Сначала прогретые кешем и дешевые направления"""
+        total_dates = len(self.dates) or 1
+
+        def sort_key(destination: str):
+            warm_ratio = cached_counts.get(destination, 0) / total_dates
+            known_price = (cached_best.get(destination) or {}).get("min_price")
+            return (-warm_ratio, known_price if known_price is not None else float("inf"))
+
+        return sorted(self.destinations, key=sort_key)
+
+    async def run(self) -> AsyncIterator[Tuple[str, List[FareDay], Optional[Dict]]]:
+        """Отдает (направление, свежие дни в виде FareDay, минимум из кеша) по мере готовности направлений.
+
+        Кешированные дни не читаются из JSONB: по ним приходит только агрегат
+        get_cheapest_per_destination (минимальная цена, дата, число дней).
+        Ответ API разбирается в FareDay один раз при получении; исходные dict
+        нужны только для записи в кеш и освобождаются сразу после нее.
+        """
+        started = time.monotonic()
+        blocked_before = upstream_limiter.stats["responses_blocked"]
+        date_strings = [date_info["db"] for date_info in self.dates]
+
+        cached = await self.flight_service._get_cached_dates_multi(
+            self.origin, self.destinations, date_strings, self.promo_code
+        )
+        cached_best = await self.flight_service.get_cheapest_per_destination(
+            self.origin, date_strings, self.promo_code, self.destinations
+        )
+
+        queue: asyncio.Queue = asyncio.Queue()
+        done: asyncio.Queue = asyncio.Queue()
+        fresh: Dict[str, List[Dict]] = {}
+        fares: Dict[str, List[FareDay]] = {}
+        remaining: Dict[str, int] = {}
+        ready: List[str] = []
+
+        cached_counts: Dict[str, int] = {}
+        for key in cached:
+            cached_counts[key.destination] = cached_counts.get(key.destination, 0) + 1
+
+        for destination in self._order_destinations(cached_counts, cached_best):
+            self.stats["units_cached"] += cached_counts.get(destination, 0)
+            fresh[destination] = []
+            fares[destination] = []
+            uncached = [
+                date_info
+                for date_info in self.dates
+                if CacheKey.of(self.origin, destination, date_info["db"], self.promo_code) not in cached
+            ]
+            remaining[destination] = len(uncached)
+
+            if not uncached:
+                ready.append(destination)
+            for date_info in uncached:
+                queue.put_nowait((destination, date_info))
+
+        logger.info(
+            f"🗂 Anywhere {self.origin}: {queue.qsize()} units to fetch, "
+            f"{self.stats['units_cached']} from cache, {self.workers} workers"
+        )
+
+        session = await pobeda_http.get_session()
+
+        async def worker():
+            while True:
+                destination, date_info = await queue.get()
+                try:
+                    self.stats["upstream_calls"] += 1
+                    result = await self.flight_service._search_single_flight(
+                        session, self.origin, destination, date_info["api"], self.promo_code
+                    )
+                    if result is None:
+                        self.stats["upstream_failed"] += 1
+                    else:
+                        fresh[destination].append(result)
+                        fares[destination].append(FareDay.from_api(result))
+                except Exception as e:
+                    self.stats["upstream_failed"] += 1
+                    logger.error(f"Anywhere unit {self.origin}->{destination} {date_info['api']} failed: {e}")
+                finally:
+                    remaining[destination] -= 1
+                    if remaining[destination] == 0:
+                        done.put_nowait(destination)
+                    queue.task_done()
+
+        async def watch_cancellation():
+            while True:
+                await asyncio.sleep(0.5)
+                if await self.is_cancelled():
+                    self.cancelled = True
+                    logger.info(f"🛑 Anywhere search {self.origin} cancelled by client")
+                    done.put_nowait(None)
+                    return
+
+        tasks = [asyncio.create_task(worker()) for _ in range(min(self.workers, max(queue.qsize(), 1)))]
+        if self.is_cancelled:
+            tasks.append(asyncio.create_task(watch_cancellation()))
+
+        try:
+            for destination in ready:
+                self._mark_first_result(started)
+                yield destination, [], cached_best.get(destination)
+
+            pending = len(self.destinations) - len(ready)
+            while pending:
+                destination = await done.get()
+                if destination is None:
+                    break
+                pending -= 1
+
+                raw_days = fresh.pop(destination)
+                fare_days = fares.pop(destination)
+                if raw_days:
+                    await self.flight_service._cache_flights_batch(
+                        self.origin, destination, raw_days, self.promo_code, fares=fare_days
+                    )
+                del raw_days
+                self._mark_first_result(started)
+                yield destination, fare_days, cached_best.get(destination)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            self.stats["upstream_blocked"] = upstream_limiter.stats["responses_blocked"] - blocked_before
+            self.stats["elapsed"] = round(time.monotonic() - started, 3)
+            logger.info(f"📊 Anywhere {self.origin} scheduler stats: {self.stats}")
+
+    def _mark_first_result(self, started: float):
+        if self.stats["time_to_first_result"] is None:
+            self.stats["time_to_first_result"] = round(time.monotonic() - started, 3)
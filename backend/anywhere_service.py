@@ -1,19 +1,26 @@
 import asyncio
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 
 import aiohttp
-from flight_service import FlightService
-from sqlalchemy.orm import Session
+from anywhere_scheduler import AnywhereScheduler
+from anywhere_stats import AnywherePriceStats
+from cache_key import parse_flight_date
+from city_catalog import city_catalog
+from fare_model import FareDay
+from flight_service import FlightService, find_min_price_in_day
+from rate_limiter import Priority
+from sqlalchemy.ext.asyncio import AsyncSession
 
 logger = logging.getLogger(__name__)
 
 
 class AnywhereService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
-        self.flight_service = FlightService(db)
+        self.flight_service = FlightService(db, priority=Priority.ANYWHERE)
+        self.last_stats: Dict = {}
 
     async def search_anywhere(
         self,
@@ -21,69 +28,108 @@ class AnywhereService:
         months_ahead: int = 1,
         promo_code: str = None,
         max_price: float = None,
+        is_cancelled: Optional[Callable[[], Awaitable[bool]]] = None,
     ) -> List[Dict]:
         """ПОИСК КУДА УГОДНО - ПОЛНАЯ МОЩЬ БЕЗ КОМПРОМИССОВ"""
+        async for event in self.iter_anywhere_events(origin, months_ahead, promo_code, max_price, is_cancelled):
+            if event["event"] == "error":
+                return [{"error": event["error"]}]
+            if event["event"] == "summary":
+                return event["cheapest_flights"]
+        return []
+
+    async def iter_anywhere_events(
+        self,
+        origin: str,
+        months_ahead: int = 1,
+        promo_code: str = None,
+        max_price: float = None,
+        is_cancelled: Optional[Callable[[], Awaitable[bool]]] = None,
+    ) -> AsyncIterator[Dict]:
+        """Поиск "Куда угодно" потоком событий: started, destination, progress, summary (или error)"""
         from city_service import CityService
 
         logger.info(f"🚀 ЗАПУСК ПОЛНОГО ПОИСКА КУДА УГОДНО: {origin}, {months_ahead} месяцев")
 
         # 1. Проверяем что город активный
-        city_service = CityService(self.db)
+        city_service = CityService(self.db, priority=Priority.ANYWHERE)
         has_flights = await city_service._check_city_has_flights(origin)
 
         if not has_flights:
-            return [{"error": f"Из города {origin} нет рейсов Победы"}]
+            yield {"event": "error", "error": f"Из города {origin} нет рейсов Победы"}
+            return
 
         # 2. Получаем ВСЕ доступные направления
         available_destinations = await city_service.get_available_destinations_from_api(origin)
 
         if not available_destinations:
-            return [{"error": f"Нет доступных направлений из города {origin}"}]
+            yield {"event": "error", "error": f"Нет доступных направлений из города {origin}"}
+            return
 
         logger.info(f"🎯 Найдено {len(available_destinations)} направлений из {origin}")
 
         # 3. Берем ВСЕ направления без исключений
-        destination_codes = [dest["codeEn"] for dest in available_destinations if dest.get("codeEn")]
+        destination_codes = list(dict.fromkeys(dest["codeEn"] for dest in available_destinations if dest.get("codeEn")))
 
         logger.info(f"🔥 Запускаем поиск по ВСЕМ {len(destination_codes)} направлениям на {months_ahead} месяцев")
 
-        # 4. Полномасштабный поиск по ВСЕМ направлениям
-        all_cheapest_flights = []
+        # Названия городов берем из справочника в памяти, без запроса на каждое направление
+        await city_catalog.ensure_loaded(self.db)
 
-        # Прогресс-бар в логах
+        # 4. Полномасштабный поиск через общую ограниченную очередь (направление, дата)
+        all_cheapest_flights = []
+        # Цены дней всех направлений для итоговой агрегации на NumPy: направление, дата, цена
+        price_rows: Tuple[List[str], List[date], List[float]] = ([], [], [])
+        day_fare_families: Dict[Tuple[str, date], Optional[str]] = {}
         total_destinations = len(destination_codes)
         processed = 0
 
-        async def process_destination_with_progress(destination):
-            nonlocal processed
+        scheduler = AnywhereScheduler(
+            self.flight_service,
+            origin,
+            destination_codes,
+            self._generate_full_dates(months_ahead),
+            promo_code,
+            is_cancelled=is_cancelled,
+        )
+        self.last_stats = scheduler.stats
+
+        yield {"event": "started", "origin": origin, "total_destinations": total_destinations}
+        logger.info("⏳ Начинаем полномасштабный поиск... Это может занять несколько минут")
+
+        # 5. Отдаем результаты по мере готовности направлений
+        async for destination, flights_data, cached_best in scheduler.run():
             result = await self._find_cheapest_flight_full_power(
-                origin, destination, months_ahead, promo_code, max_price
+                origin,
+                destination,
+                months_ahead,
+                promo_code,
+                max_price,
+                flights_data=flights_data,
+                cached_best=cached_best,
             )
             processed += 1
-            if processed % 5 == 0:  # Логируем каждые 5 направлений
-                logger.info(f"📊 Прогресс: {processed}/{total_destinations} ({processed/total_destinations*100:.1f}%)")
-            return result
-
-        # Запускаем ВСЕ задачи одновременно - пользователь ждет и получает ВСЕ!
-        tasks = [process_destination_with_progress(destination) for destination in destination_codes]
-
-        logger.info("⏳ Начинаем полномасштабный поиск... Это может занять несколько минут")
 
-        # Ждем завершения ВСЕХ задач - никаких ограничений!
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-
-        # 5. Собираем и сортируем результаты
-        for result in results:
-            if isinstance(result, Exception):
-                logger.error(f"Ошибка поиска: {result}")
-            elif result:
+            if result:
                 all_cheapest_flights.append(result)
+                self._collect_prices(price_rows, day_fare_families, destination, flights_data, cached_best)
+                yield {"event": "destination", "data": result}
+
+            yield {"event": "progress", "processed": processed, "total_destinations": total_destinations}
+            if processed % 5 == 0:  # Логируем каждые 5 направлений
+                logger.info(f"📊 Прогресс: {processed}/{total_destinations} ({processed/total_destinations*100:.1f}%)")
 
-        # Сортируем по цене
-        all_cheapest_flights.sort(key=lambda x: x.get("min_price", float("inf")))
+        # Минимум по направлению и сортировка по цене - одним векторным проходом
+        all_cheapest_flights = self._rank_destinations(all_cheapest_flights, price_rows, day_fare_families, max_price)
 
         logger.info(f"✅ ПОИСК ЗАВЕРШЕН! Найдено {len(all_cheapest_flights)} направлений с ценами")
-        return all_cheapest_flights
+        yield {
+            "event": "summary",
+            "total_destinations_found": len(all_cheapest_flights),
+            "cheapest_flights": all_cheapest_flights,
+            "cancelled": scheduler.cancelled,
+            "search_stats": scheduler.stats,
+        }
 
     async def _find_cheapest_flight_full_power(
         self,
@@ -92,35 +138,56 @@ class AnywhereService:
         months_ahead: int = 1,
         promo_code: str = None,
         max_price: float = None,
+        flights_data: Optional[List[FareDay]] = None,
+        cached_best: Optional[Dict] = None,
     ) -> Optional[Dict]:
-        """ПОЛНОМАСШТАБНЫЙ поиск - ВСЕ даты на ВСЕ месяцы"""
-        try:
-            # Генерируем ВСЕ даты на указанный период
-            dates = self._generate_full_dates(months_ahead)
-            logger.debug(f"Поиск {origin}->{destination}: {len(dates)} дней")
-
-            # Используем полную версию поиска
-            flights_data = await self.flight_service.search_flights_period(
-                origin, destination, months_ahead, promo_code
-            )
+        """ПОЛНОМАСШТАБНЫЙ поиск - ВСЕ даты на ВСЕ месяцы (или по уже собранным данным).
 
-            if not flights_data:
+        cached_best - минимум по кешированным дням из FlightService.get_cheapest_per_destination,
+        flights_data - только дни, полученные из API Победы, уже разобранные в FareDay.
+        """
+        try:
+            if flights_data is None:
+                # Генерируем ВСЕ даты на указанный период
+                dates = self._generate_full_dates(months_ahead)
+                logger.debug(f"Поиск {origin}->{destination}: {len(dates)} дней")
+
+                # Используем полную версию поиска
+                flights_data = [
+                    FareDay.from_api(day_data)
+                    for day_data in await self.flight_service.search_flights_period(
+                        origin, destination, months_ahead, promo_code
+                    )
+                ]
+
+            if not flights_data and not cached_best:
                 return None
 
-            # Ищем абсолютный минимум за ВЕСЬ период
+            # Ищем абсолютный минимум за ВЕСЬ период: сначала агрегат из кеша, потом свежие дни
             min_price = float("inf")
             cheapest_date = None
+            fare_family = None
+            total_days_searched = len(flights_data)
             total_days_with_prices = 0
 
-            for day_data in flights_data:
-                if not day_data or "prices" not in day_data:
+            if cached_best:
+                total_days_searched += cached_best["days_cached"]
+                total_days_with_prices += cached_best["days_with_prices"]
+                if cached_best["min_price"] is not None:
+                    min_price = cached_best["min_price"]
+                    cheapest_date = cached_best["cheapest_date"]
+                    fare_family = cached_best["fare_family"]
+
+            for fare_day in flights_data:
+                day_min_price, _, day_fare_family = fare_day.cheapest()
+                if day_min_price is None:
                     continue
 
-                day_min_price = self._find_min_price_in_day(day_data)
-                if day_min_price and day_min_price < min_price:
+                total_days_with_prices += 1
+                if day_min_price < min_price:
                     min_price = day_min_price
-                    cheapest_date = day_data["date"]
-                    total_days_with_prices += 1
+                    cheapest_date = fare_day.date
+                    fare_family = day_fare_family
 
             if min_price == float("inf"):
                 return None
@@ -129,10 +196,8 @@ class AnywhereService:
             if max_price and min_price > max_price:
                 return None
 
-            # Получаем ПОЛНУЮ информацию о городе назначения из БД
-            from models import City
-
-            dest_city = self.db.query(City).filter(City.code == destination).first()
+            # Получаем ПОЛНУЮ информацию о городе назначения из справочника в памяти
+            dest_city = city_catalog.get(destination)
 
             return {
                 "origin": origin,
@@ -143,8 +208,9 @@ class AnywhereService:
                 "destination_country_en": (dest_city.country_en if dest_city else None),  # ДОБАВЛЯЕМ СТРАНУ
                 "min_price": min_price,
                 "cheapest_date": cheapest_date,
+                "fare_family": fare_family,
                 "currency": "RUB",
-                "total_days_searched": len(flights_data),
+                "total_days_searched": total_days_searched,
                 "total_days_with_prices": total_days_with_prices,
                 "search_period_months": months_ahead,
                 "search_timestamp": datetime.utcnow().isoformat(),
@@ -154,6 +220,53 @@ class AnywhereService:
             logger.error(f"Ошибка поиска {origin}->{destination}: {e}")
             return None
 
+    @staticmethod
+    def _collect_prices(
+        price_rows: Tuple[List[str], List[date], List[float]],
+        day_fare_families: Dict[Tuple[str, date], Optional[str]],
+        destination: str,
+        flights_data: List[FareDay],
+        cached_best: Optional[Dict],
+    ):
+        """Добавить цены направления: минимум из кеша (день целиком там не нужен) и дни из API"""
+        destinations, flight_dates, prices = price_rows
+        days = []
+        if cached_best and cached_best["min_price"] is not None:
+            days.append((cached_best["cheapest_date"], cached_best["min_price"], cached_best["fare_family"]))
+        for fare_day in flights_data or []:
+            day_min_price, _, day_fare_family = fare_day.cheapest()
+            if day_min_price is not None:
+                days.append((fare_day.date, day_min_price, day_fare_family))
+
+        for flight_date, price, fare_family in days:
+            flight_date = parse_flight_date(flight_date)
+            destinations.append(destination)
+            flight_dates.append(flight_date)
+            prices.append(price)
+            day_fare_families[(destination, flight_date)] = fare_family
+
+    @staticmethod
+    def _rank_destinations(
+        results: List[Dict],
+        price_rows: Tuple[List[str], List[date], List[float]],
+        day_fare_families: Dict[Tuple[str, date], Optional[str]],
+        max_price: Optional[float],
+    ) -> List[Dict]:
+        """Итоговый список через AnywherePriceStats: минимум и его дата (самая ранняя
+        при равных ценах) по направлению, фильтр max_price, сортировка по цене"""
+        by_destination = {result["destination"]: result for result in results}
+        ranked = []
+        for row in AnywherePriceStats(*price_rows).filtered(max_price).per_destination():
+            result = by_destination.get(row["destination"])
+            if result is None:
+                continue
+            flight_date = parse_flight_date(row["cheapest_date"])
+            result["min_price"] = row["min_price"]
+            result["cheapest_date"] = flight_date.strftime("%d.%m.%Y")
+            result["fare_family"] = day_fare_families.get((row["destination"], flight_date), result["fare_family"])
+            ranked.append(result)
+        return ranked
+
     def _generate_full_dates(self, months_ahead: int) -> List[Dict]:
         """Генерируем ВСЕ даты на указанный период"""
         dates = []
@@ -170,14 +283,4 @@ class AnywhereService:
 
     def _find_min_price_in_day(self, day_data: Dict) -> Optional[float]:
         """Найти минимальную цену за день"""
-        if not day_data or "prices" not in day_data:
-            return None
-
-        min_price = float("inf")
-        for price_list in day_data["prices"]:
-            for prices in price_list.values():
-                for price_info in prices:
-                    price = float(price_info.get("price", float("inf")))
-                    if price < min_price:
-                        min_price = price
-        return min_price if min_price != float("inf") else None
+        return find_min_price_in_day(day_data)
@@ -0,0 +1,154 @@
+# anywhere_stats.py
+from datetime import date
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Границы ценовых диапазонов, руб.
+PRICE_BANDS = (2000, 3000, 4000, 5000, 7000, 10000, 15000)
+PERCENTILES = (10, 25, 50, 75, 90)
+WEEKDAYS = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+
+
+def _group_starts(sorted_keys: np.ndarray) -> np.ndarray:
+    """Индексы начала каждой группы в отсортированном массиве ключей"""
+    if not len(sorted_keys):
+        return np.empty(0, dtype=np.intp)
+    return np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+
+
+class AnywherePriceStats:
+    """Агрегаты цен по всем направлениям из города на NumPy.
+
+    Цены (направление, дата, цена) лежат в трех непрерывных массивах:
+    индекс направления (int32), дата (datetime64[D]) и цена (float64).
+    Минимум по направлению, перцентили, диапазоны цен, статистика по
+    дням недели и самые дешевые дни по месяцам считаются векторно,
+    без обхода словарей в Python.
+    """
+
+    def __init__(self, destinations: Sequence[str], flight_dates: Sequence[date], prices: Sequence[float]):
+        codes, destination_index = np.unique(np.asarray(destinations, dtype=object), return_inverse=True)
+        self.destination_codes: List[str] = [str(code) for code in codes]
+        self.destination_index = destination_index.astype(np.int32)
+        self.flight_dates = np.asarray(flight_dates, dtype="datetime64[D]")
+        self.prices = np.asarray(prices, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def filtered(self, max_price: Optional[float]) -> "AnywherePriceStats":
+        """Только цены не дороже max_price"""
+        if max_price is None:
+            return self
+        mask = self.prices <= max_price
+        stats = AnywherePriceStats.__new__(AnywherePriceStats)
+        stats.destination_codes = self.destination_codes
+        stats.destination_index = self.destination_index[mask]
+        stats.flight_dates = self.flight_dates[mask]
+        stats.prices = self.prices[mask]
+        return stats
+
+    def per_destination(self) -> List[Dict]:
+        """Минимум, дата минимума (самая ранняя при равных ценах), средняя цена и число дней по направлению"""
+        order = np.lexsort((self.flight_dates, self.prices, self.destination_index))
+        sorted_destinations = self.destination_index[order]
+        starts = _group_starts(sorted_destinations)
+        counts = np.diff(np.r_[starts, len(order)])
+        means = np.add.reduceat(self.prices[order], starts) / counts if len(starts) else np.empty(0)
+
+        cheapest = order[starts]
+        result = [
+            {
+                "destination": self.destination_codes[destination],
+                "min_price": float(price),
+                "cheapest_date": str(flight_date),
+                "avg_price": round(float(mean), 2),
+                "days_with_prices": int(count),
+            }
+            for destination, price, flight_date, mean, count in zip(
+                sorted_destinations[starts], self.prices[cheapest], self.flight_dates[cheapest], means, counts
+            )
+        ]
+        result.sort(key=lambda row: row["min_price"])
+        return result
+
+    def percentiles(self, percentiles: Sequence[int] = PERCENTILES) -> Dict[str, Optional[float]]:
+        if not len(self.prices):
+            return {f"p{q}": None for q in percentiles}
+        values = np.percentile(self.prices, percentiles)
+        return {f"p{q}": round(float(value), 2) for q, value in zip(percentiles, values)}
+
+    def price_bands(self, edges: Sequence[float] = PRICE_BANDS) -> List[Dict]:
+        """Сколько дней и направлений (по их минимуму) попадает в каждый диапазон цен"""
+        edges = np.asarray(edges, dtype=np.float64)
+        day_counts = np.bincount(np.searchsorted(edges, self.prices, side="right"), minlength=len(edges) + 1)
+
+        destination_min = np.full(len(self.destination_codes), np.inf)
+        np.minimum.at(destination_min, self.destination_index, self.prices)
+        destination_min = destination_min[np.isfinite(destination_min)]
+        destination_counts = np.bincount(
+            np.searchsorted(edges, destination_min, side="right"), minlength=len(edges) + 1
+        )
+
+        lower = np.r_[0.0, edges]
+        upper = np.r_[edges, np.inf]
+        return [
+            {
+                "from": float(low),
+                "to": float(high) if np.isfinite(high) else None,
+                "days": int(days),
+                "destinations": int(destinations),
+            }
+            for low, high, days, destinations in zip(lower, upper, day_counts, destination_counts)
+        ]
+
+    def weekday_stats(self) -> List[Dict]:
+        """Минимальная и средняя цена по дню недели вылета"""
+        # 1970-01-01 - четверг, сдвигаем так, чтобы понедельник был 0
+        weekdays = (self.flight_dates.astype(np.int64) + 3) % 7
+        counts = np.bincount(weekdays, minlength=7)
+        sums = np.bincount(weekdays, weights=self.prices, minlength=7)
+        minimums = np.full(7, np.inf)
+        np.minimum.at(minimums, weekdays, self.prices)
+
+        return [
+            {
+                "weekday": WEEKDAYS[day],
+                "days": int(counts[day]),
+                "min_price": float(minimums[day]) if counts[day] else None,
+                "avg_price": round(float(sums[day] / counts[day]), 2) if counts[day] else None,
+            }
+            for day in range(7)
+        ]
+
+    def monthly_cheapest(self) -> List[Dict]:
+        """Самый дешевый вылет в каждом месяце"""
+        months = self.flight_dates.astype("datetime64[M]")
+        order = np.lexsort((self.flight_dates, self.prices, months))
+        starts = _group_starts(months[order])
+        cheapest = order[starts]
+        return [
+            {
+                "month": str(month),
+                "destination": self.destination_codes[destination],
+                "flight_date": str(flight_date),
+                "min_price": float(price),
+            }
+            for month, destination, flight_date, price in zip(
+                months[cheapest], self.destination_index[cheapest], self.flight_dates[cheapest], self.prices[cheapest]
+            )
+        ]
+
+    def summary(self, top: int = 20) -> Dict:
+        destinations = self.per_destination()
+        return {
+            "prices_count": len(self),
+            "destinations_count": len(destinations),
+            "min_price": float(self.prices.min()) if len(self) else None,
+            "percentiles": self.percentiles(),
+            "price_bands": self.price_bands(),
+            "weekdays": self.weekday_stats(),
+            "monthly_cheapest": self.monthly_cheapest(),
+            "top_destinations": destinations[:top],
+        }
@@ -1,30 +1,48 @@
 import asyncio
-import json
 import logging
+import socket
 import subprocess
 import threading
 import time
 from contextlib import asynccontextmanager
-from datetime import datetime
+from datetime import date, datetime, timedelta, timezone
 from typing import Dict, List
 
+import json_codec
 import redis
 import uvicorn
-from fastapi import BackgroundTasks, Depends, FastAPI, HTTPException, Query
+from cache_key import parse_flight_date
+from city_catalog import city_catalog
+from event_bus import event_bus
+from fastapi import BackgroundTasks, Depends, FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse
+from flight_cache import flight_cache
 from flight_service import FlightService
-from kafka import KafkaConsumer, KafkaProducer
-from sqlalchemy.orm import Session
+from http_client import pobeda_http
+from json_codec import FastJSONResponse
+from logging_config import log_pipeline
+from rate_limiter import Priority, upstream_limiter
+from retry_queue import retry_queue
+from route_demand import route_demand
+from singleflight import flight_singleflight
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from stale_refresher import stale_refresher
+from startup import StartupProfile, wait_for_dependency
 
 logger = logging.getLogger(__name__)
 
 from config import settings
-from database import create_tables, get_db
+
+# Логи пишутся через очередь в отдельном потоке - ни консоль, ни ELK не блокируют event loop
+log_pipeline.setup()
+from database import AsyncSessionLocal, async_engine, create_tables, get_async_db
 
 # Глобальные клиенты (инициализируются в lifespan)
 redis_client = None
-kafka_producer = None
-KAFKA_ENABLED = False
+startup_profile = None
 
 
 def start_kafka_services():
@@ -46,10 +64,21 @@ def start_kafka_services():
             logger.error(f"❌ Failed to start Zookeeper: {e}")
             return None
 
+    def zookeeper_up() -> bool:
+        try:
+            with socket.create_connection(("localhost", 2181), timeout=1):
+                return True
+        except OSError:
+            return False
+
     def run_kafka():
         try:
-            # Ждем немного чтобы Zookeeper запустился
-            time.sleep(10)
+            # Kafka стартует, как только Zookeeper принимает соединения (не дольше 30 секунд)
+            deadline = time.monotonic() + 30
+            delay = 0.1
+            while not zookeeper_up() and time.monotonic() < deadline:
+                time.sleep(delay)
+                delay = min(delay * 2, 2.0)
             process = subprocess.Popen(
                 ["/kafka/bin/kafka-server-start.sh", "/kafka/config/server.properties"],
                 stdout=subprocess.PIPE,
@@ -62,8 +91,6 @@ def start_kafka_services():
             return None
 
     # Запускаем в отдельных потоках
-    import threading
-
     zk_thread = threading.Thread(target=run_zookeeper, daemon=True)
     kafka_thread = threading.Thread(target=run_kafka, daemon=True)
 
@@ -73,62 +100,101 @@ def start_kafka_services():
     logger.info("🚀 Kafka services starting in background threads...")
 
 
-async def init_redis():
-    """Инициализация Redis с повторными попытками"""
+async def init_database() -> bool:
+    """Postgres: дождаться соединения и создать таблицы"""
+
+    async def probe() -> bool:
+        async with async_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        return True
+
+    if not await wait_for_dependency("Postgres", probe, settings.STARTUP_DATABASE_TIMEOUT_SECONDS):
+        return False
+    await asyncio.to_thread(create_tables)
+    logger.info("✅ Database tables created")
+    return True
+
+
+def _new_redis_client() -> redis.Redis:
+    return redis.Redis(host="redis", port=6379, decode_responses=True, socket_connect_timeout=2)
+
+
+async def init_redis() -> bool:
+    """Redis необязателен: не ответил за STARTUP_REDIS_TIMEOUT_SECONDS - работаем без него"""
     global redis_client
-    max_retries = 5
-    for i in range(max_retries):
-        try:
-            redis_client = redis.Redis(host="redis", port=6379, decode_responses=True, socket_connect_timeout=5)
-            redis_client.ping()
-            logger.info("✅ Redis connected successfully")
-            return True
-        except Exception as e:
-            logger.warning(f"Redis connection attempt {i+1}/{max_retries} failed: {e}")
-            if i < max_retries - 1:
-                await asyncio.sleep(2)
+    client = _new_redis_client()
 
-    logger.error("❌ Redis connection failed after all retries")
+    async def probe() -> bool:
+        return await asyncio.to_thread(client.ping)
+
+    if await wait_for_dependency("Redis", probe, settings.STARTUP_REDIS_TIMEOUT_SECONDS):
+        redis_client = client
+        logger.info("✅ Redis connected successfully")
+        return True
+
+    logger.error("❌ Redis connection failed, running without Redis")
     return False
 
 
+def attach_redis_clients(client: redis.Redis):
+    """Подключить Redis ко всем компонентам, которые умеют работать через него"""
+    from background_service import price_updater
+
+    if settings.UPSTREAM_REDIS_COORDINATION:
+        upstream_limiter.attach_redis(client)
+    if settings.SINGLEFLIGHT_REDIS:
+        flight_singleflight.attach_redis(client)
+    if settings.FLIGHT_CACHE_REDIS:
+        flight_cache.attach_redis(client)
+    city_catalog.attach_redis(client)
+    route_demand.attach_redis(client)
+    price_updater.attach_redis(client)
+
+
+async def reconnect_redis():
+    """Redis не успел к запуску - проверяем в фоне и подключаем, как только ответит (как Kafka)"""
+    global redis_client
+    client = _new_redis_client()
+
+    async def probe() -> bool:
+        return await asyncio.to_thread(client.ping)
+
+    while not await wait_for_dependency(
+        "Redis", probe, settings.REDIS_RECONNECT_TIMEOUT_SECONDS, initial_delay=1.0, max_delay=30.0
+    ):
+        pass
+
+    redis_client = client
+    attach_redis_clients(client)
+    # Подписка на инвалидации справочника; при подписке он сверится с общей версией
+    listener_task = asyncio.create_task(city_catalog.listen_invalidations(AsyncSessionLocal))
+    background_tasks.add(listener_task)
+    listener_task.add_done_callback(background_tasks.discard)
+    logger.info("✅ Redis connected after startup")
+
+
 async def init_kafka():
-    """Инициализация Kafka с повторными попытками"""
-    global kafka_producer, KAFKA_ENABLED
-    max_retries = 5
-    for i in range(max_retries):
-        try:
-            kafka_producer = KafkaProducer(
-                bootstrap_servers=["localhost:9092"],  # ← ИЗМЕНИТЬ С 'kafka:9092' на 'localhost:9092'
-                value_serializer=lambda v: json.dumps(v).encode("utf-8"),
-                retries=3,
-                request_timeout_ms=10000,
-            )
-            # Тестовый запрос для проверки подключения
-            kafka_producer.send("health-check", {"status": "test"})
-            KAFKA_ENABLED = True
-            logger.info("✅ Kafka connected successfully")
-            return True
-        except Exception as e:
-            logger.warning(f"Kafka connection attempt {i+1}/{max_retries} failed: {e}")
-            if i < max_retries - 1:
-                await asyncio.sleep(3)
+    """Подключение к Kafka в фоне: готовность пода его не ждет, события до подключения копятся в шине"""
 
-    logger.warning("❌ Kafka connection failed, running without Kafka")
-    KAFKA_ENABLED = False
-    return False
+    async def probe() -> bool:
+        return await asyncio.to_thread(event_bus.connect)
+
+    connected = await wait_for_dependency(
+        "Kafka", probe, settings.KAFKA_CONNECT_TIMEOUT_SECONDS, initial_delay=1.0, max_delay=10.0
+    )
+    if not connected:
+        # Шина сама переподключится позже, до этого события копятся в файле
+        logger.warning("❌ Kafka connection failed, events go to the local spool")
 
 
 def send_kafka_event(topic: str, event_data: dict):
-    """Безопасная отправка событий в Kafka"""
-    if KAFKA_ENABLED and kafka_producer:
-        try:
-            event_data["timestamp"] = datetime.utcnow().isoformat()
-            event_data["service"] = "pobeda-backend"
-            kafka_producer.send(topic, event_data)
-            logger.info(f"📨 Sent event to {topic}: {event_data.get('event_type', 'unknown')}")
-        except Exception as e:
-            logger.error(f"Failed to send Kafka event to {topic}: {e}")
+    """Поставить событие в очередь на отправку в Kafka - без ожидания брокера"""
+    if not settings.KAFKA_ENABLED:
+        return
+    event_data["timestamp"] = datetime.utcnow().isoformat()
+    event_data["service"] = "pobeda-backend"
+    if event_bus.publish(topic, event_data):
+        logger.debug(f"📨 Queued event to {topic}: {event_data.get('event_type', 'unknown')}")
 
 
 # Фоновые задачи
@@ -136,29 +202,26 @@ background_tasks = set()
 
 
 async def background_price_updater():
-    """Фоновая задача для обновления цен"""
+    """Фоновая задача: обновление кеша по спросу пользователей"""
+    from background_service import price_updater
+
     while True:
         try:
-            from background_service import BackgroundPriceUpdater
-            from database import SessionLocal
-
-            db = SessionLocal()
-            updater = BackgroundPriceUpdater(db)
-
-            logger.info("🚀 Starting background price update...")
-            updated_count = await updater.update_all_popular_routes()
+            logger.info("🚀 Starting background price refresh pass...")
+            report = await price_updater.refresh_hot_routes()
 
             # Отправляем событие в Kafka
             send_kafka_event(
                 "background-jobs",
                 {
                     "event_type": "price_update_completed",
-                    "routes_updated": updated_count,
+                    "routes_updated": report.get("routes_refreshed", 0),
+                    "days_refreshed": report.get("refreshed_days", 0),
+                    "demand_weighted_warm_ratio": report.get("demand_weighted_warm_ratio"),
                 },
             )
 
-            logger.info(f"✅ Background update finished: {updated_count} routes updated")
-            db.close()
+            logger.info(f"✅ Background refresh finished: {report.get('refreshed_days', 0)} days refreshed")
 
         except Exception as e:
             logger.error(f"Error in background price updater: {e}")
@@ -171,7 +234,7 @@ async def background_price_updater():
                 },
             )
 
-        await asyncio.sleep(60 * 60)  # 1 hour
+        await asyncio.sleep(settings.REFRESH_INTERVAL_SECONDS)
 
 
 async def background_cities_updater():
@@ -179,13 +242,13 @@ async def background_cities_updater():
     while True:
         try:
             from city_service import CityService
-            from database import SessionLocal
+            from database import AsyncSessionLocal
 
-            db = SessionLocal()
-            city_service = CityService(db)
+            async with AsyncSessionLocal() as db:
+                city_service = CityService(db, priority=Priority.BACKGROUND)
 
-            logger.info("🚀 Starting background cities update...")
-            updated_count = await city_service.update_active_cities_in_db()
+                logger.info("🚀 Starting background cities update...")
+                updated_count = await city_service.update_active_cities_in_db()
 
             send_kafka_event(
                 "background-jobs",
@@ -196,7 +259,6 @@ async def background_cities_updater():
             )
 
             logger.info(f"✅ Background cities update finished: {updated_count} active cities")
-            db.close()
 
         except Exception as e:
             logger.error(f"Error in background cities updater: {e}")
@@ -212,37 +274,82 @@ async def background_cities_updater():
         await asyncio.sleep(24 * 60 * 60)  # 24 hours
 
 
+async def background_price_history_maintenance():
+    """Фоновая задача: секции, прореживание и очистка истории цен"""
+    from database import AsyncSessionLocal
+    from price_history import PriceHistoryService
+
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                report = await PriceHistoryService(db).run_maintenance()
+
+            send_kafka_event("background-jobs", {"event_type": "price_history_maintenance", **report})
+
+        except Exception as e:
+            logger.error(f"Error in price history maintenance: {e}")
+            send_kafka_event(
+                "error-logs",
+                {
+                    "event_type": "background_job_error",
+                    "job": "price_history_maintenance",
+                    "error": str(e),
+                },
+            )
+
+        await asyncio.sleep(24 * 60 * 60)  # 24 hours
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    logger.info("🚀 Starting Pobeda Parser API with Embedded Kafka...")
-
-    # ✅ ДОБАВЬТЕ ЭТИ 4 СТРОЧКИ:
-    # Запускаем Kafka сервисы
-    start_kafka_services()
-
-    # Ждем немного перед инициализацией Kafka клиента
-    await asyncio.sleep(25)
-    # ✅ КОНЕЦ ДОБАВЛЕНИЯ
+    global startup_profile
+    startup_profile = StartupProfile()
+    logger.info("🚀 Starting Pobeda Parser API...")
+
+    # Kafka не нужна для готовности: шина копит события, подключение - в фоне
+    if settings.KAFKA_ENABLED:
+        if settings.KAFKA_EMBEDDED:
+            start_kafka_services()
+        event_bus.start()
+        kafka_task = asyncio.create_task(init_kafka())
+        background_tasks.add(kafka_task)
+        kafka_task.add_done_callback(background_tasks.discard)
+
+    # Postgres, Redis и пул HTTP к API Победы - одновременно
+    database_ok, redis_ok, _ = await asyncio.gather(
+        startup_profile.timed("database", init_database()),
+        startup_profile.timed("redis", init_redis()),
+        startup_profile.timed("http_pool", pobeda_http.start()),
+    )
+    if not database_ok:
+        raise RuntimeError("Postgres is not available")
 
-    create_tables()
-    logger.info("✅ Database tables created")
+    if redis_ok:
+        attach_redis_clients(redis_client)
+    else:
+        redis_task = asyncio.create_task(reconnect_redis())
+        background_tasks.add(redis_task)
+        redis_task.add_done_callback(background_tasks.discard)
 
-    # Инициализируем Redis и Kafka
-    redis_ok = await init_redis()
-    kafka_ok = await init_kafka()
+    # Справочник городов в памяти: валидация кодов и названия без запросов в БД
+    async with startup_profile.phase("city_catalog"):
+        async with AsyncSessionLocal() as db:
+            await city_catalog.refresh(db, publish=False)
 
     # Запускаем фоновые задачи
     price_task = asyncio.create_task(background_price_updater())
     cities_task = asyncio.create_task(background_cities_updater())
+    catalog_task = asyncio.create_task(city_catalog.listen_invalidations(AsyncSessionLocal))
+    retry_task = asyncio.create_task(retry_queue.run_worker())
+    history_task = asyncio.create_task(background_price_history_maintenance())
 
-    background_tasks.add(price_task)
-    background_tasks.add(cities_task)
-
-    price_task.add_done_callback(background_tasks.discard)
-    cities_task.add_done_callback(background_tasks.discard)
+    for task in (price_task, cities_task, catalog_task, retry_task, history_task):
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
 
     logger.info("✅ Background tasks started")
+    startup_profile.mark_ready()
 
     # Отправляем событие о старте приложения
     send_kafka_event(
@@ -250,26 +357,32 @@ async def lifespan(app: FastAPI):
         {
             "event_type": "app_started",
             "redis_connected": redis_ok,
-            "kafka_connected": kafka_ok,
+            "kafka_connected": event_bus.connected,
+            "startup": startup_profile.report(),
         },
     )
 
     yield
 
-    # Shutdown
+    # Shutdown (readiness к этому моменту уже 503: его переключает preStop через /health/drain)
+    startup_profile.mark_stopping()
     logger.info("🛑 Shutting down Pobeda Parser API...")
 
     for task in background_tasks:
         task.cancel()
     await asyncio.gather(*background_tasks, return_exceptions=True)
 
+    await stale_refresher.close()
+    await pobeda_http.close()
+    await async_engine.dispose()
+
     # Закрываем соединения
     if redis_client:
         redis_client.close()
-    if kafka_producer:
-        kafka_producer.close()
+    await asyncio.to_thread(event_bus.close)
 
     logger.info("✅ Pobeda Parser API stopped")
+    log_pipeline.stop()
 
 
 app = FastAPI(
@@ -279,6 +392,7 @@ app = FastAPI(
     docs_url="/docs",
     redoc_url="/redoc",
     openapi_url="/openapi.json",
+    default_response_class=FastJSONResponse,
     lifespan=lifespan,
 )
 
@@ -292,6 +406,28 @@ app.add_middleware(
 )
 
 
+class StreamAwareGZipMiddleware(GZipMiddleware):
+    """gzip для всех ответов, кроме потоковых маршрутов: сжатие копит поток в буфере
+
+    SSE Starlette пропускает сам (text/event-stream), NDJSON - нет, поэтому
+    потоковые пути исключаются явно.
+    """
+
+    def __init__(self, app, exclude_paths=(), **kwargs):
+        super().__init__(app, **kwargs)
+        self.exclude_paths = frozenset(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+# Сжатие ответов больше 1 КБ
+app.add_middleware(StreamAwareGZipMiddleware, minimum_size=1000, exclude_paths=("/flights/anywhere/stream",))
+
+
 # Health check с проверкой всех сервисов
 @app.get("/")
 async def health_check():
@@ -309,12 +445,106 @@ async def health_check():
         "status": "healthy",
         "services": {
             "redis": redis_status,
-            "kafka": "enabled" if KAFKA_ENABLED else "disabled",
+            "kafka": "enabled" if event_bus.connected else "disabled",
         },
         "timestamp": datetime.utcnow().isoformat(),
     }
 
 
+@app.get("/health/live", summary="Liveness: процесс жив")
+async def liveness():
+    """Не проверяет зависимости: перезапуск пода не поможет, если лежит Postgres"""
+    return {"status": "alive"}
+
+
+@app.post("/health/drain", summary="Снять под с балансировки перед остановкой")
+async def drain(request: Request):
+    """Вызывается из preStop пода: readiness сразу начинает отвечать 503, а preStop
+    ждет, пока балансировщик это заметит, и только потом под получает SIGTERM.
+    После SIGTERM uvicorn уже не принимает соединения, поэтому переключать
+    readiness из lifespan поздно. Доступен только с localhost."""
+    if request.client is None or request.client.host not in ("127.0.0.1", "::1"):
+        raise HTTPException(status_code=403, detail="drain доступен только изнутри пода")
+    if startup_profile:
+        startup_profile.mark_stopping()
+    logger.info("🛑 Draining: readiness now reports 503")
+    return {"status": "draining"}
+
+
+@app.get("/health/ready", summary="Readiness: под готов принимать трафик")
+async def readiness(response: Response):
+    """Запуск завершен и Postgres отвечает; Redis и Kafka необязательны и только показываются"""
+    checks = {"startup": bool(startup_profile and startup_profile.ready), "database": False}
+    if checks["startup"]:
+
+        async def ping_database():
+            async with async_engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+
+        try:
+            await asyncio.wait_for(ping_database(), timeout=2)
+            checks["database"] = True
+        except Exception as e:
+            logger.warning(f"Readiness: database check failed: {e}")
+
+    ready = all(checks.values())
+    if not ready:
+        response.status_code = 503
+    return {
+        "status": "ready" if ready else "not_ready",
+        "checks": checks,
+        "redis": redis_client is not None,
+        "kafka": event_bus.connected,
+        "startup": startup_profile.report() if startup_profile else None,
+    }
+
+
+@app.get("/stats/upstream", summary="Статистика соединений к API Победы")
+async def upstream_stats():
+    """Счетчики соединений и состояние общего лимитера запросов к ticket.flypobeda.ru"""
+    return {
+        "http_pool": pobeda_http.get_stats(),
+        "rate_limiter": upstream_limiter.get_stats(),
+        "singleflight": flight_singleflight.get_stats(),
+    }
+
+
+@app.get("/stats/events", summary="Статистика отправки событий в Kafka")
+async def events_stats():
+    """Очередь событий: отправлено, выброшено при переполнении, в файле, задержка до подтверждения брокера"""
+    return event_bus.get_stats()
+
+
+@app.get("/stats/logging", summary="Статистика очереди логов")
+async def logging_stats():
+    """Очередь логов: заполненность, выброшенные при переполнении записи, отправка в ELK"""
+    return log_pipeline.get_stats()
+
+
+@app.get("/stats/cache", summary="Статистика кеша рейсов")
+async def cache_stats():
+    """Доля попаданий по уровням кеша: память процесса, Redis, Postgres"""
+    from flight_service import cache_write_stats
+
+    return {
+        **flight_cache.get_stats(),
+        "stale_refresh": stale_refresher.get_stats(),
+        "writes": cache_write_stats,
+    }
+
+
+@app.get("/stats/refresh", summary="Фоновое обновление по спросу")
+async def refresh_stats():
+    """Горячие маршруты, доля прогретых дней и остаток часового бюджета запросов"""
+    from background_service import price_updater
+
+    return {
+        "demand": route_demand.get_stats(),
+        "last_pass": price_updater.last_report,
+        "budget_remaining": await price_updater.budget_remaining(),
+    }
+
+
 # Тестовые эндпоинты
 @app.get("/test-redis")
 async def test_redis():
@@ -353,7 +583,7 @@ async def test_redis():
 @app.get("/test-kafka")
 async def test_kafka():
     """Тест отправки сообщений в Kafka"""
-    if not KAFKA_ENABLED:
+    if not event_bus.connected:
         raise HTTPException(status_code=503, detail="Kafka not available")
 
     try:
@@ -399,7 +629,7 @@ async def cache_test():
 
 # Логирование
 @app.post("/api/logs/frontend", summary="Прием логов с фронтенда")
-async def receive_frontend_logs(log_data: dict, db: Session = Depends(get_db)):
+async def receive_frontend_logs(log_data: dict):
     """Принимает логи с фронтенда и отправляет в ELK"""
     try:
         # Логируем на бекенде
@@ -435,7 +665,7 @@ async def receive_backend_logs(log_data: dict):
 
 
 @app.get("/cities")
-async def get_cities(skip: int = 0, limit: int = 500, db: Session = Depends(get_db)):
+async def get_cities(skip: int = 0, limit: int = 500, db: AsyncSession = Depends(get_async_db)):
     """Получить список всех городов"""
     from city_service import CityService
     from models import City
@@ -446,7 +676,8 @@ async def get_cities(skip: int = 0, limit: int = 500, db: Session = Depends(get_
     await city_service.update_cities_from_api()
 
     # Получаем все города из БД
-    cities = db.query(City).offset(skip).limit(limit).all()
+    result = await db.execute(select(City).offset(skip).limit(limit))
+    cities = result.scalars().all()
 
     send_kafka_event(
         "api-requests",
@@ -468,12 +699,13 @@ async def get_cities(skip: int = 0, limit: int = 500, db: Session = Depends(get_
 async def get_active_cities(
     skip: int = Query(0, description="Количество пропущенных записей (для пагинации)"),
     limit: int = Query(500, description="Максимальное количество возвращаемых записей"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Получить список только АКТИВНЫХ городов (откуда есть рейсы)"""
     from models import City
 
-    cities = db.query(City).filter(City.is_active == True).offset(skip).limit(limit).all()
+    result = await db.execute(select(City).where(City.is_active == True).offset(skip).limit(limit))
+    cities = result.scalars().all()
 
     send_kafka_event(
         "api-requests",
@@ -485,7 +717,7 @@ async def get_active_cities(
     )
 
     return {
-        "total_active": db.query(City).filter(City.is_active == True).count(),
+        "total_active": await db.scalar(select(func.count()).select_from(City).where(City.is_active == True)),
         "cities": cities,
     }
 
@@ -502,15 +734,21 @@ async def search_flights(
     ),
     destination: str = Query(..., description="Код города назначения из активных городов"),
     promo_code: str = Query(None, description="Промокод для поиска (опционально)"),
-    db: Session = Depends(get_db),
+    view: str = Query(
+        "full",
+        pattern="^(summary|calendar|full)$",
+        description="full - ответ API целиком, summary - мин. цена и рейс по дням, calendar - только цены по датам",
+    ),
+    if_none_match: str = Header(None),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Поиск рейсов между городами на месяц вперед"""
-    from flight_service import FlightService
-    from models import City
+    from flight_service import FlightService, route_etag
 
-    # Проверяем что города активные
-    origin_city = db.query(City).filter(City.code == origin, City.is_active == True).first()
-    destination_city = db.query(City).filter(City.code == destination, City.is_active == True).first()
+    # Проверяем что города активные (справочник в памяти, без запроса в БД)
+    await city_catalog.ensure_loaded(db)
+    origin_city = city_catalog.get_active(origin)
+    destination_city = city_catalog.get_active(destination)
 
     if not origin_city:
         raise HTTPException(
@@ -534,8 +772,23 @@ async def search_flights(
         },
     )
 
+    # Популярность маршрута для фонового обновления (персональные промокоды не учитываем)
+    if not promo_code:
+        route_demand.record(origin, destination)
+
     flight_service = FlightService(db)
-    search_result = await flight_service.search_flights_month(origin, destination, promo_code)
+    keys = flight_service.cache_keys(origin, destination, flight_service._generate_month_dates(), promo_code)
+
+    # Клиент уже видел эту версию: все дни свежие в кеше и хеши цен не изменились
+    if if_none_match:
+        versions = await flight_service.get_route_versions(keys)
+        now = datetime.now(timezone.utc)
+        all_fresh = len(versions) == len(keys) and all(expires_at > now for _, expires_at in versions.values())
+        etag = route_etag(versions, keys, view)
+        if all_fresh and etag == if_none_match:
+            return Response(status_code=304, headers={"ETag": etag})
+
+    search_result = await flight_service.search_flights_month(origin, destination, promo_code, view=view)
 
     # Отправляем событие о завершении поиска
     send_kafka_event(
@@ -550,16 +803,118 @@ async def search_flights(
         },
     )
 
-    return {
+    body = {
         "origin": origin_city.name_ru,
         "destination": destination_city.name_ru,
         "promo_code": promo_code,
+        "view": view,
         "total_days_searched": search_result["total_days_searched"],
         "days_with_data": search_result["days_with_data"],
         "is_complete": search_result["is_complete"],
-        "has_retry_data": search_result["has_retry_data"],
-        "flights": search_result["flights"],
+        "retry_job_id": search_result["retry_job_id"],
+        "stale_days": search_result["stale_days"],
     }
+    if view == "calendar":
+        body["calendar"] = {
+            parse_flight_date(day["date"]).isoformat(): day.get("min_price") for day in search_result["flights"]
+        }
+    else:
+        body["flights"] = search_result["flights"]
+
+    headers = {"Cache-Control": "no-cache"}
+    # ETag только для полного ответа: пока даты дозагружаются, версия ответа не окончательная
+    if search_result["is_complete"]:
+        versions = await flight_service.get_route_versions(keys)
+        etag = route_etag(versions, keys, view)
+        headers["ETag"] = etag
+        if if_none_match == etag:
+            return Response(status_code=304, headers=headers)
+    return FastJSONResponse(body, headers=headers)
+
+
+@app.get("/flights/retry-jobs/{job_id}", summary="Статус дозагрузки дат после 403")
+async def get_retry_job(job_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Опрос задания из retry_job_id ответа /flights/search. Когда status=completed,
+    повторный /flights/search отдаст все даты из кеша."""
+    job = await retry_queue.get_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Задание '{job_id}' не найдено")
+    return job
+
+
+@app.get("/flights/retry-jobs/{job_id}/stream", summary="Подписка на статус дозагрузки (SSE)")
+async def stream_retry_job(job_id: str, request: Request):
+    """Server-Sent Events: событие progress при каждом изменении, в конце - done"""
+    from database import AsyncSessionLocal
+
+    async def event_stream():
+        last = None
+        while not await request.is_disconnected():
+            async with AsyncSessionLocal() as db:
+                job = await retry_queue.get_job(db, job_id)
+            if job is None:
+                yield f"event: error\ndata: {json_codec.dumps_str({'error': 'job not found'})}\n\n"
+                return
+            if job != last:
+                last = job
+                event = "progress" if job["status"] == "running" else "done"
+                yield f"event: {event}\ndata: {json_codec.dumps_str(job)}\n\n"
+                if event == "done":
+                    return
+            await asyncio.sleep(settings.RETRY_QUEUE_POLL_SECONDS)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+@app.get("/analytics/price-history", summary="История цен маршрута")
+async def get_price_history(
+    origin: str = Query(..., description="Код города отправления"),
+    destination: str = Query(..., description="Код города назначения"),
+    days_back: int = Query(365, ge=1, le=730, description="За сколько дней наблюдений (по умолчанию год)"),
+    flight_date_from: date = Query(None, description="Даты вылета с (YYYY-MM-DD, опционально)"),
+    flight_date_to: date = Query(None, description="Даты вылета по (YYYY-MM-DD, опционально)"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Изменения минимальной цены и цен по тарифам для графиков, в виде параллельных массивов"""
+    from price_history import PriceHistoryService
+
+    return FastJSONResponse(
+        await PriceHistoryService(db).get_history(origin, destination, days_back, flight_date_from, flight_date_to)
+    )
+
+
+@app.get("/calendar/month", summary="Календарь цен маршрута на месяц")
+async def get_fare_calendar_month(
+    origin: str = Query(..., description="Код города отправления"),
+    destination: str = Query(..., description="Код города назначения"),
+    month: str = Query(..., description="Месяц вылета, YYYY-MM"),
+    promo_code: str = Query(None, description="Промокод (опционально)"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Минимальная цена по каждому дню месяца из календаря, без запросов к API Победы.
+
+    Прошедшие дни и цены старше FLIGHT_CACHE_MAX_STALE_HOURS отдаются как null; updated_at - когда цена получена.
+    """
+    from fare_calendar import FareCalendarService
+
+    if not FareCalendarService.validate_month(month):
+        raise HTTPException(status_code=400, detail="month должен быть в формате YYYY-MM")
+    return FastJSONResponse(await FareCalendarService(db).month_grid(origin, destination, month, promo_code))
+
+
+@app.get("/calendar/month/anywhere", summary="Календарь цен всех направлений из города")
+async def get_fare_calendar_anywhere(
+    origin: str = Query(..., description="Код города отправления"),
+    month: str = Query(..., description="Месяц вылета, YYYY-MM"),
+    promo_code: str = Query(None, description="Промокод (опционально)"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Матрица цен [направление][день месяца] по всем направлениям из города (только свежие цены)"""
+    from fare_calendar import FareCalendarService
+
+    if not FareCalendarService.validate_month(month):
+        raise HTTPException(status_code=400, detail="month должен быть в формате YYYY-MM")
+    return FastJSONResponse(await FareCalendarService(db).month_all_destinations(origin, month, promo_code))
 
 
 @app.get(
@@ -568,6 +923,7 @@ async def search_flights(
     description="Ищет самые дешевые рейсы из указанного города во ВСЕ доступные направления на выбранный месяц",
 )
 async def search_anywhere(
+    request: Request,
     origin: str = Query(
         ...,
         description="Код города отправления (например: MOW, LED, AER). Получить коды городов: /cities/active",
@@ -575,7 +931,7 @@ async def search_anywhere(
     months_ahead: int = Query(1, description="На сколько месяцев вперед искать (1-6 месяцев, по умолчанию 1)"),
     promo_code: str = Query(None, description="Промокод для поиска (опционально)"),
     max_price: float = Query(None, description="Максимальная цена билета в рублях (опционально)"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Поиск самых дешевых рейсов из города в любые доступные направления"""
     from anywhere_service import AnywhereService
@@ -596,7 +952,14 @@ async def search_anywhere(
     )
 
     anywhere_service = AnywhereService(db)
-    results = await anywhere_service.search_anywhere(origin, months_ahead, promo_code, max_price)
+    # Если клиент отключился - прекращаем ходить в API Победы
+    results = await anywhere_service.search_anywhere(
+        origin, months_ahead, promo_code, max_price, is_cancelled=request.is_disconnected
+    )
+
+    # Найденные направления тоже горячие маршруты для фонового обновления
+    if not promo_code:
+        route_demand.record_anywhere(origin, [item["destination"] for item in results if "destination" in item])
 
     # Отправляем событие о завершении поиска
     send_kafka_event(
@@ -606,33 +969,145 @@ async def search_anywhere(
             "origin": origin,
             "destinations_found": len(results),
             "months_ahead": months_ahead,
+            "search_stats": anywhere_service.last_stats,
         },
     )
 
-    return {
-        "origin": origin,
-        "months_ahead": months_ahead,
-        "promo_code": promo_code,
-        "max_price": max_price,
-        "total_destinations_found": len(results),
-        "cheapest_flights": results,
-    }
+    # Готовый ответ на orjson - без прохода jsonable_encoder по всем направлениям
+    return FastJSONResponse(
+        {
+            "origin": origin,
+            "months_ahead": months_ahead,
+            "promo_code": promo_code,
+            "max_price": max_price,
+            "total_destinations_found": len(results),
+            "cheapest_flights": results,
+            "search_stats": anywhere_service.last_stats,
+        }
+    )
+
+
+@app.get(
+    "/flights/anywhere/stats",
+    summary="Статистика цен 'Куда угодно'",
+    description="Минимумы по направлениям, перцентили, ценовые диапазоны и дни недели по известным ценам из города",
+)
+async def anywhere_price_stats(
+    origin: str = Query(..., description="Код города отправления (например: MOW, LED, AER)"),
+    months_ahead: int = Query(1, ge=1, le=6, description="На сколько месяцев вперед (1-6)"),
+    promo_code: str = Query(None, description="Промокод (опционально)"),
+    max_price: float = Query(None, description="Учитывать только цены не дороже, руб. (опционально)"),
+    top: int = Query(20, ge=1, le=200, description="Сколько самых дешевых направлений вернуть"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Считается по календарю цен (fare_calendar) без запросов к API Победы"""
+    from anywhere_stats import AnywherePriceStats
+    from fare_calendar import FareCalendarService
+
+    date_from = date.today()
+    date_to = date_from + timedelta(days=30 * months_ahead)
+    destinations, flight_dates, prices = await FareCalendarService(db).price_rows(
+        origin, date_from, date_to, promo_code
+    )
+    stats = AnywherePriceStats(destinations, flight_dates, prices).filtered(max_price).summary(top=top)
+
+    await city_catalog.ensure_loaded(db)
+    for row in stats["top_destinations"]:
+        city = city_catalog.get(row["destination"])
+        row["destination_name_ru"] = city.name_ru if city else row["destination"]
+
+    return FastJSONResponse(
+        {
+            "origin": origin,
+            "date_from": date_from.isoformat(),
+            "date_to": date_to.isoformat(),
+            "promo_code": promo_code,
+            "max_price": max_price,
+            **stats,
+        }
+    )
+
+
+@app.get(
+    "/flights/anywhere/stream",
+    summary="Поиск 'Куда угодно' потоком",
+    description="То же, что /flights/anywhere, но направления приходят по мере готовности (NDJSON или SSE)",
+)
+async def search_anywhere_stream(
+    request: Request,
+    origin: str = Query(..., description="Код города отправления (например: MOW, LED, AER)"),
+    months_ahead: int = Query(1, description="На сколько месяцев вперед искать (1-6 месяцев, по умолчанию 1)"),
+    promo_code: str = Query(None, description="Промокод для поиска (опционально)"),
+    max_price: float = Query(None, description="Максимальная цена билета в рублях (опционально)"),
+    format: str = Query("ndjson", description="Формат потока: ndjson или sse"),
+):
+    """Потоковый поиск "Куда угодно": started, destination, progress и итоговый summary"""
+    from anywhere_service import AnywhereService
+    from database import AsyncSessionLocal
+
+    if months_ahead < 1 or months_ahead > 6:
+        raise HTTPException(status_code=400, detail="months_ahead должен быть от 1 до 6")
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format должен быть ndjson или sse")
+
+    send_kafka_event(
+        "anywhere-search",
+        {
+            "event_type": "anywhere_search_started",
+            "origin": origin,
+            "months_ahead": months_ahead,
+            "max_price": max_price,
+            "streaming": True,
+        },
+    )
+
+    async def event_stream():
+        # Своя сессия БД: поток живет дольше обработчика запроса
+        async with AsyncSessionLocal() as db:
+            anywhere_service = AnywhereService(db)
+            async for event in anywhere_service.iter_anywhere_events(
+                origin, months_ahead, promo_code, max_price, is_cancelled=request.is_disconnected
+            ):
+                if event["event"] == "summary" and not promo_code:
+                    route_demand.record_anywhere(origin, [item["destination"] for item in event["cheapest_flights"]])
+                payload = json_codec.dumps_str(event)
+                if format == "sse":
+                    yield f"event: {event['event']}\ndata: {payload}\n\n"
+                else:
+                    yield payload + "\n"
+
+            send_kafka_event(
+                "anywhere-search",
+                {
+                    "event_type": "anywhere_search_completed",
+                    "origin": origin,
+                    "months_ahead": months_ahead,
+                    "search_stats": anywhere_service.last_stats,
+                    "streaming": True,
+                },
+            )
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream" if format == "sse" else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 # Основные эндпоинты для городов
 @app.get("/cities/for-frontend", summary="Города для выбора на фронтенде")
-async def get_cities_for_frontend(db: Session = Depends(get_db)):
+async def get_cities_for_frontend(db: AsyncSession = Depends(get_async_db)):
     """Получить активные города в формате для фронтенда"""
     from city_service import CityService
 
     city_service = CityService(db)
-    cities = city_service.get_cities_for_frontend()
+    cities = await city_service.get_cities_for_frontend()
 
     return {"cities": cities, "total": len(cities)}
 
 
 @app.post("/admin/update-active-cities", summary="Обновить активные города")
-async def update_active_cities(db: Session = Depends(get_db)):
+async def update_active_cities(db: AsyncSession = Depends(get_async_db)):
     """Принудительное обновление списка активных городов"""
     from city_service import CityService
 
@@ -647,11 +1122,12 @@ async def update_active_cities(db: Session = Depends(get_db)):
 
 
 @app.get("/cities/active", summary="Активные города")
-async def get_active_cities(db: Session = Depends(get_db)):
+async def get_active_cities(db: AsyncSession = Depends(get_async_db)):
     """Получить список активных городов"""
     from models import City
 
-    cities = db.query(City).filter(City.is_active == True).all()
+    result = await db.execute(select(City).where(City.is_active == True))
+    cities = result.scalars().all()
     return {"total": len(cities), "cities": cities}
 
 
@@ -1,67 +1,233 @@
 # background_service.py
 import asyncio
 import logging
-from datetime import datetime
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
 
-from city_service import CityService
-from flight_service import FlightService
-from sqlalchemy.orm import Session
+from cache_key import CacheKey
+from config import settings
+from flight_service import FlightService, _parse_db_dates
+from rate_limiter import Priority
+from route_demand import route_demand
+from sqlalchemy import select, tuple_
 
 logger = logging.getLogger(__name__)
 
 
 class BackgroundPriceUpdater:
-    def __init__(self, db: Session):
-        self.db = db
-        self.city_service = CityService(db)
-        self.flight_service = FlightService(db)
+    """Фоновое обновление кеша по спросу.
 
-    async def update_all_popular_routes(self):
-        """Обновить цены на популярные маршруты"""
-        try:
-            from models import City
-
-            # Берем топ-10 популярных городов
-            popular_origins = [
-                "MOW",
-                "LED",
-                "SVX",
-                "KZN",
-                "AER",
-                "OVB",
-                "UFA",
-                "KRR",
-                "ROV",
-                "MRV",
-            ]
-
-            updated_routes = 0
-
-            for origin in popular_origins:
-                # Получаем доступные направления из каждого популярного города
-                destinations = await self.city_service.get_available_destinations_from_api(origin)
-                if not destinations:
-                    continue
-
-                # Берем первые 5 направлений из каждого города
-                destination_codes = [dest["codeEn"] for dest in destinations[:5] if dest.get("codeEn")]
-
-                for destination in destination_codes:
-                    try:
-                        # Обновляем цены на 1 месяц вперед
-                        await self.flight_service.search_flights_period(origin, destination, months_ahead=1)
-                        updated_routes += 1
-                        logger.info(f"Updated prices for {origin} -> {destination}")
-
-                        # Пауза чтобы не перегружать API
-                        await asyncio.sleep(2)
-
-                    except Exception as e:
-                        logger.error(f"Error updating {origin}->{destination}: {e}")
-
-            logger.info(f"Background update completed: {updated_routes} routes updated")
-            return updated_routes
+    Маршруты берутся из route_demand, а не из фиксированного списка.
+    Дни, которые уже истекли или скоро истекут, обновляются в порядке
+    популярность x срочность (чем меньше осталось до истечения, тем раньше),
+    но не больше REFRESH_UPSTREAM_BUDGET_PER_HOUR запросов к API Победы в час.
+
+    С Redis бюджет общий на все поды: счетчик на календарный час, поды
+    резервируют из него запросы перед походом в API. Без Redis каждый под
+    считает свой бюджет (скользящий час), и суммарный расход - число подов x бюджет.
+
+    Горячий набор у всех подов один и тот же, поэтому каждый день маршрута
+    перед обновлением захватывается (SET NX EX) - его обновляет и оплачивает
+    из бюджета только тот под, который успел первым.
+    """
+
+    REDIS_PREFIX = "pobeda:refresh_budget"
+    CLAIM_PREFIX = "pobeda:refresh_claim"
+
+    def __init__(self):
+        self._spent: deque = deque()  # моменты запросов к API за последний час
+        self._redis = None
+        self.last_report: Dict = {}
+
+    def attach_redis(self, redis_client):
+        """Делить часовой бюджет между подами"""
+        self._redis = redis_client
+
+    def _budget_key(self) -> str:
+        return f"{self.REDIS_PREFIX}:{int(time.time()) // 3600}"
+
+    def _local_remaining(self) -> int:
+        hour_ago = time.monotonic() - 3600
+        while self._spent and self._spent[0] < hour_ago:
+            self._spent.popleft()
+        return max(settings.REFRESH_UPSTREAM_BUDGET_PER_HOUR - len(self._spent), 0)
+
+    def _shared_remaining(self) -> int:
+        spent = self._redis.get(self._budget_key())
+        return max(settings.REFRESH_UPSTREAM_BUDGET_PER_HOUR - int(spent or 0), 0)
+
+    def _shared_reserve(self, count: int) -> int:
+        """Забрать до count запросов из общего бюджета часа; вернуть, сколько досталось"""
+        key = self._budget_key()
+        pipe = self._redis.pipeline()
+        pipe.incrby(key, count)
+        pipe.expire(key, 7200)
+        spent, _ = pipe.execute()
+        overdraft = min(max(spent - settings.REFRESH_UPSTREAM_BUDGET_PER_HOUR, 0), count)
+        if overdraft:
+            # Другой под успел раньше - возвращаем то, что не влезло
+            self._redis.decrby(key, overdraft)
+        return count - overdraft
+
+    async def budget_remaining(self) -> int:
+        if self._redis is not None:
+            try:
+                return await asyncio.to_thread(self._shared_remaining)
+            except Exception as e:
+                logger.warning(f"Shared refresh budget unavailable, using local: {e}")
+        return self._local_remaining()
+
+    async def _reserve(self, count: int) -> int:
+        if self._redis is not None:
+            try:
+                return await asyncio.to_thread(self._shared_reserve, count)
+            except Exception as e:
+                logger.warning(f"Shared refresh budget unavailable, using local: {e}")
+        allowed = min(count, self._local_remaining())
+        self._spent.extend([time.monotonic()] * allowed)
+        return allowed
+
+    def _claim_key(self, origin: str, destination: str, date_info: Dict) -> str:
+        return f"{self.CLAIM_PREFIX}:{CacheKey.of(origin, destination, date_info['db'])}"
+
+    def _shared_claim(self, origin: str, destination: str, route_dates: List[Dict]) -> List[Dict]:
+        pipe = self._redis.pipeline()
+        for date_info in route_dates:
+            pipe.set(self._claim_key(origin, destination, date_info), 1, nx=True, ex=settings.REFRESH_INTERVAL_SECONDS)
+        return [date_info for date_info, won in zip(route_dates, pipe.execute()) if won]
+
+    def _shared_release(self, origin: str, destination: str, route_dates: List[Dict]):
+        self._redis.delete(*[self._claim_key(origin, destination, date_info) for date_info in route_dates])
 
+    async def _claim(self, origin: str, destination: str, route_dates: List[Dict]) -> List[Dict]:
+        """Дни маршрута, которые обновляет этот под; остальные уже взяли другие поды"""
+        if self._redis is not None:
+            try:
+                return await asyncio.to_thread(self._shared_claim, origin, destination, route_dates)
+            except Exception as e:
+                logger.warning(f"Shared refresh claims unavailable, refreshing locally: {e}")
+        return route_dates
+
+    async def _release(self, origin: str, destination: str, route_dates: List[Dict]):
+        """Отдать захваченные дни, на которые не хватило бюджета, - их возьмет другой под"""
+        if self._redis is None or not route_dates:
+            return
+        try:
+            await asyncio.to_thread(self._shared_release, origin, destination, route_dates)
         except Exception as e:
-            logger.error(f"Error in background update: {e}")
-            return 0
+            logger.warning(f"Failed to release refresh claims: {e}")
+
+    async def _load_expiry(
+        self, flight_service: FlightService, routes: List[Tuple[str, str]], dates: List[str]
+    ) -> Dict[CacheKey, datetime]:
+        """Срок жизни кеша по ключам дней горячих маршрутов - один запрос"""
+        from models import FlightCache
+
+        result = await flight_service.db.execute(
+            select(
+                FlightCache.origin_city_code,
+                FlightCache.destination_city_code,
+                FlightCache.flight_date,
+                FlightCache.expires_at,
+            ).where(
+                tuple_(FlightCache.origin_city_code, FlightCache.destination_city_code).in_(routes),
+                FlightCache.flight_date.in_(_parse_db_dates(dates)),
+                FlightCache.promo_code.is_(None),
+                FlightCache.adults_count == 1,
+            )
+        )
+        return {
+            CacheKey.of(origin, destination, flight_date): expires_at
+            for origin, destination, flight_date, expires_at in result.all()
+        }
+
+    async def refresh_hot_routes(self) -> Dict:
+        """Один проход: обновить самые нужные дни горячих маршрутов в рамках бюджета"""
+        from database import AsyncSessionLocal
+
+        hot_routes = await route_demand.top_shared(settings.REFRESH_HOT_ROUTES)
+        if not hot_routes:
+            self.last_report = {"hot_routes": 0, "refreshed_days": 0, "budget_remaining": await self.budget_remaining()}
+            return self.last_report
+
+        async with AsyncSessionLocal() as db:
+            flight_service = FlightService(db, priority=Priority.BACKGROUND)
+            dates = flight_service._generate_month_dates()
+            expiry = await self._load_expiry(
+                flight_service, [route for route, _ in hot_routes], [date_info["db"] for date_info in dates]
+            )
+
+            now = datetime.now(timezone.utc)
+            lead_seconds = settings.REFRESH_LEAD_MINUTES * 60
+            total_popularity = sum(popularity for _, popularity in hot_routes)
+            warm_units = 0
+            warm_weight = 0.0
+            candidates = []
+
+            for (origin, destination), popularity in hot_routes:
+                for date_info in dates:
+                    expires_at = expiry.get(CacheKey.of(origin, destination, date_info["db"]))
+                    seconds_left = (expires_at - now).total_seconds() if expires_at else 0.0
+                    if seconds_left > 0:
+                        warm_units += 1
+                        warm_weight += popularity
+                    if seconds_left < lead_seconds:
+                        urgency = 1 - max(seconds_left, 0.0) / lead_seconds
+                        candidates.append((popularity * urgency, origin, destination, date_info))
+
+            # Самые нужные дни первыми, в пределах часового бюджета
+            candidates.sort(key=lambda item: item[0], reverse=True)
+            selected = candidates[: await self.budget_remaining()]
+
+            by_route: Dict[Tuple[str, str], List[Dict]] = {}
+            for _, origin, destination, date_info in selected:
+                by_route.setdefault((origin, destination), []).append(date_info)
+
+            refreshed = 0
+            claimed_days = 0
+            for (origin, destination), route_dates in by_route.items():
+                try:
+                    # Бюджет резервируем только под дни, которые захватил этот под
+                    route_dates = await self._claim(origin, destination, route_dates)
+                    if not route_dates:
+                        continue
+                    # Другие поды могли потратить бюджет, пока мы считали кандидатов
+                    allowed = await self._reserve(len(route_dates))
+                    await self._release(origin, destination, route_dates[allowed:])
+                    if not allowed:
+                        break
+                    route_dates = route_dates[:allowed]
+                    claimed_days += allowed
+                    results = await flight_service._search_flights_parallel(origin, destination, route_dates)
+                    answered = [r for r in results if r]
+                    if answered:
+                        await flight_service._cache_flights_batch(origin, destination, answered, None)
+                    refreshed += len(answered)
+                except Exception as e:
+                    logger.error(f"Error refreshing {origin}->{destination}: {e}")
+
+        units_total = len(hot_routes) * len(dates)
+        self.last_report = {
+            "hot_routes": len(hot_routes),
+            "hot_units": units_total,
+            "warm_units_before": warm_units,
+            "warm_ratio_before": round(warm_units / units_total, 3) if units_total else 0.0,
+            "demand_weighted_warm_ratio": (
+                round(warm_weight / (total_popularity * len(dates)), 3) if total_popularity and dates else 0.0
+            ),
+            "due_days": len(candidates),
+            "scheduled_days": len(selected),
+            "claimed_days": claimed_days,
+            "refreshed_days": refreshed,
+            "routes_refreshed": len(by_route),
+            "budget_remaining": await self.budget_remaining(),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+        }
+        logger.info(f"Background refresh pass: {self.last_report}")
+        return self.last_report
+
+
+# Фоновое обновление кеша процесса
+price_updater = BackgroundPriceUpdater()
@@ -0,0 +1,116 @@
+# benchmarks/bench_cache_upsert.py
+"""Бенчмарк записи в flight_cache: построчный SELECT + INSERT/UPDATE + commit против пакетного UPSERT.
+
+Запуск (нужен PostgreSQL из DATABASE_URL):
+    python benchmarks/bench_cache_upsert.py --routes 20 --days 180
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import AsyncSessionLocal, SessionLocal, async_engine, create_tables
+from flight_service import FlightService
+from models import FlightCache
+
+BENCH_ORIGIN = "ZZA"  # несуществующий код, чтобы не задеть реальный кеш
+
+
+def make_day(date: datetime, destination: str) -> dict:
+    """Ответ API Победы на одну дату примерно реального размера"""
+    return {
+        "date": date.strftime("%d.%m.%Y"),
+        "origin": BENCH_ORIGIN,
+        "destination": destination,
+        "flights": [{"id": f"{destination}{i}", "departure": "10:00", "arrival": "12:30"} for i in range(3)],
+        "prices": [{f"{destination}{i}": [{"brand": "BASIC", "price": 2500 + i * 300}]} for i in range(3)],
+        "promo_code": None,
+    }
+
+
+def legacy_cache_flight(db, destination: str, day: dict):
+    """Старый путь _cache_flight: SELECT, затем INSERT или UPDATE и commit на каждый день"""
+    flight_date = datetime.strptime(day["date"], "%d.%m.%Y").date()
+    existing = (
+        db.query(FlightCache)
+        .filter(
+            FlightCache.origin_city_code == BENCH_ORIGIN,
+            FlightCache.destination_city_code == destination,
+            FlightCache.flight_date == flight_date,
+            FlightCache.promo_code.is_(None),
+        )
+        .first()
+    )
+    if existing:
+        existing.flight_data = day
+        existing.expires_at = datetime.utcnow() + timedelta(hours=6)
+    else:
+        db.add(
+            FlightCache(
+                origin_city_code=BENCH_ORIGIN,
+                destination_city_code=destination,
+                flight_date=flight_date,
+                promo_code=None,
+                flight_data=day,
+                expires_at=datetime.utcnow() + timedelta(hours=6),
+            )
+        )
+    db.commit()
+
+
+async def bench_bulk_upsert(routes: dict, total_rows: int):
+    """Новый путь: FlightService._cache_flights_batch на AsyncSession"""
+    async with AsyncSessionLocal() as db:
+        service = FlightService(db)
+        for label in ("insert", "update"):
+            started = time.perf_counter()
+            for destination, days in routes.items():
+                await service._cache_flights_batch(BENCH_ORIGIN, destination, days, None)
+            elapsed = time.perf_counter() - started
+            print(f"bulk upsert     {label}: {total_rows} rows in {elapsed:.2f}s -> {total_rows / elapsed:,.0f} rows/s")
+    await async_engine.dispose()
+
+
+def cleanup(db):
+    db.query(FlightCache).filter(FlightCache.origin_city_code == BENCH_ORIGIN).delete()
+    db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--routes", type=int, default=20)
+    parser.add_argument("--days", type=int, default=180)
+    args = parser.parse_args()
+
+    create_tables()
+    db = SessionLocal()
+    today = datetime.now()
+    routes = {
+        f"Z{i:02d}": [make_day(today + timedelta(days=d), f"Z{i:02d}") for d in range(args.days)]
+        for i in range(args.routes)
+    }
+    total_rows = args.routes * args.days
+
+    try:
+        cleanup(db)
+        for label in ("insert", "update"):
+            started = time.perf_counter()
+            for destination, days in routes.items():
+                for day in days:
+                    legacy_cache_flight(db, destination, day)
+            elapsed = time.perf_counter() - started
+            print(f"legacy per-row {label}: {total_rows} rows in {elapsed:.2f}s -> {total_rows / elapsed:,.0f} rows/s")
+
+        cleanup(db)
+        asyncio.run(bench_bulk_upsert(routes, total_rows))
+    finally:
+        cleanup(db)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
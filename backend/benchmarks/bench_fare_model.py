@@ -0,0 +1,103 @@
+# benchmarks/bench_fare_model.py
+"""Бенчмарк FareDay против исходных dict ответа API Победы.
+
+Память на один день (tracemalloc, после json.loads - как данные приходят из API)
+и время агрегации "Куда угодно" (минимальная цена по всем дням всех направлений).
+    python benchmarks/bench_fare_model.py --destinations 150 --days 90
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_json_codec import make_search_payload
+from fare_model import FareDay
+
+
+def legacy_cheapest(day_data: dict) -> tuple:
+    """Прежний extract_cheapest_fare: обход вложенных dict/list с float() на каждый тариф"""
+    min_price = float("inf")
+    cheapest_flight_id = None
+    fare_family = None
+    for price_list in day_data["prices"]:
+        for flight_id, prices in price_list.items():
+            for price_info in prices:
+                price = float(price_info.get("price", float("inf")))
+                if price < min_price:
+                    min_price = price
+                    cheapest_flight_id = flight_id
+                    fare_family = price_info.get("brand")
+    if min_price == float("inf"):
+        return None, None, None
+    return min_price, cheapest_flight_id, fare_family
+
+
+def make_days(destinations: int, days: int) -> list:
+    """Дни всех направлений в виде, как после response.json()"""
+    template = make_search_payload(days=days)["flights"]
+    raw = json.dumps(template)
+    result = []
+    for i in range(destinations):
+        for day in json.loads(raw):
+            day["destination"] = f"C{i:02d}"
+            result.append(day)
+    return result
+
+
+def traced_kb(build) -> tuple:
+    """(объект, КБ памяти, которые он занимает)"""
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    value = build()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, (after - before) / 1024
+
+
+def aggregate(days: list, cheapest) -> dict:
+    """Минимальная цена по направлению - как в AnywhereService"""
+    best = {}
+    for day in days:
+        price, _, _ = cheapest(day)
+        if price is None:
+            continue
+        destination = day["destination"] if isinstance(day, dict) else day.destination
+        if price < best.get(destination, float("inf")):
+            best[destination] = price
+    return best
+
+
+def timed_ms(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) * 1000 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--destinations", type=int, default=150)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    raw_json = json.dumps(make_days(args.destinations, args.days))
+    days, dict_kb = traced_kb(lambda: json.loads(raw_json))
+    fare_days, fare_kb = traced_kb(lambda: [FareDay.from_api(day) for day in days])
+    total = len(days)
+
+    assert aggregate(days, legacy_cheapest) == aggregate(fare_days, FareDay.cheapest)
+
+    print(f"{total} дней ({args.destinations} направлений x {args.days} дней)")
+    print(f"память: dict {dict_kb / total:.2f} КБ/день, FareDay {fare_kb / total:.2f} КБ/день")
+    print(f"разбор в FareDay: {timed_ms(lambda: [FareDay.from_api(day) for day in days], args.repeat):.1f} мс")
+    print(f"агрегация по dict:    {timed_ms(lambda: aggregate(days, legacy_cheapest), args.repeat):.1f} мс")
+    print(f"агрегация по FareDay: {timed_ms(lambda: aggregate(fare_days, FareDay.cheapest), args.repeat):.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
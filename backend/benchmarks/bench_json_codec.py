@@ -0,0 +1,134 @@
+# benchmarks/bench_json_codec.py
+"""Бенчмарк сериализации больших ответов: jsonable_encoder + json против orjson (json_codec).
+
+Время и пиковые аллокации (tracemalloc) на кодирование и декодирование.
+Без аргументов строятся синтетические ответы /flights/anywhere и /flights/search
+реального размера; можно подать сохраненные ответы API:
+    curl -s "http://localhost:8000/flights/anywhere?origin=MOW&months_ahead=3" > anywhere.json
+    python benchmarks/bench_json_codec.py --payload anywhere.json --repeat 200
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json_codec
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+
+def make_search_payload(days: int = 30, flights_per_day: int = 4) -> dict:
+    """Ответ /flights/search: полный ответ API Победы по каждому дню"""
+    start = datetime(2025, 6, 1)
+    flights = []
+    for day in range(days):
+        date = (start + timedelta(days=day)).strftime("%d.%m.%Y")
+        day_flights = [
+            {
+                "id": f"DP{100 + i}-{day}",
+                "number": f"DP {100 + i}",
+                "departure": f"{date} {6 + i * 3:02d}:15",
+                "arrival": f"{date} {8 + i * 3:02d}:40",
+                "duration": 145,
+                "aircraft": "Boeing 737-800",
+                "seats_left": 9 - i,
+            }
+            for i in range(flights_per_day)
+        ]
+        prices = [
+            {
+                flight["id"]: [
+                    {"brand": brand, "price": 2990 + i * 700 + extra, "currency": "RUB", "baggage": brand != "BASIC"}
+                    for brand, extra in (("BASIC", 0), ("PLUS", 1500), ("MAX", 4200))
+                ]
+            }
+            for i, flight in enumerate(day_flights)
+        ]
+        flights.append({"date": date, "origin": "MOW", "destination": "LED", "flights": day_flights, "prices": prices})
+    return {"origin": "Москва", "destination": "Санкт-Петербург", "is_complete": True, "flights": flights}
+
+
+def make_anywhere_payload(destinations: int = 150) -> dict:
+    """Ответ /flights/anywhere: по одной записи на направление"""
+    return {
+        "origin": "MOW",
+        "months_ahead": 3,
+        "total_destinations_found": destinations,
+        "cheapest_flights": [
+            {
+                "origin": "MOW",
+                "destination": f"C{i:02d}",
+                "destination_name_ru": f"Город {i}",
+                "destination_name_en": f"City {i}",
+                "destination_country_ru": "Россия",
+                "destination_country_en": "Russia",
+                "min_price": 1990.0 + i * 37,
+                "cheapest_date": "2025-06-15",
+                "fare_family": "BASIC",
+                "currency": "RUB",
+                "total_days_searched": 90,
+                "total_days_with_prices": 60 + i % 30,
+                "search_period_months": 3,
+                "search_timestamp": datetime(2025, 5, 1, 12, 0).isoformat(),
+            }
+            for i in range(destinations)
+        ],
+    }
+
+
+def measure(fn, repeat: int) -> tuple:
+    """(мс на операцию, пик аллокаций одной операции в КБ)"""
+    fn()  # прогрев
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    per_op_ms = (time.perf_counter() - started) * 1000 / repeat
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return per_op_ms, peak / 1024
+
+
+def bench_payload(name: str, payload: dict, repeat: int):
+    stdlib_bytes = json.dumps(payload, ensure_ascii=False).encode()
+    fast_bytes = json_codec.dumps(payload)
+
+    cases = [
+        ("encode: jsonable_encoder + json", lambda: JSONResponse(jsonable_encoder(payload)).body),
+        ("encode: json.dumps", lambda: json.dumps(payload, ensure_ascii=False).encode()),
+        ("encode: FastJSONResponse", lambda: json_codec.FastJSONResponse(payload).body),
+        ("decode: json.loads", lambda: json.loads(stdlib_bytes)),
+        ("decode: json_codec.loads", lambda: json_codec.loads(fast_bytes)),
+    ]
+
+    print(f"\n{name}: {len(stdlib_bytes) / 1024:.1f} КБ (json), {len(fast_bytes) / 1024:.1f} КБ (orjson)")
+    print(f"{'операция':36} {'мс/оп':>10} {'пик КБ':>10}")
+    for label, fn in cases:
+        per_op_ms, peak_kb = measure(fn, repeat)
+        print(f"{label:36} {per_op_ms:10.3f} {peak_kb:10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payload", action="append", default=[], help="JSON-файл с сохраненным ответом API")
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.payload:
+        for path in args.payload:
+            with open(path, "rb") as f:
+                bench_payload(os.path.basename(path), json.loads(f.read()), args.repeat)
+    else:
+        bench_payload("/flights/anywhere (150 направлений)", make_anywhere_payload(), args.repeat)
+        bench_payload("/flights/search (30 дней)", make_search_payload(), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# benchmarks/bench_logging.py
+"""Задержка запросов при отправке логов в ELK: выключено / очередь + пачки / старый HTTPHandler.
+
+Маршрут бенчмарка пишет столько же строк, сколько поиск на 30 дней
+(INFO в начале и конце, DEBUG на каждую дату). Logstash заменен локальным
+HTTP-сервером в отдельном потоке с задержкой --elk-latency-ms на каждый POST.
+Консоль и файл отключены, чтобы сравнивалась только отправка в ELK.
+Зависимости бенчмарков: pip install -r requirements-bench.txt
+
+    python benchmarks/bench_logging.py
+    python benchmarks/bench_logging.py --requests 500 --concurrency 20 --elk-latency-ms 20
+"""
+import argparse
+import asyncio
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ["LOG_CONSOLE"] = "false"
+os.environ["LOG_FILE"] = ""
+
+import httpx  # noqa: E402
+import json_codec  # noqa: E402
+from config import settings  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from load_search_latency import percentile  # noqa: E402
+from logging_config import HOT_PATH_LOGGERS, HotPathSampler, log_pipeline  # noqa: E402
+
+logger = logging.getLogger("flight_service")
+DAYS = 30
+
+app = FastAPI()
+
+
+@app.get("/search")
+async def search():
+    logger.info(f"Searching flights MOW -> LED for {DAYS} dates")
+    for day in range(DAYS):
+        logger.debug(f"Date {day}: cached, min_price {1990 + day * 100}")
+        await asyncio.sleep(0)
+    logger.info(f"FINAL: {DAYS}/{DAYS} days with data, complete: True")
+    return {"days": DAYS}
+
+
+class FakeLogstash:
+    """http input Logstash: принимает POST, считает события"""
+
+    def __init__(self, latency_ms: float):
+        self.documents = 0
+        self.posts = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                time.sleep(latency_ms / 1000)
+                fake.posts += 1
+                if self.headers.get("Content-Type") == "application/json":
+                    fake.documents += len(json_codec.loads(body))
+                else:
+                    fake.documents += 1  # HTTPHandler: одна запись - один POST
+                self.send_response(200)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+def configure(mode: str, fake: FakeLogstash):
+    """off - очередь без ELK, pipeline - очередь и пачки в ELK, legacy - HTTPHandler на каждую запись"""
+    settings.LOG_ELK_URL = f"http://127.0.0.1:{fake.port}/logs" if mode == "pipeline" else ""
+    log_pipeline.setup()
+    if mode != "legacy":
+        return
+
+    # Как было в logging_config до очереди: синхронный POST на каждую запись, DEBUG горячих путей целиком
+    log_pipeline.stop()
+    root = logging.getLogger()
+    root.addHandler(logging.handlers.HTTPHandler(f"127.0.0.1:{fake.port}", "/logs", method="POST"))
+    for name in HOT_PATH_LOGGERS:
+        hot_logger = logging.getLogger(name)
+        hot_logger.filters = [f for f in hot_logger.filters if not isinstance(f, HotPathSampler)]
+
+
+def unconfigure():
+    log_pipeline.stop()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+
+async def run(requests: int, concurrency: int):
+    latencies = []
+    remaining = requests
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            await client.get("/search")
+            latencies.append(time.perf_counter() - started)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        return latencies, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--elk-latency-ms", type=float, default=5.0, help="задержка ответа Logstash на POST")
+    parser.add_argument("--modes", default="off,pipeline,legacy")
+    args = parser.parse_args()
+
+    fake = FakeLogstash(args.elk_latency_ms)
+    print(f"{'режим':10} {'rps':>8} {'p50 мс':>9} {'p99 мс':>9} {'POST':>6} {'событий':>8}  очередь логов")
+    for mode in args.modes.split(","):
+        configure(mode, fake)
+        posts_before, documents_before = fake.posts, fake.documents
+        latencies, elapsed = asyncio.run(run(args.requests, args.concurrency))
+        stats = log_pipeline.get_stats() if mode != "legacy" else {}
+        unconfigure()  # дослать остаток, чтобы посчитать все отправленное
+        print(
+            f"{mode:10} {len(latencies) / elapsed:>8.1f} {percentile(latencies, 50) * 1000:>9.2f} "
+            f"{percentile(latencies, 99) * 1000:>9.2f} {fake.posts - posts_before:>6} "
+            f"{fake.documents - documents_before:>8}  "
+            f"{ {k: stats[k] for k in ('dropped_on_overflow', 'hot_path_sampled_out')} if stats else '-'}"
+        )
+    fake.server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# benchmarks/load_search_latency.py
+"""Нагрузочный тест: задержка /flights/search, пока параллельно идут поиски "Куда угодно".
+
+Запускается против поднятого API:
+    python benchmarks/load_search_latency.py --base-url http://localhost:8000 \\
+        --anywhere 4 --search-workers 20 --duration 60
+
+Печатает p50/p95/p99 для /flights/search - сравнивать до и после переноса БД на asyncpg.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import aiohttp
+
+ROUTES = [("MOW", "LED"), ("MOW", "AER"), ("LED", "MOW"), ("MOW", "KZN"), ("SVX", "MOW")]
+ANYWHERE_ORIGINS = ["MOW", "LED", "SVX", "KZN"]
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def anywhere_load(session: aiohttp.ClientSession, base_url: str, origin: str, stop_at: float):
+    """Держим поиск "Куда угодно" постоянно запущенным"""
+    while time.monotonic() < stop_at:
+        try:
+            async with session.get(f"{base_url}/flights/anywhere", params={"origin": origin}) as response:
+                await response.read()
+        except Exception as e:
+            print(f"anywhere {origin} failed: {e}")
+
+
+async def search_worker(
+    session: aiohttp.ClientSession, base_url: str, worker_id: int, stop_at: float, latencies: list, errors: list
+):
+    i = worker_id
+    while time.monotonic() < stop_at:
+        origin, destination = ROUTES[i % len(ROUTES)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            async with session.get(
+                f"{base_url}/flights/search", params={"origin": origin, "destination": destination}
+            ) as response:
+                await response.read()
+                if response.status != 200:
+                    errors.append(response.status)
+                    continue
+        except Exception as e:
+            errors.append(str(e))
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--anywhere", type=int, default=4, help="параллельных поисков 'Куда угодно'")
+    parser.add_argument("--search-workers", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=60.0)
+    args = parser.parse_args()
+
+    latencies: list = []
+    errors: list = []
+    stop_at = time.monotonic() + args.duration
+    timeout = aiohttp.ClientTimeout(total=None)
+
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        background = [
+            asyncio.create_task(anywhere_load(session, args.base_url, ANYWHERE_ORIGINS[i % 4], stop_at))
+            for i in range(args.anywhere)
+        ]
+        await asyncio.gather(
+            *[search_worker(session, args.base_url, i, stop_at, latencies, errors) for i in range(args.search_workers)]
+        )
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+
+    print(f"/flights/search under {args.anywhere} concurrent anywhere searches, {args.duration:.0f}s")
+    print(f"  requests: {len(latencies)} ok, {len(errors)} errors, {len(latencies) / args.duration:.1f} req/s")
+    if latencies:
+        print(f"  mean: {statistics.mean(latencies) * 1000:.1f} ms")
+        for q in (50, 95, 99):
+            print(f"  p{q}: {percentile(latencies, q) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
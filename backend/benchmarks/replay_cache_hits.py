@@ -0,0 +1,121 @@
+# benchmarks/replay_cache_hits.py
+"""Проверка попаданий в кеш: повтор записанной нагрузки /flights/search против заглушки API Победы.
+
+Каждый маршрут (origin, destination, promo) должен сходить в API ровно один раз на каждую
+из 30 дат - при первом поиске. Повторные поиски обязаны целиком отдаваться из кеша,
+в том числе из Postgres (по умолчанию L1 в памяти сбрасывается перед каждым поиском).
+Если число запросов к API не совпало с ожидаемым, скрипт завершается с кодом 1.
+
+Нужен PostgreSQL из DATABASE_URL; строки маршрутов из нагрузки (коды ZZ*) удаляются перед прогоном:
+    python benchmarks/replay_cache_hits.py
+    python benchmarks/replay_cache_hits.py --workload my_searches.jsonl --keep-l1
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCH_DIR))
+
+STUB_PORT = int(os.environ.get("STUB_POBEDA_PORT", "8765"))
+# Настройки читаются при импорте модулей бекенда: заглушка вместо API Победы и лимиты без ожиданий
+os.environ["POBEDA_API_BASE_URL"] = f"http://127.0.0.1:{STUB_PORT}/websky/json"
+os.environ.setdefault("UPSTREAM_RATE_PER_SECOND", "1000")
+os.environ.setdefault("UPSTREAM_BURST", "100")
+os.environ.setdefault("UPSTREAM_MAX_CONCURRENCY", "20")
+
+from database import AsyncSessionLocal, async_engine, create_tables  # noqa: E402
+from flight_cache import flight_cache  # noqa: E402
+from flight_service import FlightService  # noqa: E402
+from http_client import pobeda_http  # noqa: E402
+from models import FareCalendarDay, FlightCache, FlightRetryTask, PriceObservation  # noqa: E402
+from sqlalchemy import delete, or_  # noqa: E402
+from stub_pobeda import StubPobeda  # noqa: E402
+
+DEFAULT_WORKLOAD = os.path.join(BENCH_DIR, "workloads", "search_replay.jsonl")
+DAYS_PER_SEARCH = 30
+
+
+def load_workload(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def reset_routes(codes: set):
+    """Удалить все, что осталось от прошлых прогонов по кодам нагрузки"""
+    async with AsyncSessionLocal() as db:
+        for model in (FlightCache, FareCalendarDay, PriceObservation, FlightRetryTask):
+            await db.execute(
+                delete(model).where(or_(model.origin_city_code.in_(codes), model.destination_city_code.in_(codes)))
+            )
+        await db.commit()
+
+
+async def replay(workload: list, keep_l1: bool) -> bool:
+    await asyncio.to_thread(create_tables)
+    await reset_routes({search["origin"] for search in workload} | {search["destination"] for search in workload})
+
+    stub = StubPobeda(port=STUB_PORT)
+    await stub.start()
+
+    seen_routes = set()
+    total_calls = 0
+    expected_total = 0
+    failures = []
+    started = time.perf_counter()
+
+    print(f"{'#':>3} {'маршрут':22} {'API':>5} {'ожид.':>6} {'дней':>5} {'мс':>8}")
+    try:
+        for number, search in enumerate(workload, 1):
+            route = (search["origin"], search["destination"], search.get("promo_code"))
+            expected = 0 if route in seen_routes else DAYS_PER_SEARCH
+            seen_routes.add(route)
+
+            if not keep_l1:
+                flight_cache.clear_l1()
+
+            calls_before = stub.calls["search"]
+            search_started = time.perf_counter()
+            async with AsyncSessionLocal() as db:
+                result = await FlightService(db).search_flights_month(*route)
+            elapsed_ms = (time.perf_counter() - search_started) * 1000
+            calls = stub.calls["search"] - calls_before
+
+            total_calls += calls
+            expected_total += expected
+            if calls != expected or not result["is_complete"]:
+                failures.append((number, route, calls, expected))
+
+            label = f"{route[0]}-{route[1]}" + (f" [{route[2]}]" if route[2] else "")
+            print(f"{number:>3} {label:22} {calls:>5} {expected:>6} {result['days_with_data']:>5} {elapsed_ms:>8.1f}")
+    finally:
+        await stub.stop()
+        await pobeda_http.close()
+        await async_engine.dispose()
+
+    lookups = len(workload) * DAYS_PER_SEARCH
+    print(f"\nпоисков: {len(workload)}, маршрутов: {len(seen_routes)}, время: {time.perf_counter() - started:.2f} с")
+    print(f"запросов к API: {total_calls} (ожидалось {expected_total})")
+    print(f"доля дней из кеша: {1 - total_calls / lookups:.3f} (максимум {1 - expected_total / lookups:.3f})")
+    print(f"кеш по уровням: {flight_cache.get_stats()}")
+
+    for number, route, calls, expected in failures:
+        print(f"❌ поиск #{number} {route}: {calls} запросов к API вместо {expected}")
+    return not failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workload", default=DEFAULT_WORKLOAD, help="JSONL: {origin, destination, promo_code}")
+    parser.add_argument("--keep-l1", action="store_true", help="не сбрасывать кеш в памяти между поисками")
+    args = parser.parse_args()
+
+    ok = asyncio.run(replay(load_workload(args.workload), args.keep_l1))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+# benchmarks/stub_pobeda.py
+"""Локальная заглушка API Победы для бенчмарков и проверок кеша.
+
+Эндпоинты dict-cities, dependence-cities и search-variants-mono-brand-cartesian.
+Ответы детерминированные (одна и та же дата маршрута - всегда один и тот же ответ,
+часть дней без рейсов); можно добавить задержку, долю ответов 403 и подложить
+записанные ответы настоящего API:
+    recordings/dict-cities.json
+    recordings/dependence-cities/MOW.json
+    recordings/search/MOW-LED-01.11.2025.json
+Заглушка считает обращения по эндпоинтам (calls), чтобы проверять число запросов к "API".
+
+Отдельно:
+    python benchmarks/stub_pobeda.py --port 8765 --latency-ms 150 --block-ratio 0.05
+и в .env бекенда: POBEDA_API_BASE_URL=http://127.0.0.1:8765/websky/json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+from collections import Counter
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+API_PREFIX = "/websky/json"
+
+# Города заглушки: основные города Победы (их же перебирает CityService.discover_active_cities)
+STUB_CITIES = {
+    "MOW": ("Москва", "Moscow"),
+    "LED": ("Санкт-Петербург", "Saint Petersburg"),
+    "SVX": ("Екатеринбург", "Yekaterinburg"),
+    "KZN": ("Казань", "Kazan"),
+    "AER": ("Сочи", "Sochi"),
+    "OVB": ("Новосибирск", "Novosibirsk"),
+    "UFA": ("Уфа", "Ufa"),
+    "KRR": ("Краснодар", "Krasnodar"),
+    "ROV": ("Ростов-на-Дону", "Rostov-on-Don"),
+    "MRV": ("Минеральные Воды", "Mineralnye Vody"),
+    "GOJ": ("Нижний Новгород", "Nizhny Novgorod"),
+    "VKO": ("Москва (Внуково)", "Moscow (Vnukovo)"),
+    "STW": ("Ставрополь", "Stavropol"),
+    "KGD": ("Калининград", "Kaliningrad"),
+    "OMS": ("Омск", "Omsk"),
+    "CEK": ("Челябинск", "Chelyabinsk"),
+    "KUF": ("Самара", "Samara"),
+    "NUX": ("Новый Уренгой", "Novy Urengoy"),
+    "IJK": ("Ижевск", "Izhevsk"),
+    "NNM": ("Нарьян-Мар", "Naryan-Mar"),
+    "MCX": ("Махачкала", "Makhachkala"),
+    "ASF": ("Астрахань", "Astrakhan"),
+    "VOG": ("Волгоград", "Volgograd"),
+    "PEE": ("Пермь", "Perm"),
+}
+
+
+def _seed(*parts: str) -> int:
+    return int.from_bytes(hashlib.blake2b(":".join(parts).encode(), digest_size=4).digest(), "big")
+
+
+def _city(code: str) -> Dict:
+    name_ru, name_en = STUB_CITIES.get(code, (code, code))
+    return {"codeEn": code, "nameRu": name_ru, "nameEn": name_en, "countryRu": "Россия", "countryEn": "Russia"}
+
+
+def make_cities_payload() -> List[Dict]:
+    return [_city(code) for code in STUB_CITIES]
+
+
+def make_destinations_payload(origin: str) -> Dict:
+    """Из каждого города летают примерно в 60% остальных"""
+    return {
+        "destination": [_city(code) for code in STUB_CITIES if code != origin and _seed("route", origin, code) % 10 < 6]
+    }
+
+
+def make_search_payload(origin: str, destination: str, date: str) -> Dict:
+    """Ответ на одну дату: 0-3 рейса с тарифами BASIC/PLUS/MAX, каждый пятый день пустой"""
+    seed = _seed(origin, destination, date)
+    flights_count = 0 if seed % 5 == 0 else 1 + seed % 3
+    flights = []
+    prices = []
+    for i in range(flights_count):
+        flight_id = f"{origin}{destination}{i}-{date}"
+        base = 1990 + (seed >> (i * 3)) % 40 * 100
+        flights.append({"id": flight_id, "number": f"DP {100 + i}", "departure": f"{date} {7 + i * 4:02d}:00"})
+        prices.append(
+            {
+                flight_id: [
+                    {"brand": "BASIC", "price": base},
+                    {"brand": "PLUS", "price": base + 1500},
+                    {"brand": "MAX", "price": base + 4000},
+                ]
+            }
+        )
+    return {"flights": flights, "prices": prices}
+
+
+class StubPobeda:
+    """aiohttp-сервер с эндпоинтами API Победы.
+
+    latency_ms - средняя задержка ответа (+-50%), block_ratio - доля ответов 403,
+    recordings_dir - каталог с записанными ответами, они важнее синтетических.
+    calls - число запросов по эндпоинтам, blocked - сколько из них получили 403.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        latency_ms: float = 0.0,
+        block_ratio: float = 0.0,
+        recordings_dir: Optional[str] = None,
+        seed: int = 42,
+    ):
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.block_ratio = block_ratio
+        self.recordings_dir = recordings_dir
+        self.calls: Counter = Counter()
+        self.blocked: Counter = Counter()
+        self._random = random.Random(seed)
+        self._runner = None
+
+        self.app = web.Application()
+        self.app.router.add_get(f"{API_PREFIX}/dict-cities", self.dict_cities)
+        self.app.router.add_post(f"{API_PREFIX}/dependence-cities", self.dependence_cities)
+        self.app.router.add_post(f"{API_PREFIX}/search-variants-mono-brand-cartesian", self.search)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}{API_PREFIX}"
+
+    def reset_counters(self):
+        self.calls.clear()
+        self.blocked.clear()
+
+    def _recorded(self, *path: str) -> Optional[object]:
+        if not self.recordings_dir:
+            return None
+        file_path = os.path.join(self.recordings_dir, *path)
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    async def _respond(self, endpoint: str, payload_factory) -> web.Response:
+        """Общая часть всех эндпоинтов: счетчик, задержка, 403"""
+        self.calls[endpoint] += 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms * self._random.uniform(0.5, 1.5) / 1000)
+        if self.block_ratio and self._random.random() < self.block_ratio:
+            self.blocked[endpoint] += 1
+            return web.json_response({"error": "Forbidden"}, status=403)
+        return web.json_response(payload_factory())
+
+    async def dict_cities(self, request: web.Request) -> web.Response:
+        return await self._respond("dict-cities", lambda: self._recorded("dict-cities.json") or make_cities_payload())
+
+    async def dependence_cities(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        origin = form.get("cityCode", "")
+        return await self._respond(
+            "dependence-cities",
+            lambda: self._recorded("dependence-cities", f"{origin}.json") or make_destinations_payload(origin),
+        )
+
+    async def search(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        origin = form.get("origin-city-code[0]", "")
+        destination = form.get("destination-city-code[0]", "")
+        date = form.get("date[0]", "")
+        return await self._respond(
+            "search",
+            lambda: self._recorded("search", f"{origin}-{destination}-{date}.json")
+            or make_search_payload(origin, destination, date),
+        )
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def _serve(args):
+    stub = StubPobeda(args.host, args.port, args.latency_ms, args.block_ratio, args.recordings)
+    await stub.start()
+    print(f"Stub Pobeda API: {stub.base_url}")
+    try:
+        while True:
+            await asyncio.sleep(60)
+            print(f"calls: {dict(stub.calls)}, blocked: {dict(stub.blocked)}")
+    finally:
+        await stub.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--block-ratio", type=float, default=0.0, help="доля ответов 403, 0..1")
+    parser.add_argument("--recordings", help="каталог с записанными ответами API")
+    asyncio.run(_serve(parser.parse_args()))
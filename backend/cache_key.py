@@ -0,0 +1,76 @@
+# cache_key.py
+import sys
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Optional, Union
+
+DateLike = Union[date, datetime, str]
+
+
+def parse_flight_date(value: DateLike) -> date:
+    """Дата вылета из date/datetime, "YYYY-MM-DD" (БД) или "DD.MM.YYYY" (API Победы)"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if len(value) == 10 and value[4] == "-":
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    return datetime.strptime(value, "%d.%m.%Y").date()
+
+
+@dataclass(frozen=True, slots=True)
+class CacheKey:
+    """Единый ключ дня маршрута для всех уровней кеша, single-flight и фоновых задач.
+
+    Дата всегда datetime.date, коды городов - в верхнем регистре,
+    отсутствие промокода - пустая строка. Строится только через CacheKey.of,
+    поэтому ключ из строки БД, из ответа API и из запроса пользователя
+    совпадает, в каком бы формате ни пришла дата.
+    """
+
+    origin: str
+    destination: str
+    flight_date: date
+    promo_code: str = ""
+    adults: int = 1
+
+    @classmethod
+    def of(
+        cls, origin: str, destination: str, flight_date: DateLike, promo_code: Optional[str] = None, adults: int = 1
+    ) -> "CacheKey":
+        return cls(
+            sys.intern(origin.upper()),
+            sys.intern(destination.upper()),
+            parse_flight_date(flight_date),
+            promo_code or "",
+            int(adults or 1),
+        )
+
+    @property
+    def db_date(self) -> str:
+        return self.flight_date.strftime("%Y-%m-%d")
+
+    @property
+    def api_date(self) -> str:
+        return self.flight_date.strftime("%d.%m.%Y")
+
+    @property
+    def promo_or_none(self) -> Optional[str]:
+        """Промокод в виде колонки flight_cache.promo_code (NULL - без промокода)"""
+        return self.promo_code or None
+
+    @property
+    def route(self) -> tuple:
+        """Все, кроме даты: по нему ключи группируются в один SQL-запрос"""
+        return self.origin, self.destination, self.promo_code, self.adults
+
+    def with_date(self, flight_date: DateLike) -> "CacheKey":
+        return CacheKey(self.origin, self.destination, parse_flight_date(flight_date), self.promo_code, self.adults)
+
+    def storage_key(self, kind: str = "full") -> str:
+        """Строковый ключ для L1 и Redis; kind: "full" - ответ API, "summary" - сжатая проекция"""
+        key = f"{self.origin}:{self.destination}:{self.db_date}:{self.promo_code}:{self.adults}"
+        return key if kind == "full" else f"{kind}:{key}"
+
+    def __str__(self) -> str:
+        return self.storage_key()
@@ -0,0 +1,217 @@
+# city_catalog.py
+import asyncio
+import json
+import logging
+import uuid
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, FrozenSet, List, Mapping, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class CityRecord:
+    code: str
+    name_ru: str
+    name_en: str
+    country_ru: Optional[str]
+    country_en: Optional[str]
+    is_active: bool
+
+
+@dataclass(frozen=True)
+class CitySnapshot:
+    """Неизменяемый снимок справочника городов - заменяется целиком"""
+
+    version: int
+    by_code: Mapping[str, CityRecord]
+    active_codes: FrozenSet[str]
+    frontend_payload: Tuple[Dict, ...]  # активные города, уже отсортированные по name_ru
+
+
+EMPTY_SNAPSHOT = CitySnapshot(version=0, by_code=MappingProxyType({}), active_codes=frozenset(), frontend_payload=())
+
+
+class CityCatalog:
+    """Справочник городов в памяти процесса с O(1) поиском по коду.
+
+    Перестраивается после каждого commit в CityService и атомарно
+    подменяет снимок. Через Redis pub/sub остальные реплики узнают
+    о новой версии и перечитывают таблицу у себя.
+    """
+
+    CHANNEL = "pobeda:cities:invalidate"
+    VERSION_KEY = "pobeda:cities:version"
+
+    def __init__(self):
+        self._snapshot = EMPTY_SNAPSHOT
+        self._redis = None
+        self._instance_id = uuid.uuid4().hex
+        self._refresh_lock = asyncio.Lock()
+
+    @property
+    def snapshot(self) -> CitySnapshot:
+        return self._snapshot
+
+    @property
+    def loaded(self) -> bool:
+        return self._snapshot.version > 0
+
+    def attach_redis(self, redis_client):
+        """Включить версионирование и инвалидацию между репликами"""
+        self._redis = redis_client
+
+    def get(self, code: str) -> Optional[CityRecord]:
+        return self._snapshot.by_code.get(code)
+
+    def get_active(self, code: str) -> Optional[CityRecord]:
+        city = self._snapshot.by_code.get(code)
+        return city if city and city.is_active else None
+
+    def get_frontend_payload(self) -> List[Dict]:
+        return list(self._snapshot.frontend_payload)
+
+    async def _next_version(self) -> int:
+        if self._redis is not None:
+            try:
+                return int(await asyncio.to_thread(self._redis.incr, self.VERSION_KEY))
+            except Exception as e:
+                logger.warning(f"Redis city version unavailable, using local version: {e}")
+        return self._snapshot.version + 1
+
+    async def _shared_version(self) -> int:
+        """Текущая общая версия без увеличения (при пустом Redis - 1)"""
+        if self._redis is not None:
+            try:
+                pipe = self._redis.pipeline()
+                pipe.set(self.VERSION_KEY, 1, nx=True)
+                pipe.get(self.VERSION_KEY)
+                _, version = await asyncio.to_thread(pipe.execute)
+                return int(version)
+            except Exception as e:
+                logger.warning(f"Redis city version unavailable, using local version: {e}")
+        return self._snapshot.version + 1
+
+    async def refresh(self, db: AsyncSession, publish: bool = True, version: int = None) -> CitySnapshot:
+        """Перечитать таблицу городов и атомарно заменить снимок.
+
+        publish=True - справочник изменился: новая версия и оповещение реплик.
+        publish=False - только загрузить текущее состояние (запуск, чужая инвалидация),
+        общая версия при этом не меняется.
+        """
+        from models import City
+
+        async with self._refresh_lock:
+            result = await db.execute(select(City))
+            records = [
+                CityRecord(
+                    code=city.code,
+                    name_ru=city.name_ru,
+                    name_en=city.name_en,
+                    country_ru=city.country_ru,
+                    country_en=city.country_en,
+                    is_active=bool(city.is_active),
+                )
+                for city in result.scalars().all()
+            ]
+
+            active = sorted((city for city in records if city.is_active), key=lambda city: city.name_ru)
+            frontend_payload = tuple(
+                {
+                    "value": city.code,
+                    "label": f"{city.name_ru} ({city.code})",
+                    "name_ru": city.name_ru,
+                    "name_en": city.name_en,
+                    "country_ru": city.country_ru,
+                }
+                for city in active
+            )
+
+            snapshot = CitySnapshot(
+                version=(
+                    version
+                    if version is not None
+                    else (await self._next_version() if publish else await self._shared_version())
+                ),
+                by_code=MappingProxyType({city.code: city for city in records}),
+                active_codes=frozenset(city.code for city in active),
+                frontend_payload=frontend_payload,
+            )
+            self._snapshot = snapshot
+
+        logger.info(
+            f"🏙 City catalog v{snapshot.version}: {len(snapshot.by_code)} cities, {len(snapshot.active_codes)} active"
+        )
+
+        if publish and self._redis is not None:
+            message = json.dumps({"version": snapshot.version, "source": self._instance_id})
+            try:
+                await asyncio.to_thread(self._redis.publish, self.CHANNEL, message)
+            except Exception as e:
+                logger.warning(f"Failed to publish city catalog invalidation: {e}")
+
+        return snapshot
+
+    async def ensure_loaded(self, db: AsyncSession):
+        if not self.loaded:
+            await self.refresh(db, publish=False)
+
+    async def listen_invalidations(self, session_factory):
+        """Фоновая задача: перечитывать справочник, когда другая реплика его обновила.
+
+        При ошибке Redis подписка восстанавливается с растущей паузой (до 60 секунд),
+        а после переподписки справочник сверяется с общей версией - оповещения,
+        пропущенные за время обрыва, не теряются.
+        """
+        if self._redis is None:
+            return
+
+        delay = 1.0
+        while True:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await asyncio.to_thread(pubsub.subscribe, self.CHANNEL)
+                logger.info("✅ City catalog listening for invalidations")
+                await self._catch_up(session_factory)
+                delay = 1.0
+
+                while True:
+                    message = await asyncio.to_thread(pubsub.get_message, timeout=1.0)
+                    if not message:
+                        continue
+                    try:
+                        data = json.loads(message["data"])
+                    except (TypeError, ValueError):
+                        continue
+                    if data.get("source") == self._instance_id or data.get("version", 0) <= self._snapshot.version:
+                        continue
+
+                    async with session_factory() as db:
+                        await self.refresh(db, publish=False, version=data["version"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"City catalog invalidation listener failed, resubscribing in {delay:.0f}s: {e}")
+            finally:
+                try:
+                    await asyncio.to_thread(pubsub.close)
+                except Exception:
+                    pass
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60.0)
+
+    async def _catch_up(self, session_factory):
+        """Перечитать справочник, если общая версия ушла вперед, пока подписки не было"""
+        version = int(await asyncio.to_thread(self._redis.get, self.VERSION_KEY) or 0)
+        if version > self._snapshot.version:
+            async with session_factory() as db:
+                await self.refresh(db, publish=False, version=version)
+
+
+# Глобальный справочник процесса
+city_catalog = CityCatalog()
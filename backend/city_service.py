@@ -1,45 +1,44 @@
 import asyncio
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
 
-import aiohttp
-from sqlalchemy.orm import Session
+from city_catalog import city_catalog
+from config import settings
+from http_client import pobeda_http
+from rate_limiter import Priority, upstream_limiter
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 logger = logging.getLogger(__name__)
 
 
 class PobedaAPIClient:
-    def __init__(self):
-        self.base_url = "https://ticket.flypobeda.ru/websky/json"
-        self.headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-            "Accept": "application/json, text/plain, */*",
-            "Content-Type": "application/x-www-form-urlencoded;charset=UTF-8",
-            "Origin": "https://ticket.flypobeda.ru",
-            "Referer": "https://ticket.flypobeda.ru/websky/",
-        }
+    def __init__(self, priority: Priority = Priority.INTERACTIVE):
+        self.base_url = settings.POBEDA_API_BASE_URL
+        self.priority = priority
 
     async def get_all_cities(self) -> list:
         """Получить ВСЕ города из справочника - GET запрос!"""
         url = f"{self.base_url}/dict-cities"
 
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.get(url, headers=self.headers, timeout=30) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if isinstance(data, list):
-                            logger.info(f"✅ Received {len(data)} cities from API")
-                            return data
-                        else:
-                            logger.error(f"❌ Unexpected API response format: {type(data)}")
-                            return []
+        session = await pobeda_http.get_session()
+        try:
+            async with upstream_limiter.acquire(self.priority), session.get(url, timeout=30) as response:
+                upstream_limiter.record_response(response.status)
+                if response.status == 200:
+                    data = await response.json()
+                    if isinstance(data, list):
+                        logger.info(f"✅ Received {len(data)} cities from API")
+                        return data
                     else:
-                        logger.error(f"❌ API returned status {response.status}")
+                        logger.error(f"❌ Unexpected API response format: {type(data)}")
                         return []
-            except Exception as e:
-                logger.error(f"❌ Error fetching cities: {e}")
-                return []
+                else:
+                    logger.error(f"❌ API returned status {response.status}")
+                    return []
+        except Exception as e:
+            logger.error(f"❌ Error fetching cities: {e}")
+            return []
 
     async def get_available_destinations(self, origin_city_code: str) -> list:
         """Получить города, в которые МОЖНО улететь из указанного города"""
@@ -51,32 +50,33 @@ class PobedaAPIClient:
             "lang": "ru",
         }
 
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(url, headers=self.headers, data=data, timeout=30) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        destinations = data.get("destination", [])
-                        logger.info(f"✅ Found {len(destinations)} destinations from {origin_city_code}")
-                        return destinations
-                    elif response.status == 403:
-                        logger.warning(f"⚠️ API 403 Forbidden for {origin_city_code}")
-                        return []  # Возвращаем пустой список при 403
-                    else:
-                        logger.error(f"❌ API returned status {response.status} for {origin_city_code}")
-                        return []
-            except asyncio.TimeoutError:
-                logger.error(f"⏰ Timeout fetching destinations from {origin_city_code}")
-                return []
-            except Exception as e:
-                logger.error(f"❌ Error fetching destinations from {origin_city_code}: {e}")
-                return []
+        session = await pobeda_http.get_session()
+        try:
+            async with upstream_limiter.acquire(self.priority), session.post(url, data=data, timeout=30) as response:
+                upstream_limiter.record_response(response.status)
+                if response.status == 200:
+                    data = await response.json()
+                    destinations = data.get("destination", [])
+                    logger.info(f"✅ Found {len(destinations)} destinations from {origin_city_code}")
+                    return destinations
+                elif response.status == 403:
+                    logger.warning(f"⚠️ API 403 Forbidden for {origin_city_code}")
+                    return []  # Возвращаем пустой список при 403
+                else:
+                    logger.error(f"❌ API returned status {response.status} for {origin_city_code}")
+                    return []
+        except asyncio.TimeoutError:
+            logger.error(f"⏰ Timeout fetching destinations from {origin_city_code}")
+            return []
+        except Exception as e:
+            logger.error(f"❌ Error fetching destinations from {origin_city_code}: {e}")
+            return []
 
 
 class CityService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession, priority: Priority = Priority.INTERACTIVE):
         self.db = db
-        self.api_client = PobedaAPIClient()
+        self.api_client = PobedaAPIClient(priority)
 
     async def update_cities_from_api(self) -> dict:
         """Обновить список всех городов из API и вернуть статистику"""
@@ -90,21 +90,30 @@ class CityService:
         updated = 0
         created = 0
 
+        # Все города одним запросом вместо SELECT на каждый
+        result = await self.db.execute(select(City))
+        existing_cities = {city.code: city for city in result.scalars().all()}
+
         for city_data in cities_data:
             city_code = city_data.get("codeEn")
             if not city_code:
                 continue
 
-            existing_city = self.db.query(City).filter(City.code == city_code).first()
+            existing_city = existing_cities.get(city_code)
 
             if existing_city:
-                # Обновляем существующий - НЕ меняем is_active!
-                existing_city.name_ru = city_data.get("nameRu", "")
-                existing_city.name_en = city_data.get("nameEn", "")
-                existing_city.country_ru = city_data.get("countryRu", "")
-                existing_city.country_en = city_data.get("countryEn", "")
-                existing_city.updated_at = datetime.utcnow()
-                updated += 1
+                # Обновляем существующий - НЕ меняем is_active! Строку трогаем, только если API что-то изменил
+                fields = {
+                    "name_ru": city_data.get("nameRu", ""),
+                    "name_en": city_data.get("nameEn", ""),
+                    "country_ru": city_data.get("countryRu", ""),
+                    "country_en": city_data.get("countryEn", ""),
+                }
+                if any(getattr(existing_city, field) != value for field, value in fields.items()):
+                    for field, value in fields.items():
+                        setattr(existing_city, field, value)
+                    existing_city.updated_at = datetime.now(timezone.utc)
+                    updated += 1
             else:
                 # Создаем новый город - по умолчанию НЕ активный!
                 new_city = City(
@@ -116,15 +125,18 @@ class CityService:
                     is_active=False,  # ⚠️ ВАЖНО: новые города не активны по умолчанию!
                 )
                 self.db.add(new_city)
+                existing_cities[city_code] = new_city
                 created += 1
 
-        self.db.commit()
+        await self.db.commit()
+        # Эндпоинт /cities вызывает это на каждый запрос: реплики оповещаем, только если города изменились
+        await city_catalog.refresh(self.db, publish=bool(created or updated))
 
         return {
             "total_received": len(cities_data),
             "created": created,
             "updated": updated,
-            "total_in_db": self.db.query(City).count(),
+            "total_in_db": await self.db.scalar(select(func.count()).select_from(City)),
         }
 
     async def get_available_destinations_from_api(self, origin_city_code: str) -> list:
@@ -249,12 +261,15 @@ class CityService:
             active_codes = await self.discover_active_cities()
 
             # Сначала помечаем все города как неактивные
-            self.db.query(City).update({City.is_active: False})
+            await self.db.execute(update(City).values(is_active=False))
 
             # Помечаем найденные активные города
+            result = await self.db.execute(select(City).where(City.code.in_(active_codes)))
+            cities_by_code = {city.code: city for city in result.scalars().all()}
+
             activated_count = 0
             for code in active_codes:
-                city = self.db.query(City).filter(City.code == code).first()
+                city = cities_by_code.get(code)
                 if city:
                     city.is_active = True
                     activated_count += 1
@@ -271,13 +286,14 @@ class CityService:
                     self.db.add(new_city)
                     activated_count += 1
 
-            self.db.commit()
+            await self.db.commit()
             logger.info(f"✅ Updated {activated_count} active cities in database")
+            await city_catalog.refresh(self.db)
             return activated_count
 
         except Exception as e:
             logger.error(f"❌ Error updating active cities: {e}")
-            self.db.rollback()
+            await self.db.rollback()
             return 0
 
     async def save_active_cities(self, active_codes: list):
@@ -286,42 +302,31 @@ class CityService:
 
         try:
             # Помечаем все города как неактивные
-            self.db.query(City).update({City.is_active: False})
+            await self.db.execute(update(City).values(is_active=False))
 
             # Помечаем активные города
+            result = await self.db.execute(select(City).where(City.code.in_(active_codes)))
+            cities_by_code = {city.code: city for city in result.scalars().all()}
+
             activated_count = 0
             for code in active_codes:
-                city = self.db.query(City).filter(City.code == code).first()
+                city = cities_by_code.get(code)
                 if city:
                     city.is_active = True
                     activated_count += 1
                 else:
                     logger.warning(f"⚠️ City {code} not found in database")
 
-            self.db.commit()
+            await self.db.commit()
             logger.info(f"✅ Saved {activated_count} active cities")
+            await city_catalog.refresh(self.db)
 
         except Exception as e:
             logger.error(f"❌ Error saving active cities: {e}")
-            self.db.rollback()
+            await self.db.rollback()
             raise
 
-    def get_cities_for_frontend(self) -> list:
-        """Получить города в формате для фронтенда"""
-        from models import City
-
-        cities = self.db.query(City).filter(City.is_active == True).order_by(City.name_ru).all()
-
-        result = []
-        for city in cities:
-            result.append(
-                {
-                    "value": city.code,
-                    "label": f"{city.name_ru} ({city.code})",
-                    "name_ru": city.name_ru,
-                    "name_en": city.name_en,
-                    "country_ru": city.country_ru,
-                }
-            )
-
-        return result
+    async def get_cities_for_frontend(self) -> list:
+        """Получить города в формате для фронтенда (уже отсортированы в справочнике)"""
+        await city_catalog.ensure_loaded(self.db)
+        return city_catalog.get_frontend_payload()
@@ -1,8 +1,10 @@
 import asyncio
 import selectors
 
+import json_codec
 from config import settings
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -19,11 +21,37 @@ engine = create_engine(
     pool_size=20,  # Увеличиваем пул соединений
     max_overflow=30,  # Увеличиваем временные соединения
     echo=False,  # Выключаем логирование SQL
+    json_serializer=json_codec.dumps_str,  # JSONB через orjson
+    json_deserializer=json_codec.loads,
 )
 
 # Создаем SessionLocal класс
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def _async_database_url(url: str) -> str:
+    """Тот же DATABASE_URL, но с драйвером asyncpg"""
+    if "+psycopg2" in url:
+        return url.replace("+psycopg2", "+asyncpg", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url
+
+
+# Асинхронный engine для всех обработчиков запросов и фоновых задач - не блокирует event loop
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL or _async_database_url(settings.DATABASE_URL),
+    pool_pre_ping=True,
+    pool_recycle=300,
+    pool_size=20,
+    max_overflow=30,
+    echo=False,
+    json_serializer=json_codec.dumps_str,
+    json_deserializer=json_codec.loads,
+)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 # Базовый класс для моделей
 Base = declarative_base()
 
@@ -37,8 +65,89 @@ def get_db():
         db.close()
 
 
+# Идемпотентные изменения схемы для уже существующих баз (create_all не меняет таблицы)
+SCHEMA_UPGRADES = [
+    # Уникальный ключ кеша для пакетного INSERT ... ON CONFLICT; перед этим убираем дубли
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'uq_flight_cache_key') THEN
+            DELETE FROM flight_cache a
+            USING flight_cache b
+            WHERE a.origin_city_code = b.origin_city_code
+              AND a.destination_city_code = b.destination_city_code
+              AND a.flight_date = b.flight_date
+              AND a.promo_code IS NOT DISTINCT FROM b.promo_code
+              AND a.adults_count IS NOT DISTINCT FROM b.adults_count
+              AND (a.expires_at, a.ctid) < (b.expires_at, b.ctid);
+            ALTER TABLE flight_cache ADD CONSTRAINT uq_flight_cache_key UNIQUE NULLS NOT DISTINCT
+                (origin_city_code, destination_city_code, flight_date, promo_code, adults_count);
+        END IF;
+    END $$;
+    """,
+    # Самый дешевый тариф дня извлекается при записи в кеш
+    "ALTER TABLE flight_cache ADD COLUMN IF NOT EXISTS cheapest_flight_id VARCHAR(100)",
+    "ALTER TABLE flight_cache ADD COLUMN IF NOT EXISTS fare_family VARCHAR(50)",
+    """
+    CREATE INDEX IF NOT EXISTS idx_flight_cache_origin_price
+        ON flight_cache(origin_city_code, destination_city_code, min_price)
+    """,
+    # Отслеживание изменений цен для адаптивного TTL
+    "ALTER TABLE flight_cache ADD COLUMN IF NOT EXISTS content_hash VARCHAR(32)",
+    "ALTER TABLE flight_cache ADD COLUMN IF NOT EXISTS last_changed_at TIMESTAMP WITH TIME ZONE",
+    "ALTER TABLE flight_cache ADD COLUMN IF NOT EXISTS fetch_count INTEGER DEFAULT 0",
+    "ALTER TABLE flight_cache ADD COLUMN IF NOT EXISTS change_count INTEGER DEFAULT 0",
+    # Сжатая проекция дня для view=summary/calendar
+    "ALTER TABLE flight_cache ADD COLUMN IF NOT EXISTS summary JSONB",
+    # История цен: секция для дат вне созданных месяцев, чтобы запись никогда не падала
+    "CREATE TABLE IF NOT EXISTS price_observations_default PARTITION OF price_observations DEFAULT",
+    # Очередь повторов: одна активная задача на дату (сначала убираем уже накопившиеся дубли)
+    """
+    DELETE FROM flight_retry_queue t
+    USING flight_retry_queue d
+    WHERE t.status IN ('pending', 'running') AND d.status IN ('pending', 'running')
+      AND t.origin_city_code = d.origin_city_code AND t.destination_city_code = d.destination_city_code
+      AND t.flight_date = d.flight_date AND COALESCE(t.promo_code, '') = COALESCE(d.promo_code, '')
+      AND (t.created_at, t.id) > (d.created_at, d.id)
+    """,
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS uq_flight_retry_active
+        ON flight_retry_queue(origin_city_code, destination_city_code, flight_date, COALESCE(promo_code, ''))
+        WHERE status IN ('pending', 'running')
+    """,
+    # Календарь цен: один раз заполняем из уже накопленного кеша
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM fare_calendar LIMIT 1) THEN
+            INSERT INTO fare_calendar
+                (origin_city_code, destination_city_code, promo_code, flight_date, min_price, fare_family, updated_at)
+            SELECT origin_city_code, destination_city_code, COALESCE(promo_code, ''), flight_date,
+                   min_price, fare_family, COALESCE(search_date, now())
+            FROM flight_cache
+            ON CONFLICT DO NOTHING;
+        END IF;
+    END $$;
+    """,
+]
+
+
+# Асинхронная dependency для FastAPI
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 # Функция для создания таблиц
 def create_tables():
     from models import Base
+    from price_history import partition_ddl, partition_months
 
     Base.metadata.create_all(bind=engine)
+
+    with engine.begin() as conn:
+        for statement in SCHEMA_UPGRADES:
+            conn.execute(text(statement))
+        # Секции истории цен - до первого запроса, чтобы текущие месяцы не копились в DEFAULT
+        for month in partition_months():
+            conn.execute(text(partition_ddl(month)))
@@ -0,0 +1,337 @@
+# event_bus.py
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+import json_codec
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DROP_NEWEST = "drop_newest"
+
+
+class EventBus:
+    """Неблокирующая отправка событий в Kafka.
+
+    publish() только кладет событие в ограниченный буфер в памяти - эндпоинты
+    не ждут ни брокер, ни сериализацию. Буфер разбирает отдельный поток:
+    пачками до EVENT_BUS_BATCH_SIZE событий раз в EVENT_BUS_LINGER_MS передает
+    их KafkaProducer (у него свои linger/batch/сжатие). При переполнении буфера
+    выбрасывается самое старое (drop_oldest) или новое (drop_newest) событие -
+    publish() вызывается из event loop и не ждет никогда. Пока Kafka недоступна,
+    события пишутся в файл EVENT_BUS_SPOOL_PATH и отправляются после переподключения.
+    """
+
+    def __init__(self):
+        self._buffer: deque = deque()
+        self._cond = threading.Condition()
+        self._spool_lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._producer = None
+        self._last_connect_attempt = 0.0
+        self._latencies: deque = deque(maxlen=1000)  # enqueue -> подтверждение брокера, мс
+        self.stats = {
+            "published": 0,
+            "dropped": 0,
+            "sent": 0,
+            "failed": 0,
+            "spooled": 0,
+            "spool_replayed": 0,
+            "spool_dropped": 0,
+            "spool_corrupt": 0,  # строки файла, которые не удалось разобрать при досылке
+            "batches": 0,
+            "drainer_errors": 0,
+        }
+
+    @property
+    def connected(self) -> bool:
+        return self._producer is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="event-bus", daemon=True)
+        self._thread.start()
+
+    def connect(self) -> bool:
+        """Создать KafkaProducer; блокирующий вызов - из lifespan через asyncio.to_thread"""
+        with self._connect_lock:
+            # Подключаются и lifespan, и поток шины - второй раз продюсер не нужен
+            if self._producer is not None:
+                return True
+            return self._connect()
+
+    def _connect(self) -> bool:
+        from kafka import KafkaProducer
+
+        self._last_connect_attempt = time.monotonic()
+        try:
+            producer = KafkaProducer(
+                bootstrap_servers=settings.KAFKA_BOOTSTRAP_SERVERS.split(","),
+                value_serializer=json_codec.dumps,
+                linger_ms=settings.KAFKA_LINGER_MS,
+                batch_size=settings.KAFKA_BATCH_SIZE_BYTES,
+                compression_type=settings.KAFKA_COMPRESSION or None,
+                retries=3,
+                request_timeout_ms=10000,
+                max_block_ms=settings.KAFKA_MAX_BLOCK_MS,
+            )
+            # Тестовый запрос для проверки подключения
+            producer.send("health-check", {"status": "test"})
+        except Exception as e:
+            logger.warning(f"Kafka connection failed: {e}")
+            return False
+
+        self._producer = producer
+        logger.info("✅ Kafka connected successfully")
+        with self._cond:
+            self._cond.notify()
+        return True
+
+    def publish(self, topic: str, event: Dict) -> bool:
+        """Поставить событие в очередь; False - событие выброшено"""
+        with self._cond:
+            if len(self._buffer) >= settings.EVENT_BUS_BUFFER_SIZE:
+                self.stats["dropped"] += 1
+                if settings.EVENT_BUS_OVERFLOW_POLICY == OVERFLOW_DROP_NEWEST:
+                    return False
+                self._buffer.popleft()
+
+            self._buffer.append((topic, event, time.monotonic()))
+            self.stats["published"] += 1
+            if len(self._buffer) >= settings.EVENT_BUS_BATCH_SIZE:
+                self._cond.notify_all()
+        return True
+
+    def _take_batch(self) -> list:
+        """Дождаться пачки или истечения linger и забрать ее из буфера"""
+        linger = settings.EVENT_BUS_LINGER_MS / 1000
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._stopping or len(self._buffer) >= settings.EVENT_BUS_BATCH_SIZE, timeout=linger
+            )
+            batch = [self._buffer.popleft() for _ in range(min(len(self._buffer), settings.EVENT_BUS_BATCH_SIZE))]
+        return batch
+
+    def _run(self):
+        while True:
+            try:
+                batch = self._take_batch()
+                if batch:
+                    self.stats["batches"] += 1
+                    self._send_batch(batch)
+                elif self._stopping:
+                    return
+
+                if self._stopping:
+                    continue
+                if self._producer is None:
+                    if time.monotonic() - self._last_connect_attempt > settings.EVENT_BUS_RECONNECT_SECONDS:
+                        self.connect()
+                elif not self._buffer:
+                    self._replay_spool()
+            except Exception as e:
+                # Поток шины не должен умирать: иначе буфер переполняется и все события теряются
+                self.stats["drainer_errors"] += 1
+                logger.error(f"Event bus drainer error: {e}", exc_info=True)
+                time.sleep(1)
+
+    def _send_batch(self, batch: list):
+        producer = self._producer
+        if producer is None:
+            self._spool((topic, event) for topic, event, _ in batch)
+            return
+
+        for index, (topic, event, enqueued_at) in enumerate(batch):
+            try:
+                future = producer.send(topic, event)
+                future.add_callback(self._on_sent, enqueued_at)
+                future.add_errback(self._on_failed, topic, event)
+            except Exception as e:
+                # Брокер недоступен дольше KAFKA_MAX_BLOCK_MS - остаток пачки в файл, переподключимся позже
+                logger.error(f"Kafka send to {topic} failed, spooling: {e}")
+                self.stats["failed"] += 1
+                self._producer = None
+                self._close_producer(producer)
+                self._spool((t, ev) for t, ev, _ in batch[index:])
+                return
+
+    def _on_sent(self, enqueued_at: float, _metadata):
+        self.stats["sent"] += 1
+        self._latencies.append((time.monotonic() - enqueued_at) * 1000)
+
+    def _on_failed(self, topic: str, event: Dict, error):
+        logger.error(f"Kafka delivery to {topic} failed: {error}")
+        self.stats["failed"] += 1
+        self._spool([(topic, event)])
+
+    def _spool(self, events):
+        """Дописать события в файл до возвращения Kafka"""
+        events = list(events)
+        path = settings.EVENT_BUS_SPOOL_PATH
+        with self._spool_lock:
+            if not path or self._spool_size() > settings.EVENT_BUS_SPOOL_MAX_MB * 1024 * 1024:
+                self.stats["spool_dropped"] += len(events)
+                return
+            try:
+                with open(path, "ab") as f:
+                    for topic, event in events:
+                        f.write(json_codec.dumps({"topic": topic, "event": event}) + b"\n")
+                self.stats["spooled"] += len(events)
+            except OSError as e:
+                logger.error(f"Event spool write failed: {e}")
+                self.stats["spool_dropped"] += len(events)
+
+    def _spool_size(self) -> int:
+        try:
+            return os.path.getsize(settings.EVENT_BUS_SPOOL_PATH)
+        except OSError:
+            return 0
+
+    def _replay_spool(self):
+        """Дослать накопленное в файле пачками по EVENT_BUS_BATCH_SIZE.
+
+        Файл читается построчно, а не целиком. После каждой пачки позиция
+        сохраняется в {файл}.replay.offset: после рестарта досылка продолжится
+        с нее, без повторной отправки уже отправленного. Если Kafka снова
+        пропала или пришли живые события, досылка прерывается до следующего раза.
+        """
+        path = settings.EVENT_BUS_SPOOL_PATH
+        if not path:
+            return
+        replay_path = f"{path}.replay"
+        offset_path = f"{replay_path}.offset"
+        # Файл досылки, оставшийся после падения процесса, не затираем - досылаем его
+        if not os.path.exists(replay_path):
+            if not self._spool_size():
+                return
+            with self._spool_lock:
+                try:
+                    os.replace(path, replay_path)
+                except OSError:
+                    return
+            self._remove_quietly(offset_path)
+
+        replayed = 0
+        corrupt = 0
+        finished = False
+        try:
+            with open(replay_path, "rb") as f:
+                f.seek(self._read_offset(offset_path))
+                chunk = []
+                for line in iter(f.readline, b""):
+                    if not line.strip():
+                        continue
+                    try:
+                        item = json_codec.loads(line)
+                        chunk.append((item["topic"], item["event"]))
+                    except (ValueError, KeyError, TypeError):
+                        # Например, строка, оборванная при остановке пода
+                        corrupt += 1
+                    if len(chunk) < settings.EVENT_BUS_BATCH_SIZE:
+                        continue
+                    self._send_replayed(chunk)
+                    replayed += len(chunk)
+                    chunk = []
+                    self._write_offset(offset_path, f.tell())
+                    if self._producer is None or self._buffer or self._stopping:
+                        return
+                if chunk:
+                    self._send_replayed(chunk)
+                    replayed += len(chunk)
+                finished = True
+        except OSError as e:
+            # Файл не читается - повторять бессмысленно
+            logger.error(f"Event spool read failed: {e}")
+            finished = True
+        finally:
+            if finished:
+                self._remove_quietly(replay_path)
+                self._remove_quietly(offset_path)
+            if corrupt:
+                self.stats["spool_corrupt"] += corrupt
+                logger.warning(f"Skipped {corrupt} corrupt spooled events")
+            if replayed:
+                self.stats["spool_replayed"] += replayed
+                logger.info(f"📤 Replayed {replayed} spooled events")
+
+    def _send_replayed(self, events: list):
+        now = time.monotonic()
+        self._send_batch([(topic, event, now) for topic, event in events])
+
+    @staticmethod
+    def _read_offset(offset_path: str) -> int:
+        try:
+            with open(offset_path) as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    @staticmethod
+    def _write_offset(offset_path: str, offset: int):
+        tmp_path = f"{offset_path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(offset))
+        os.replace(tmp_path, offset_path)
+
+    @staticmethod
+    def _remove_quietly(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _close_producer(producer):
+        try:
+            producer.close(timeout=1)
+        except Exception:
+            pass
+
+    def close(self, timeout: float = 5.0):
+        """Отправить то, что осталось в буфере, и закрыть продюсер"""
+        if self._thread is not None:
+            with self._cond:
+                self._stopping = True
+                self._cond.notify_all()
+            self._thread.join(timeout)
+            self._thread = None
+        if self._buffer:
+            self._spool((topic, event) for topic, event, _ in self._buffer)
+            self._buffer.clear()
+        if self._producer is not None:
+            try:
+                self._producer.flush(timeout)
+            except Exception as e:
+                logger.warning(f"Kafka flush on shutdown failed: {e}")
+            self._close_producer(self._producer)
+            self._producer = None
+
+    def get_stats(self) -> Dict:
+        latencies = sorted(self._latencies)
+
+        def percentile(q: float) -> Optional[float]:
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 2) if latencies else None
+
+        return {
+            **self.stats,
+            "connected": self.connected,
+            "buffered": len(self._buffer),
+            "buffer_size": settings.EVENT_BUS_BUFFER_SIZE,
+            "overflow_policy": settings.EVENT_BUS_OVERFLOW_POLICY,
+            "spool_bytes": self._spool_size() if settings.EVENT_BUS_SPOOL_PATH else 0,
+            "produce_latency_ms_p50": percentile(0.5),
+            "produce_latency_ms_p99": percentile(0.99),
+        }
+
+
+# Общая шина событий процесса
+event_bus = EventBus()
@@ -0,0 +1,179 @@
+# fare_calendar.py
+import calendar
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from config import settings
+from models import FareCalendarDay
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+
+def _month_bounds(month: str) -> tuple:
+    """Месяц "YYYY-MM" -> (первый день, последний день, число дней)"""
+    first = datetime.strptime(month, "%Y-%m").date()
+    days_in_month = calendar.monthrange(first.year, first.month)[1]
+    return first, first.replace(day=days_in_month), days_in_month
+
+
+def _fresh_only() -> tuple:
+    """Условия свежести дня: вылет не в прошлом и цена не старше FLIGHT_CACHE_MAX_STALE_HOURS.
+
+    Календарь обновляется только при записи в кеш, поэтому без этих условий
+    маршрут, который давно никто не искал, показывал бы цены многодневной давности.
+    """
+    return (
+        FareCalendarDay.flight_date >= date.today(),
+        FareCalendarDay.updated_at
+        > datetime.now(timezone.utc) - timedelta(hours=settings.FLIGHT_CACHE_MAX_STALE_HOURS),
+    )
+
+
+class FareCalendarService:
+    """Календарь минимальных цен по дням (таблица fare_calendar).
+
+    Строки обновляются в той же транзакции, что и flight_cache, поэтому
+    календарь месяца читается одним индексным запросом по узкой таблице,
+    без JSONB. Ответ - компактные массивы по дням месяца.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def upsert_days(self, origin: str, destination: str, days: List[Dict], promo_code: Optional[str]):
+        """Обновить дни маршрута в текущей транзакции (commit делает вызывающий).
+
+        days: [{"flight_date": date, "min_price": ..., "fare_family": ..., "updated_at": ...}]
+        """
+        if not days:
+            return
+
+        stmt = insert(FareCalendarDay).values(
+            [
+                {
+                    "origin_city_code": origin,
+                    "destination_city_code": destination,
+                    "promo_code": promo_code or "",
+                    **day,
+                }
+                for day in days
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["origin_city_code", "destination_city_code", "promo_code", "flight_date"],
+            set_={
+                "min_price": stmt.excluded.min_price,
+                "fare_family": stmt.excluded.fare_family,
+                "updated_at": stmt.excluded.updated_at,
+            },
+        )
+        await self.db.execute(stmt)
+
+    async def month_grid(self, origin: str, destination: str, month: str, promo_code: Optional[str] = None) -> Dict:
+        """Календарь маршрута на месяц: массивы длиной в число дней, null - цены нет (или она устарела)"""
+        first, last, days_in_month = _month_bounds(month)
+        result = await self.db.execute(
+            select(
+                FareCalendarDay.flight_date,
+                FareCalendarDay.min_price,
+                FareCalendarDay.fare_family,
+                FareCalendarDay.updated_at,
+            ).where(
+                FareCalendarDay.origin_city_code == origin,
+                FareCalendarDay.destination_city_code == destination,
+                FareCalendarDay.promo_code == (promo_code or ""),
+                FareCalendarDay.flight_date.between(first, last),
+                *_fresh_only(),
+            )
+        )
+
+        prices: List[Optional[float]] = [None] * days_in_month
+        fare_families: List[Optional[str]] = [None] * days_in_month
+        updated_at: List[Optional[str]] = [None] * days_in_month
+        for flight_date, min_price, fare_family, day_updated_at in result.all():
+            prices[flight_date.day - 1] = float(min_price) if min_price is not None else None
+            fare_families[flight_date.day - 1] = fare_family
+            updated_at[flight_date.day - 1] = day_updated_at.isoformat()
+
+        return {
+            "origin": origin,
+            "destination": destination,
+            "month": month,
+            "promo_code": promo_code,
+            "prices": prices,
+            "fare_families": fare_families,
+            "updated_at": updated_at,
+        }
+
+    async def month_all_destinations(self, origin: str, month: str, promo_code: Optional[str] = None) -> Dict:
+        """Все направления из города за месяц: матрицы цен и времени обновления [направление][день]"""
+        first, last, days_in_month = _month_bounds(month)
+        result = await self.db.execute(
+            select(
+                FareCalendarDay.destination_city_code,
+                FareCalendarDay.flight_date,
+                FareCalendarDay.min_price,
+                FareCalendarDay.updated_at,
+            )
+            .where(
+                FareCalendarDay.origin_city_code == origin,
+                FareCalendarDay.promo_code == (promo_code or ""),
+                FareCalendarDay.flight_date.between(first, last),
+                *_fresh_only(),
+            )
+            .order_by(FareCalendarDay.destination_city_code)
+        )
+
+        rows_by_destination: Dict[str, List[Optional[float]]] = {}
+        updated_by_destination: Dict[str, List[Optional[str]]] = {}
+        for destination, flight_date, min_price, day_updated_at in result.all():
+            row = rows_by_destination.setdefault(destination, [None] * days_in_month)
+            row[flight_date.day - 1] = float(min_price) if min_price is not None else None
+            updated_row = updated_by_destination.setdefault(destination, [None] * days_in_month)
+            updated_row[flight_date.day - 1] = day_updated_at.isoformat()
+
+        destinations = list(rows_by_destination)
+        prices = [rows_by_destination[destination] for destination in destinations]
+        min_prices = [min((p for p in row if p is not None), default=None) for row in prices]
+
+        return {
+            "origin": origin,
+            "month": month,
+            "promo_code": promo_code,
+            "days_in_month": days_in_month,
+            "destinations": destinations,
+            "min_prices": min_prices,
+            "prices": prices,
+            "updated_at": [updated_by_destination[destination] for destination in destinations],
+        }
+
+    async def price_rows(
+        self, origin: str, date_from: date, date_to: date, promo_code: Optional[str] = None
+    ) -> Tuple[List[str], List[date], List[float]]:
+        """Свежие цены всех направлений из города за период - три параллельных списка"""
+        result = await self.db.execute(
+            select(FareCalendarDay.destination_city_code, FareCalendarDay.flight_date, FareCalendarDay.min_price).where(
+                FareCalendarDay.origin_city_code == origin,
+                FareCalendarDay.promo_code == (promo_code or ""),
+                FareCalendarDay.flight_date.between(date_from, date_to),
+                FareCalendarDay.min_price.is_not(None),
+                *_fresh_only(),
+            )
+        )
+        rows = result.all()
+        return (
+            [row.destination_city_code for row in rows],
+            [row.flight_date for row in rows],
+            [float(row.min_price) for row in rows],
+        )
+
+    @staticmethod
+    def validate_month(month: str) -> Optional[date]:
+        try:
+            return datetime.strptime(month, "%Y-%m").date()
+        except ValueError:
+            return None
@@ -0,0 +1,121 @@
+# fare_model.py
+import sys
+from array import array
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+NO_FAMILY = -1
+
+
+def intern_code(value: Optional[str]) -> Optional[str]:
+    """Коды городов и названия тарифов повторяются тысячи раз - храним одну копию строки"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+@dataclass(frozen=True, slots=True)
+class FareDay:
+    """Цены одного дня в компактном виде, без вложенных dict/list ответа API.
+
+    Каждый тариф - позиция в трех параллельных массивах: цена (double),
+    индекс рейса в flight_ids и индекс семейства в families (-1 - без семейства).
+    Строится один раз из ответа API (from_api), дальше минимальная цена,
+    цены по семействам и сжатая проекция считаются по массивам.
+    """
+
+    date: str
+    origin: str
+    destination: str
+    flights_count: int
+    flight_ids: Tuple[str, ...]
+    families: Tuple[str, ...]
+    prices: array  # 'd'
+    fare_flight: array  # 'H', индекс в flight_ids
+    fare_family: array  # 'h', индекс в families или NO_FAMILY
+
+    @classmethod
+    def from_api(cls, day_data: Dict) -> "FareDay":
+        """Разобрать ответ API Победы на одну дату ({"date", "flights", "prices", ...})"""
+        flight_ids = []
+        families = []
+        family_index: Dict[str, int] = {}
+        prices = array("d")
+        fare_flight = array("H")
+        fare_family = array("h")
+        add_price, add_flight, add_family = prices.append, fare_flight.append, fare_family.append
+
+        for price_list in day_data.get("prices") or []:
+            for flight_id, fares in price_list.items():
+                flight_position = len(flight_ids)
+                priced = False
+                for price_info in fares:
+                    price = price_info.get("price")
+                    if price is None:
+                        continue
+                    family = price_info.get("brand")
+                    if family is None:
+                        family_position = NO_FAMILY
+                    else:
+                        family_position = family_index.get(family)
+                        if family_position is None:
+                            family_position = family_index[family] = len(families)
+                            families.append(intern_code(family))
+
+                    add_price(float(price))
+                    add_flight(flight_position)
+                    add_family(family_position)
+                    priced = True
+                if priced:
+                    flight_ids.append(flight_id)
+
+        return cls(
+            date=day_data.get("date"),
+            origin=intern_code(day_data.get("origin")),
+            destination=intern_code(day_data.get("destination")),
+            flights_count=len(day_data.get("flights") or []),
+            flight_ids=tuple(flight_ids),
+            families=tuple(families),
+            prices=prices,
+            fare_flight=fare_flight,
+            fare_family=fare_family,
+        )
+
+    @property
+    def has_prices(self) -> bool:
+        return bool(self.prices)
+
+    @property
+    def min_price(self) -> Optional[float]:
+        return min(self.prices) if self.prices else None
+
+    def cheapest(self) -> Tuple[Optional[float], Optional[str], Optional[str]]:
+        """Самый дешевый тариф: (цена, id цепочки рейсов, семейство); при равенстве - первый в ответе"""
+        if not self.prices:
+            return None, None, None
+        min_price = min(self.prices)
+        position = self.prices.index(min_price)
+        family_position = self.fare_family[position]
+        family = self.families[family_position] if family_position != NO_FAMILY else None
+        return min_price, self.flight_ids[self.fare_flight[position]], family
+
+    def family_minimums(self) -> Dict[str, float]:
+        """Минимальная цена по каждому семейству тарифов"""
+        by_family: Dict[str, float] = {}
+        for price, family_position in zip(self.prices, self.fare_family):
+            if family_position == NO_FAMILY:
+                continue
+            family = self.families[family_position]
+            if price < by_family.get(family, float("inf")):
+                by_family[family] = price
+        return by_family
+
+    def to_summary(self, version: str) -> Dict:
+        """Сжатая проекция дня для view=summary/calendar"""
+        min_price, cheapest_flight_id, fare_family = self.cheapest()
+        return {
+            "date": self.date,
+            "min_price": min_price,
+            "fare_family": fare_family,
+            "cheapest_flight_id": cheapest_flight_id,
+            "flights_count": self.flights_count,
+            "version": version,
+        }
@@ -0,0 +1,214 @@
+# flight_cache.py
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import json_codec
+from cache_key import CacheKey
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Загрузчик из Postgres: {CacheKey: (данные дня, expires_at)} для запрошенных ключей
+DbLoader = Callable[[List[CacheKey]], Awaitable[Dict[CacheKey, Tuple[Dict, datetime]]]]
+
+
+class TieredFlightCache:
+    """Многоуровневый кеш ответов API Победы по дням.
+
+    L1 - небольшой LRU в памяти процесса, L2 - Redis (MGET/pipeline),
+    L3 - таблица flight_cache в Postgres. Найденное на нижнем уровне
+    поднимается на верхние. Если Redis недоступен, L2 на время
+    пропускается и запросы идут сразу в Postgres.
+
+    L1 хранит сериализованный JSON, как и Redis: каждое попадание отдает
+    вызывающему новый объект, и его изменения не портят кеш процесса.
+    """
+
+    REDIS_PREFIX = "pobeda:flights"
+
+    def __init__(self, max_entries: int, l1_ttl_seconds: int):
+        self.max_entries = max_entries
+        self.l1_ttl_seconds = l1_ttl_seconds
+        self._lru: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._redis = None
+        self._redis_retry_at = 0.0
+
+        self.stats = {
+            "lookups": 0,
+            "l1_hits": 0,
+            "l2_hits": 0,
+            "l3_hits": 0,
+            "misses": 0,
+            "redis_errors": 0,
+            "l2_decode_errors": 0,
+        }
+
+    def attach_redis(self, redis_client):
+        """Включить Redis как второй уровень кеша"""
+        self._redis = redis_client
+        logger.info("✅ Flight cache L2 via Redis")
+
+    def clear_l1(self):
+        """Сбросить память процесса (L2 и L3 не трогаются)"""
+        self._lru.clear()
+
+    # --- L1 ---
+
+    def _l1_get(self, key: str, now: float) -> Optional[Dict]:
+        entry = self._lru.get(key)
+        if entry is None:
+            return None
+        expires, encoded = entry
+        if expires <= now:
+            del self._lru[key]
+            return None
+        self._lru.move_to_end(key)
+        return json_codec.loads(encoded)
+
+    def _l1_put(self, key: str, encoded: bytes, ttl_seconds: float):
+        """ttl_seconds - сколько запись еще живет уровнем ниже; в L1 не дольше"""
+        if ttl_seconds <= 0:
+            return
+        self._lru[key] = (time.monotonic() + min(ttl_seconds, self.l1_ttl_seconds), encoded)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    # --- L2 ---
+
+    def _redis_available(self) -> bool:
+        return self._redis is not None and time.monotonic() >= self._redis_retry_at
+
+    def _redis_failed(self, error: Exception):
+        self.stats["redis_errors"] += 1
+        self._redis_retry_at = time.monotonic() + settings.FLIGHT_CACHE_REDIS_RETRY_SECONDS
+        logger.warning(f"Redis flight cache unavailable, falling back to Postgres: {error}")
+
+    def _redis_get_many(self, storage_keys: List[str]) -> List[Tuple[Optional[bytes], int]]:
+        """Значения и оставшийся TTL (мс) одним pipeline (выполняется в пуле потоков)"""
+        redis_keys = [f"{self.REDIS_PREFIX}:{storage_key}" for storage_key in storage_keys]
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.mget(redis_keys)
+        for redis_key in redis_keys:
+            pipe.pttl(redis_key)
+        values, *ttls_ms = pipe.execute()
+        return list(zip(values, ttls_ms))
+
+    def _redis_set_many(self, items: List[Tuple[str, bytes, int]]):
+        """Записать пачку ключей одним pipeline (выполняется в пуле потоков)"""
+        pipe = self._redis.pipeline(transaction=False)
+        for key, encoded, ttl_seconds in items:
+            pipe.set(f"{self.REDIS_PREFIX}:{key}", encoded, ex=ttl_seconds)
+        pipe.execute()
+
+    async def _store(self, items: List[Tuple[str, Dict, int]]):
+        items = [(key, json_codec.dumps(data), ttl) for key, data, ttl in items if ttl > 0]
+        if not items:
+            return
+
+        for key, encoded, ttl_seconds in items:
+            self._l1_put(key, encoded, ttl_seconds)
+
+        if self._redis_available():
+            try:
+                await asyncio.to_thread(self._redis_set_many, items)
+            except Exception as e:
+                self._redis_failed(e)
+
+    # --- публичный интерфейс ---
+
+    async def get_many(self, keys: List[CacheKey], loader: DbLoader, kind: str = "full") -> Dict[CacheKey, Dict]:
+        """Данные по ключам: сначала память, потом Redis, потом Postgres. Ключи ответа - те же объекты CacheKey"""
+        self.stats["lookups"] += len(keys)
+        found: Dict[CacheKey, Dict] = {}
+        missing: List[CacheKey] = []
+
+        now = time.monotonic()
+        for key in keys:
+            data = self._l1_get(key.storage_key(kind), now)
+            if data is None:
+                missing.append(key)
+            else:
+                found[key] = data
+        self.stats["l1_hits"] += len(found)
+
+        if missing and self._redis_available():
+            storage_keys = [key.storage_key(kind) for key in missing]
+            try:
+                values = await asyncio.to_thread(self._redis_get_many, storage_keys)
+            except Exception as e:
+                self._redis_failed(e)
+                values = [(None, -2)] * len(storage_keys)
+
+            still_missing = []
+            for key, storage_key, (value, ttl_ms) in zip(missing, storage_keys, values):
+                if value is None:
+                    still_missing.append(key)
+                    continue
+                try:
+                    data = json_codec.loads(value)
+                except ValueError as e:
+                    # Битая или старого формата запись - промах L2, Postgres перезапишет ее
+                    logger.warning(f"Corrupt flight cache entry {storage_key}: {e}")
+                    self.stats["l2_decode_errors"] += 1
+                    still_missing.append(key)
+                    continue
+                found[key] = data
+                # В L1 не дольше, чем ключ проживет в Redis (-1 - ключ без срока)
+                self._l1_put(storage_key, value, self.l1_ttl_seconds if ttl_ms == -1 else ttl_ms / 1000)
+                self.stats["l2_hits"] += 1
+            missing = still_missing
+
+        if missing:
+            loaded = await loader(missing)
+            self.stats["l3_hits"] += len(loaded)
+            self.stats["misses"] += len(missing) - len(loaded)
+
+            now_utc = datetime.now(timezone.utc)
+            items = []
+            for key, (data, expires_at) in loaded.items():
+                found[key] = data
+                # TTL в Redis не дольше, чем живет строка в Postgres
+                items.append((key.storage_key(kind), data, int((expires_at - now_utc).total_seconds())))
+            await self._store(items)
+
+        return found
+
+    async def set_many(self, days: Dict[CacheKey, Tuple[Dict, datetime]], kind: str = "full"):
+        """Положить свежие данные {CacheKey: (данные, expires_at)} в L1 и L2 (Postgres пишет вызывающий)"""
+        now_utc = datetime.now(timezone.utc)
+        await self._store(
+            [
+                (key.storage_key(kind), data, int((expires_at - now_utc).total_seconds()))
+                for key, (data, expires_at) in days.items()
+            ]
+        )
+
+    def get_stats(self) -> Dict:
+        """Доля попаданий по уровням кеша"""
+        lookups = self.stats["lookups"]
+
+        def ratio(count: int) -> float:
+            return round(count / lookups, 3) if lookups else 0.0
+
+        return {
+            **self.stats,
+            "l1_entries": len(self._lru),
+            "l1_hit_ratio": ratio(self.stats["l1_hits"]),
+            "l2_hit_ratio": ratio(self.stats["l2_hits"]),
+            "l3_hit_ratio": ratio(self.stats["l3_hits"]),
+            "miss_ratio": ratio(self.stats["misses"]),
+            "redis_enabled": self._redis is not None,
+            "redis_available": self._redis_available(),
+        }
+
+
+# Кеш ответов по дням, общий на процесс
+flight_cache = TieredFlightCache(
+    max_entries=settings.FLIGHT_CACHE_L1_MAX_ENTRIES,
+    l1_ttl_seconds=settings.FLIGHT_CACHE_L1_TTL_SECONDS,
+)
@@ -1,28 +1,109 @@
 import asyncio
+import hashlib
+import json
 import logging
-import random
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
 
 import aiohttp
+from cache_key import CacheKey
+from config import settings
+from fare_calendar import FareCalendarService
+from fare_model import FareDay
+from flight_cache import flight_cache
+from http_client import pobeda_http
 from models import FlightCache
-from sqlalchemy.orm import Session
+from price_history import PriceHistoryService
+from rate_limiter import Priority, upstream_limiter
+from retry_queue import retry_queue
+from singleflight import flight_singleflight
+from sqlalchemy import case, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from stale_refresher import stale_refresher
 
 logger = logging.getLogger(__name__)
 
 
+def extract_cheapest_fare(day_data: Dict) -> Tuple[Optional[float], Optional[str], Optional[str]]:
+    """Самый дешевый тариф дня: (цена, id цепочки рейсов, семейство тарифа)"""
+    if not day_data or "prices" not in day_data:
+        return None, None, None
+    return FareDay.from_api(day_data).cheapest()
+
+
+def _parse_db_dates(dates: List[str]) -> List[date]:
+    """Даты "YYYY-MM-DD" для параметров asyncpg (строки в DATE он не принимает)"""
+    return [datetime.strptime(db_date, "%Y-%m-%d").date() for db_date in dates]
+
+
+def fare_family_prices(day_data: Dict) -> Dict[str, float]:
+    """Минимальная цена дня по каждому семейству тарифов"""
+    return FareDay.from_api(day_data).family_minimums()
+
+
+def project_day_summary(day_data: Dict, content_hash: str = None, fares: Optional[FareDay] = None) -> Dict:
+    """Сжатая проекция дня для view=summary/calendar - хранится рядом с полным ответом"""
+    fares = fares or FareDay.from_api(day_data)
+    return fares.to_summary(content_hash or day_content_hash(day_data))
+
+
+def day_has_data(day: Dict) -> bool:
+    """Есть ли в дне рейсы - для полного ответа API и для сжатой проекции"""
+    return bool(day.get("flights") or day.get("prices") or day.get("flights_count") or day.get("min_price"))
+
+
+def day_content_hash(day_data: Dict) -> str:
+    """Хеш всего ответа на день (рейсы, расписание и цены) - по нему видно, изменилось ли что-то с прошлого запроса"""
+    payload = json.dumps(day_data, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+def route_etag(versions: Dict[CacheKey, Tuple[Optional[str], datetime]], keys: List[CacheKey], view: str) -> str:
+    """Слабый ETag ответа маршрута из версий строк кеша (content_hash по датам)"""
+    parts = [view]
+    for key in keys:
+        content_hash = versions.get(key, (None, None))[0]
+        parts.append(f"{key}:{content_hash or '-'}")
+    return 'W/"' + hashlib.blake2b("|".join(parts).encode(), digest_size=16).hexdigest() + '"'
+
+
+def adaptive_ttl(days_out: int, fetch_count: int, change_count: int) -> timedelta:
+    """TTL строки кеша: короткий для ближайших дат и часто меняющихся цен, длинный для далеких и стабильных"""
+    if days_out <= 3:
+        base_hours = 1.0
+    elif days_out <= 14:
+        base_hours = settings.FLIGHT_CACHE_TTL_HOURS / 2
+    elif days_out <= 45:
+        base_hours = float(settings.FLIGHT_CACHE_TTL_HOURS)
+    else:
+        base_hours = settings.FLIGHT_CACHE_TTL_HOURS * 4
+
+    # Доля запросов, на которых цены изменились (со сглаживанием: без истории - 0.5)
+    volatility = (change_count + 1) / (fetch_count + 2)
+    hours = base_hours * 2 * (1 - volatility)
+
+    hours = max(settings.FLIGHT_CACHE_MIN_TTL_MINUTES / 60, min(hours, settings.FLIGHT_CACHE_MAX_TTL_HOURS))
+    return timedelta(hours=hours)
+
+
+def find_min_price_in_day(day_data: Dict) -> Optional[float]:
+    """Найти минимальную цену за день в ответе API Победы"""
+    return extract_cheapest_fare(day_data)[0]
+
+
+# Сколько записанных в кеш дней действительно изменились
+cache_write_stats = {"days_written": 0, "days_changed": 0, "days_unchanged": 0}
+
+
 class FlightService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession, priority: Priority = Priority.INTERACTIVE):
         self.db = db
-        self.base_url = "https://ticket.flypobeda.ru/websky/json"
-        self.headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-            "Accept": "application/json, text/plain, */*",
-            "Content-Type": "application/x-www-form-urlencoded;charset=UTF-8",
-            "Origin": "https://ticket.flypobeda.ru",
-            "Referer": "https://ticket.flypobeda.ru/websky/",
-        }
-        self.max_concurrent_requests = 3  # 3 одновременных запросов к API Победы (было 10 - у Победы анти-DDos защита)!
+        self.base_url = settings.POBEDA_API_BASE_URL
+        # Параллельность и частоту запросов к API Победы ограничивает общий upstream_limiter
+        # (у Победы анти-DDoS защита), priority определяет очередность среди всех вызывающих
+        self.priority = priority
 
     def _generate_month_dates(self) -> List[Dict]:
         """Генерируем даты на 30 дней вперед"""
@@ -49,69 +130,86 @@ class FlightService:
             current_date += timedelta(days=1)
         return dates
 
-    async def search_flights_month(self, origin: str, destination: str, promo_code: Optional[str] = None) -> Dict:
-        """Поиск рейсов на месяц вперед с информацией о полноте"""
+    async def search_flights_month(
+        self, origin: str, destination: str, promo_code: Optional[str] = None, view: str = "full"
+    ) -> Dict:
+        """Поиск рейсов на месяц вперед с информацией о полноте.
+
+        view="full" - дни как их вернуло API Победы, "summary" и "calendar" -
+        сжатые проекции дней (кеш отдает их без чтения JSONB).
+        """
+        projected = view != "full"
         dates = self._generate_month_dates()
         total_days = len(dates)
         logger.info(f"Searching flights {origin} -> {destination} for {total_days} dates")
 
         # Сначала проверяем кеш
-        date_strings = [date_info["db"] for date_info in dates]
-        cached_data = self._get_cached_flights_batch(origin, destination, date_strings, promo_code)
+        keys = self.cache_keys(origin, destination, dates, promo_code)
+        cached_data = await self._get_cached_flights_batch(keys, projected=projected)
 
         cached_results = []
-        uncached_dates = []
+        uncached = []  # [(date_info, CacheKey)]
 
-        for date_info in dates:
-            if date_info["db"] in cached_data:
-                cached_day = cached_data[date_info["db"]]
-                if cached_day.get("flights") or cached_day.get("prices"):
+        for date_info, key in zip(dates, keys):
+            if key in cached_data:
+                cached_day = cached_data[key]
+                if day_has_data(cached_day):
                     cached_results.append(cached_day)
             else:
-                uncached_dates.append(date_info)
-
-        logger.info(f"Found {len(cached_results)} cached with flights, {len(uncached_dates)} to fetch")
+                uncached.append((date_info, key))
+
+        # Stale-while-revalidate: недавно просроченные дни отдаем сразу, а обновляем в фоне
+        stale_days = 0
+        if uncached:
+            stale_data = await self._get_stale_flights_batch([key for _, key in uncached], projected)
+            stale_dates = [date_info for date_info, key in uncached if key in stale_data]
+            if stale_dates:
+                for date_info, key in uncached:
+                    if key not in stale_data:
+                        continue
+                    stale_day, age_seconds = stale_data[key]
+                    if day_has_data(stale_day):
+                        cached_results.append({**stale_day, "stale": True, "age_seconds": age_seconds})
+                uncached = [(date_info, key) for date_info, key in uncached if key not in stale_data]
+                stale_days = len(stale_dates)
+                stale_refresher.schedule(origin, destination, stale_dates, promo_code)
+        uncached_dates = [date_info for date_info, _ in uncached]
+
+        logger.info(
+            f"Found {len(cached_results)} cached with flights ({stale_days} stale), {len(uncached_dates)} to fetch"
+        )
 
         fresh_results = []
-        retry_results = []
+        retry_job_id = None
         is_complete = True  # Флаг полноты данных
 
         if uncached_dates:
-            # Первый проход
             fresh_results = await self._search_flights_parallel(origin, destination, uncached_dates, promo_code)
 
             # Фильтруем успешные результаты
-            valid_fresh_results = [r for r in fresh_results if r and (r.get("flights") or r.get("prices"))]
+            valid_fresh_results = [r for r in fresh_results if r and day_has_data(r)]
 
-            # Ищем даты с 403 ошибками
-            failed_dates: List[Dict] = []
-            for i, result in enumerate(fresh_results):
-                if result is None:  # 403 ошибка
-                    failed_dates.append(uncached_dates[i])
-                    is_complete = False  # Данные не полные!
+            # Даты без ответа (403/429, ошибки сети) - результаты приходят не по порядку, сверяем по ключу
+            answered = {
+                CacheKey.of(origin, destination, result["date"], promo_code) for result in fresh_results if result
+            }
+            failed_dates = [date_info for date_info, key in uncached if key not in answered]
 
-            # Сохраняем в кеш успешные результаты
-            if valid_fresh_results:
-                self._cache_flights_batch(origin, destination, valid_fresh_results, promo_code)
+            # Сохраняем в кеш все ответы, включая дни без рейсов - иначе их запрашивали бы каждый раз
+            answered_results = [result for result in fresh_results if result]
+            if answered_results:
+                await self._cache_flights_batch(origin, destination, answered_results, promo_code)
 
-            # Второй проход для 403 ошибок
+            # Не полученные даты - в очередь повторов, ответ отдаем сразу
             if failed_dates:
-                logger.info(f"Background retry for {len(failed_dates)} failed dates...")
-                retry_results = await self._search_flights_slow_retry(origin, destination, failed_dates, promo_code)
-
-                # Фильтруем успешные повторные попытки
-                valid_retry_results = [r for r in retry_results if r and (r.get("flights") or r.get("prices"))]
-
-                if valid_retry_results:
-                    self._cache_flights_batch(origin, destination, valid_retry_results, promo_code)
-                    valid_fresh_results.extend(valid_retry_results)
-
-                # Если после повторной попытки остались ошибки - данные не полные
-                if len(valid_retry_results) < len(failed_dates):
-                    is_complete = False
+                is_complete = False
+                retry_job_id = await retry_queue.enqueue(self.db, origin, destination, failed_dates, promo_code)
 
         # Объединяем все результаты
-        all_results = cached_results + (valid_fresh_results if uncached_dates else [])
+        fresh_days = valid_fresh_results if uncached_dates else []
+        if projected:
+            fresh_days = [project_day_summary(day) for day in fresh_days]
+        all_results = cached_results + fresh_days
 
         # ДЕБАГ
         days_with_data = len(all_results)
@@ -122,36 +220,10 @@ class FlightService:
             "total_days_searched": total_days,
             "days_with_data": days_with_data,
             "is_complete": is_complete,
-            "has_retry_data": len(retry_results) > 0,
+            "retry_job_id": retry_job_id,
+            "stale_days": stale_days,
         }
 
-    async def _search_flights_slow_retry(
-        self, origin: str, destination: str, dates: List[Dict], promo_code: str = None
-    ) -> List[Dict]:
-        """Медленный повторный поиск ТОЛЬКО для потенциальных дат"""
-        async with aiohttp.ClientSession() as session:
-            results = []
-
-            for date_info in dates:
-                try:
-                    # Большая пауза между запросами
-                    await asyncio.sleep(8 + random.random() * 4)  # 8-12 секунд
-
-                    result = await self._search_single_flight(
-                        session, origin, destination, date_info["api"], promo_code
-                    )
-                    if result and (result.get("flights") or result.get("prices")):
-                        results.append(result)
-                        logger.info(f"✅ Retry SUCCESS for {origin}-{destination} on {date_info['api']}")
-                    else:
-                        # Не добавляем пустые результаты
-                        logger.info(f"⏩ Retry SKIP for {origin}-{destination} on {date_info['api']} (no flights)")
-
-                except Exception as e:
-                    logger.error(f"❌ Retry error for {origin}-{destination} on {date_info['api']}: {e}")
-
-            return results
-
     async def search_flights_period(
         self,
         origin: str,
@@ -164,15 +236,15 @@ class FlightService:
         logger.info(f"Searching flights {origin} -> {destination} for {len(dates)} days ({months_ahead} months)")
 
         # ПАКЕТНАЯ проверка кеша
-        date_strings = [date_info["db"] for date_info in dates]
-        cached_data = self._get_cached_flights_batch(origin, destination, date_strings, promo_code)
+        keys = self.cache_keys(origin, destination, dates, promo_code)
+        cached_data = await self._get_cached_flights_batch(keys)
 
         cached_results = []
         uncached_dates = []
 
-        for date_info in dates:
-            if date_info["db"] in cached_data:
-                cached_results.append(cached_data[date_info["db"]])
+        for date_info, key in zip(dates, keys):
+            if key in cached_data:
+                cached_results.append(cached_data[key])
             else:
                 uncached_dates.append(date_info)
 
@@ -180,119 +252,388 @@ class FlightService:
 
         if uncached_dates:
             fresh_results = await self._search_flights_parallel(origin, destination, uncached_dates, promo_code)
-            self._cache_flights_batch(origin, destination, fresh_results, promo_code)
+            await self._cache_flights_batch(origin, destination, fresh_results, promo_code)
             return cached_results + fresh_results
 
         return cached_results
 
-    def _get_cached_flights_batch(
-        self, origin: str, destination: str, dates: List[str], promo_code: str = None
+    @staticmethod
+    def cache_keys(
+        origin: str, destination: str, dates: List[Dict], promo_code: Optional[str] = None, adults: int = 1
+    ) -> List[CacheKey]:
+        """Ключи кеша для дат из _generate_*_dates, в том же порядке"""
+        return [CacheKey.of(origin, destination, date_info["db"], promo_code, adults) for date_info in dates]
+
+    async def _get_cached_flights_batch(self, keys: List[CacheKey], projected: bool = False) -> Dict[CacheKey, Dict]:
+        """ПАКЕТНАЯ проверка кеша для ключей одного маршрута: память процесса -> Redis -> Postgres"""
+        if not keys:
+            return {}
+
+        return await flight_cache.get_many(
+            keys,
+            loader=lambda missing: self._load_cached_flights_db(missing, projected),
+            kind="summary" if projected else "full",
+        )
+
+    @staticmethod
+    def _route_filter(keys: List[CacheKey]) -> list:
+        """Условия WHERE для ключей одного маршрута (ключи отличаются только датой)"""
+        route = keys[0]
+        return [
+            FlightCache.origin_city_code == route.origin,
+            FlightCache.destination_city_code == route.destination,
+            FlightCache.flight_date.in_([key.flight_date for key in keys]),
+            FlightCache.promo_code == route.promo_or_none,
+            FlightCache.adults_count == route.adults,
+        ]
+
+    @staticmethod
+    def _payload_column(projected: bool):
+        """Полный JSONB или сжатая проекция (у строк до появления summary - полный ответ)"""
+        if projected:
+            return func.coalesce(FlightCache.summary, FlightCache.flight_data).label("payload")
+        return FlightCache.flight_data.label("payload")
+
+    @staticmethod
+    def _as_projection(payload: Dict, projected: bool) -> Dict:
+        if projected and "flights" in payload:
+            return project_day_summary(payload)
+        return payload
+
+    async def _load_cached_flights_db(
+        self, keys: List[CacheKey], projected: bool = False
+    ) -> Dict[CacheKey, Tuple[Dict, datetime]]:
+        """Нижний уровень кеша - ОДИН запрос к БД для всех дат маршрута"""
+        result = await self.db.execute(
+            select(FlightCache.flight_date, self._payload_column(projected), FlightCache.expires_at).where(
+                *self._route_filter(keys), FlightCache.expires_at > func.now()
+            )
+        )
+
+        # Ключ строится из строки БД тем же CacheKey, что и у вызывающего
+        route = keys[0]
+        return {
+            route.with_date(flight_date): (self._as_projection(payload, projected), expires_at)
+            for flight_date, payload, expires_at in result.all()
+        }
+
+    async def _get_stale_flights_batch(
+        self, keys: List[CacheKey], projected: bool = False
+    ) -> Dict[CacheKey, Tuple[Dict, int]]:
+        """Просроченные, но не старше FLIGHT_CACHE_MAX_STALE_HOURS дни: {CacheKey: (данные, возраст в секундах)}"""
+        if not keys:
+            return {}
+
+        max_stale = timedelta(hours=settings.FLIGHT_CACHE_MAX_STALE_HOURS)
+        result = await self.db.execute(
+            select(FlightCache.flight_date, self._payload_column(projected), FlightCache.search_date).where(
+                *self._route_filter(keys),
+                FlightCache.expires_at <= func.now(),
+                FlightCache.expires_at > func.now() - max_stale,
+            )
+        )
+
+        now = datetime.now(timezone.utc)
+        route = keys[0]
+        return {
+            route.with_date(flight_date): (
+                self._as_projection(payload, projected),
+                int((now - search_date).total_seconds()) if search_date else None,
+            )
+            for flight_date, payload, search_date in result.all()
+        }
+
+    async def get_route_versions(self, keys: List[CacheKey]) -> Dict[CacheKey, Tuple[Optional[str], datetime]]:
+        """Версии строк кеша маршрута без чтения данных: {CacheKey: (content_hash, expires_at)}"""
+        if not keys:
+            return {}
+        result = await self.db.execute(
+            select(FlightCache.flight_date, FlightCache.content_hash, FlightCache.expires_at).where(
+                *self._route_filter(keys)
+            )
+        )
+        route = keys[0]
+        return {
+            route.with_date(flight_date): (content_hash, expires_at)
+            for flight_date, content_hash, expires_at in result.all()
+        }
+
+    async def _get_cached_dates_multi(
+        self, origin: str, destinations: List[str], dates: List[str], promo_code: str = None
+    ) -> Set[CacheKey]:
+        """Какие дни уже в кеше по всем направлениям из города - ОДИН запрос, без чтения JSONB"""
+        if not destinations or not dates:
+            return set()
+
+        result = await self.db.execute(
+            select(FlightCache.destination_city_code, FlightCache.flight_date).where(
+                FlightCache.origin_city_code == origin,
+                FlightCache.destination_city_code.in_(destinations),
+                FlightCache.flight_date.in_(_parse_db_dates(dates)),
+                FlightCache.promo_code == promo_code,
+                FlightCache.adults_count == 1,
+                FlightCache.expires_at > func.now(),
+            )
+        )
+        return {CacheKey.of(origin, destination, flight_date, promo_code) for destination, flight_date in result.all()}
+
+    async def get_cheapest_per_destination(
+        self, origin: str, dates: List[str], promo_code: str = None, destinations: List[str] = None
     ) -> Dict[str, Dict]:
-        """ПАКЕТНАЯ проверка кеша для списка дат - ОДИН запрос к БД!"""
+        """Самый дешевый день по каждому направлению из кеша - один SQL-запрос по min_price"""
         if not dates:
             return {}
 
-        from datetime import datetime
+        by_destination = FlightCache.destination_city_code
+        query = select(
+            by_destination,
+            FlightCache.flight_date,
+            FlightCache.min_price,
+            FlightCache.cheapest_flight_id,
+            FlightCache.fare_family,
+            func.count().over(partition_by=by_destination).label("days_cached"),
+            func.count(FlightCache.min_price).over(partition_by=by_destination).label("days_with_prices"),
+        ).where(
+            FlightCache.origin_city_code == origin,
+            FlightCache.flight_date.in_(_parse_db_dates(dates)),
+            FlightCache.promo_code == promo_code,
+            FlightCache.adults_count == 1,
+            FlightCache.expires_at > func.now(),
+        )
+        if destinations is not None:
+            query = query.where(by_destination.in_(destinations))
+
+        # DISTINCT ON (destination) ... ORDER BY destination, min_price - минимум на направление
+        result = await self.db.execute(
+            query.distinct(by_destination).order_by(
+                by_destination, FlightCache.min_price.asc().nulls_last(), FlightCache.flight_date
+            )
+        )
+        rows = result.all()
+
+        return {
+            row.destination_city_code: {
+                "min_price": float(row.min_price) if row.min_price is not None else None,
+                "cheapest_date": row.flight_date.strftime("%d.%m.%Y"),
+                "cheapest_flight_id": row.cheapest_flight_id,
+                "fare_family": row.fare_family,
+                "days_cached": row.days_cached,
+                "days_with_prices": row.days_with_prices,
+            }
+            for row in rows
+        }
 
-        # ОДИН запрос для всех дат!
-        caches = (
-            self.db.query(FlightCache)
-            .filter(
+    async def _load_change_state(
+        self, origin: str, destination: str, flight_dates: List[date], promo_code: str
+    ) -> Dict[date, Tuple]:
+        """Прошлые хеш ответа и счетчики изменений по датам (включая просроченные строки) - один запрос"""
+        result = await self.db.execute(
+            select(
+                FlightCache.flight_date,
+                FlightCache.content_hash,
+                FlightCache.last_changed_at,
+                FlightCache.fetch_count,
+                FlightCache.change_count,
+            ).where(
                 FlightCache.origin_city_code == origin,
                 FlightCache.destination_city_code == destination,
-                FlightCache.flight_date.in_(dates),
+                FlightCache.flight_date.in_(flight_dates),
                 FlightCache.promo_code == promo_code,
-                FlightCache.expires_at > datetime.utcnow(),
+                FlightCache.adults_count == 1,
             )
-            .all()
         )
+        return {row.flight_date: row for row in result.all()}
 
-        # Создаем словарь {дата: данные_кеша}
-        cached_data = {}
-        for cache in caches:
-            cached_data[cache.flight_date] = cache.flight_data
-
-        return cached_data
-
-    def _cache_flights_batch(self, origin: str, destination: str, fresh_results: List[Dict], promo_code: str):
-        """Пакетное сохранение в кеш"""
-        for result in fresh_results:
-            if result and "flights" in result:
-                try:
-                    api_date = result["date"]
-                    db_date = datetime.strptime(api_date, "%d.%m.%Y").strftime("%Y-%m-%d")
-                    self._cache_flight(origin, destination, db_date, promo_code, result)
-                except ValueError as e:
-                    logger.error(f"Error converting date {result['date']}: {e}")
+    async def _record_price_history(self, observations: List[Dict]):
+        """История цен в SAVEPOINT: ошибка записи истории не должна откатывать кеш"""
+        try:
+            async with self.db.begin_nested():
+                await PriceHistoryService(self.db).record_observations(observations)
+        except Exception as e:
+            logger.warning(f"Failed to record {len(observations)} price observations: {e}")
 
-    def _cache_flight(
+    async def _cache_flights_batch(
         self,
         origin: str,
         destination: str,
-        date: str,
+        fresh_results: List[Dict],
         promo_code: str,
-        flight_data: Dict,
+        fares: Optional[List[FareDay]] = None,
     ):
-        """Сохранить рейсы в кеш на 6 часов"""
-        # Сначала проверяем, нет ли уже записи
-        existing = (
-            self.db.query(FlightCache)
-            .filter(
-                FlightCache.origin_city_code == origin,
-                FlightCache.destination_city_code == destination,
-                FlightCache.flight_date == date,
-                FlightCache.promo_code == promo_code,
-            )
-            .first()
+        """Пакетное сохранение в кеш - один INSERT ... ON CONFLICT DO UPDATE и одна транзакция на маршрут.
+
+        Минимальная цена, id рейса и тариф извлекаются здесь один раз, чтобы
+        поиск самых дешевых дней шел по колонкам, а не по JSONB. По хешу ответа
+        видно, изменился ли день; от этого и от удаленности даты зависит TTL.
+        fares - уже разобранные дни (по одному на fresh_results), если вызывающий их построил.
+        """
+        now = datetime.now(timezone.utc)
+
+        # По одной строке на дату: ON CONFLICT не может обновить одну запись дважды за запрос
+        results_by_date = {}
+        fares_by_date: Dict[date, FareDay] = {}
+        for position, result in enumerate(fresh_results):
+            if result and "flights" in result:
+                try:
+                    flight_date = datetime.strptime(result["date"], "%d.%m.%Y").date()
+                except ValueError as e:
+                    logger.error(f"Error converting date {result['date']}: {e}")
+                    continue
+                results_by_date[flight_date] = result
+                fares_by_date[flight_date] = fares[position] if fares else FareDay.from_api(result)
+
+        if not results_by_date:
+            return
+
+        try:
+            previous = await self._load_change_state(origin, destination, list(results_by_date), promo_code)
+        except Exception as e:
+            # Без истории изменений день записывается как новый - это лучше, чем не записать его вовсе
+            await self.db.rollback()
+            logger.warning(f"Could not load change state for {origin}-{destination}, writing as new days: {e}")
+            previous = {}
+
+        rows_by_date = {}
+        changed_days = 0
+        for flight_date, result in results_by_date.items():
+            content_hash = day_content_hash(result)
+            prev = previous.get(flight_date)
+            fetch_count = (prev.fetch_count or 0) + 1 if prev else 1
+            change_count = (prev.change_count or 0) if prev else 0
+            last_changed_at = prev.last_changed_at if prev else now
+            if prev and prev.content_hash != content_hash:
+                change_count += 1
+                last_changed_at = now
+                changed_days += 1
+
+            days_out = (flight_date - now.date()).days
+            day_fares = fares_by_date[flight_date]
+            min_price, cheapest_flight_id, fare_family = day_fares.cheapest()
+            rows_by_date[flight_date] = {
+                "id": uuid.uuid4(),
+                "origin_city_code": origin,
+                "destination_city_code": destination,
+                "flight_date": flight_date,
+                "adults_count": 1,
+                "promo_code": promo_code,
+                "flight_data": result,
+                "min_price": min_price,
+                "cheapest_flight_id": cheapest_flight_id,
+                "fare_family": fare_family,
+                "summary": day_fares.to_summary(content_hash),
+                "content_hash": content_hash,
+                "last_changed_at": last_changed_at,
+                "fetch_count": fetch_count,
+                "change_count": change_count,
+                "expires_at": now + adaptive_ttl(days_out, fetch_count, change_count),
+            }
+
+        # История цен: новое наблюдение, только если день изменился (публичные цены, без промокода)
+        observations = []
+        if promo_code is None:
+            for flight_date, row in rows_by_date.items():
+                prev = previous.get(flight_date)
+                if prev and prev.content_hash == row["content_hash"]:
+                    continue
+                family_prices = fares_by_date[flight_date].family_minimums()
+                observations.append(
+                    {
+                        "origin_city_code": origin,
+                        "destination_city_code": destination,
+                        "flight_date": flight_date,
+                        "observed_at": now,
+                        "min_price": row["min_price"],
+                        "fare_families": list(family_prices),
+                        "fare_prices": list(family_prices.values()),
+                    }
+                )
+
+        stmt = insert(FlightCache).values(list(rows_by_date.values()))
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_flight_cache_key",
+            set_={
+                # JSONB переписываем только если ответ изменился (хеш покрывает и рейсы, и цены)
+                "flight_data": case(
+                    (FlightCache.content_hash.is_distinct_from(stmt.excluded.content_hash), stmt.excluded.flight_data),
+                    else_=FlightCache.flight_data,
+                ),
+                "min_price": stmt.excluded.min_price,
+                "cheapest_flight_id": stmt.excluded.cheapest_flight_id,
+                "fare_family": stmt.excluded.fare_family,
+                "summary": stmt.excluded.summary,
+                "content_hash": stmt.excluded.content_hash,
+                "last_changed_at": stmt.excluded.last_changed_at,
+                "fetch_count": stmt.excluded.fetch_count,
+                "change_count": stmt.excluded.change_count,
+                "expires_at": stmt.excluded.expires_at,
+                "search_date": func.now(),
+            },
         )
 
-        if existing:
-            # Обновляем существующую запись
-            existing.flight_data = flight_data
-            existing.expires_at = datetime.utcnow() + timedelta(hours=6)
-        else:
-            # Создаем новую запись
-            cache = FlightCache(
-                origin_city_code=origin,
-                destination_city_code=destination,
-                flight_date=date,
-                promo_code=promo_code,
-                flight_data=flight_data,
-                expires_at=datetime.utcnow() + timedelta(hours=6),
+        try:
+            await self.db.execute(stmt)
+            # Календарь цен обновляется в той же транзакции, что и кеш
+            await FareCalendarService(self.db).upsert_days(
+                origin,
+                destination,
+                [
+                    {
+                        "flight_date": flight_date,
+                        "min_price": row["min_price"],
+                        "fare_family": row["fare_family"],
+                        "updated_at": now,
+                    }
+                    for flight_date, row in rows_by_date.items()
+                ],
+                promo_code,
+            )
+            if observations:
+                await self._record_price_history(observations)
+            await self.db.commit()
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Error caching {len(rows_by_date)} days for {origin}-{destination}: {e}")
+            return
+
+        cache_write_stats["days_written"] += len(rows_by_date)
+        cache_write_stats["days_changed"] += changed_days
+        cache_write_stats["days_unchanged"] += sum(1 for d in rows_by_date if d in previous) - changed_days
+
+        for kind, field in (("full", "flight_data"), ("summary", "summary")):
+            await flight_cache.set_many(
+                {
+                    CacheKey.of(origin, destination, flight_date, promo_code): (row[field], row["expires_at"])
+                    for flight_date, row in rows_by_date.items()
+                },
+                kind=kind,
             )
-            self.db.add(cache)
-
-        self.db.commit()
 
     async def _search_flights_parallel(
         self, origin: str, destination: str, dates: List[Dict], promo_code: str = None
     ) -> List[Dict]:
         """Параллельный поиск рейсов для списка дат"""
-        async with aiohttp.ClientSession() as session:
-            semaphore = asyncio.Semaphore(self.max_concurrent_requests)
-
-            async def bounded_search(date_info):
-                async with semaphore:
-                    return await self._search_single_flight(session, origin, destination, date_info["api"], promo_code)
-
-            tasks = [bounded_search(date_info) for date_info in dates]
-            results = []
-            for task in asyncio.as_completed(tasks):
-                try:
-                    result = await task
-                    results.append(result)
-                except Exception as e:
-                    logger.error(f"Task failed: {e}")
-                    results.append(None)
-
-            successful_results = []
-            for result in results:
-                if isinstance(result, Exception):
-                    logger.error(f"Request failed: {result}")
-                elif result:
-                    successful_results.append(result)
-
-            return successful_results
+        session = await pobeda_http.get_session()
+        tasks = [
+            self._search_single_flight(session, origin, destination, date_info["api"], promo_code)
+            for date_info in dates
+        ]
+        results = []
+        for task in asyncio.as_completed(tasks):
+            try:
+                result = await task
+                results.append(result)
+            except Exception as e:
+                logger.error(f"Task failed: {e}")
+                results.append(None)
+
+        successful_results = []
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Request failed: {result}")
+            elif result:
+                successful_results.append(result)
+
+        return successful_results
 
     async def _search_single_flight(
         self,
@@ -302,7 +643,22 @@ class FlightService:
         date: str,
         promo_code: str = None,
     ) -> Optional[Dict]:
-        """Поиск рейсов на одну конкретную дату"""
+        """Поиск рейсов на одну конкретную дату; одинаковые одновременные запросы объединяются"""
+        return await flight_singleflight.do(
+            CacheKey.of(origin, destination, date, promo_code),
+            lambda: self._fetch_single_flight(session, origin, destination, date, promo_code),
+            self.priority,
+        )
+
+    async def _fetch_single_flight(
+        self,
+        session: aiohttp.ClientSession,
+        origin: str,
+        destination: str,
+        date: str,
+        promo_code: str = None,
+    ) -> Optional[Dict]:
+        """Запрос к API Победы на одну дату"""
         url = f"{self.base_url}/search-variants-mono-brand-cartesian"
 
         data = {
@@ -322,7 +678,8 @@ class FlightService:
             data["promoCode"] = promo_code
 
         try:
-            async with session.post(url, headers=self.headers, data=data) as response:
+            async with upstream_limiter.acquire(self.priority), session.post(url, data=data) as response:
+                upstream_limiter.record_response(response.status)
                 if response.status == 200:
                     result = await response.json()
                     return {
@@ -352,5 +709,5 @@ class FlightService:
         except ValueError:
             api_date = date
 
-        async with aiohttp.ClientSession() as session:
-            return await self._search_single_flight(session, origin, destination, api_date, promo_code)
+        session = await pobeda_http.get_session()
+        return await self._search_single_flight(session, origin, destination, api_date, promo_code)
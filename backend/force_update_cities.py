@@ -6,12 +6,13 @@ import sys
 sys.path.append("/app")
 
 from city_service import CityService
-from database import SessionLocal
+from database import AsyncSessionLocal, async_engine
+from http_client import pobeda_http
 
 
 async def force_update_cities():
     """Принудительное обновление городов при запуске контейнера"""
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     try:
         city_service = CityService(db)
 
@@ -28,7 +29,9 @@ async def force_update_cities():
         print(f"❌ Error in force_update_cities: {e}")
         raise
     finally:
-        db.close()
+        await pobeda_http.close()
+        await db.close()
+        await async_engine.dispose()
 
 
 if __name__ == "__main__":
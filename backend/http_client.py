@@ -0,0 +1,98 @@
+# http_client.py
+import asyncio
+import logging
+from typing import Dict, Optional
+
+import aiohttp
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+POBEDA_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+    "Accept": "application/json, text/plain, */*",
+    "Content-Type": "application/x-www-form-urlencoded;charset=UTF-8",
+    "Origin": "https://ticket.flypobeda.ru",
+    "Referer": "https://ticket.flypobeda.ru/websky/",
+}
+
+
+class PobedaHTTPClient:
+    """Один долгоживущий пул соединений к API Победы на весь процесс"""
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._lock = asyncio.Lock()
+        self.stats = {
+            "requests": 0,
+            "connections_created": 0,  # новый TCP + TLS handshake
+            "connections_reused": 0,  # keep-alive соединение из пула
+            "dns_cache_hits": 0,
+            "dns_cache_misses": 0,
+        }
+
+    def _build_trace_config(self) -> aiohttp.TraceConfig:
+        """Счетчики переиспользования соединений через aiohttp tracing"""
+        trace_config = aiohttp.TraceConfig()
+
+        def counter(name: str):
+            async def on_event(session, ctx, params):
+                self.stats[name] += 1
+
+            return on_event
+
+        trace_config.on_request_start.append(counter("requests"))
+        trace_config.on_connection_create_end.append(counter("connections_created"))
+        trace_config.on_connection_reuseconn.append(counter("connections_reused"))
+        trace_config.on_dns_cache_hit.append(counter("dns_cache_hits"))
+        trace_config.on_dns_cache_miss.append(counter("dns_cache_misses"))
+        return trace_config
+
+    async def start(self) -> aiohttp.ClientSession:
+        """Создать сессию с настроенным коннектором (вызывается из lifespan)"""
+        async with self._lock:
+            if self._session is None or self._session.closed:
+                connector = aiohttp.TCPConnector(
+                    limit=settings.POBEDA_HTTP_POOL_SIZE,
+                    limit_per_host=settings.POBEDA_HTTP_LIMIT_PER_HOST,
+                    ttl_dns_cache=settings.POBEDA_HTTP_DNS_TTL_SECONDS,
+                    keepalive_timeout=settings.POBEDA_HTTP_KEEPALIVE_SECONDS,
+                    enable_cleanup_closed=True,
+                )
+                self._session = aiohttp.ClientSession(
+                    connector=connector,
+                    headers=POBEDA_HEADERS,
+                    timeout=aiohttp.ClientTimeout(total=settings.POBEDA_HTTP_TIMEOUT_SECONDS),
+                    trace_configs=[self._build_trace_config()],
+                )
+                logger.info("✅ Pobeda HTTP pool started")
+            return self._session
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Общая сессия; в скриптах без lifespan создается лениво"""
+        if self._session is None or self._session.closed:
+            return await self.start()
+        return self._session
+
+    async def close(self):
+        """Закрыть пул соединений"""
+        async with self._lock:
+            if self._session and not self._session.closed:
+                await self._session.close()
+                logger.info("🛑 Pobeda HTTP pool closed")
+            self._session = None
+
+    def get_stats(self) -> Dict:
+        """Статистика переиспользования соединений"""
+        created = self.stats["connections_created"]
+        reused = self.stats["connections_reused"]
+        total = created + reused
+        return {
+            **self.stats,
+            "reuse_ratio": round(reused / total, 3) if total else 0.0,
+            "pool_open": self._session is not None and not self._session.closed,
+        }
+
+
+# Глобальный клиент процесса
+pobeda_http = PobedaHTTPClient()
@@ -31,14 +31,28 @@ CREATE TABLE IF NOT EXISTS flight_cache (
 
     -- Данные рейсов (храним как JSON для гибкости)
     flight_data JSONB NOT NULL,
+    -- Сжатая проекция дня (мин. цена, тариф, число рейсов) для легких ответов
+    summary JSONB,
 
-    -- Минимальная цена для быстрого поиска
+    -- Самый дешевый тариф дня для быстрого поиска (заполняется при записи в кеш)
     min_price DECIMAL(10,2),
+    cheapest_flight_id VARCHAR(100),
+    fare_family VARCHAR(50),
+
+    -- Отслеживание изменений цен (хеш prices) - от них зависит TTL строки
+    content_hash VARCHAR(32),
+    last_changed_at TIMESTAMP WITH TIME ZONE,
+    fetch_count INTEGER DEFAULT 0,
+    change_count INTEGER DEFAULT 0,
 
     -- Время жизни кеша
     expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
 
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+
+    -- Одна запись на маршрут/дату/промокод/пассажиров (ключ для INSERT ... ON CONFLICT)
+    CONSTRAINT uq_flight_cache_key UNIQUE NULLS NOT DISTINCT
+        (origin_city_code, destination_city_code, flight_date, promo_code, adults_count)
 );
 
 -- Индексы для быстрого поиска рейсов
@@ -47,8 +61,61 @@ CREATE INDEX IF NOT EXISTS idx_flight_cache_date ON flight_cache(flight_date);
 CREATE INDEX IF NOT EXISTS idx_flight_cache_search ON flight_cache(origin_city_code, destination_city_code, flight_date);
 CREATE INDEX IF NOT EXISTS idx_flight_cache_promo ON flight_cache(promo_code);
 CREATE INDEX IF NOT EXISTS idx_flight_cache_price ON flight_cache(min_price);
+CREATE INDEX IF NOT EXISTS idx_flight_cache_origin_price ON flight_cache(origin_city_code, destination_city_code, min_price);
 CREATE INDEX IF NOT EXISTS idx_flight_cache_expires ON flight_cache(expires_at);
 
+-- История цен: одна строка на изменение цены дня, секции по месяцу вылета
+-- (price_observations_YYYY_MM создает приложение при старте и раз в сутки)
+CREATE TABLE IF NOT EXISTS price_observations (
+    origin_city_code VARCHAR(10) NOT NULL,
+    destination_city_code VARCHAR(10) NOT NULL,
+    flight_date DATE NOT NULL,
+    observed_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    min_price DECIMAL(10,2),
+    fare_families VARCHAR(50)[],
+    fare_prices DECIMAL(10,2)[],
+    PRIMARY KEY (origin_city_code, destination_city_code, flight_date, observed_at)
+) PARTITION BY RANGE (flight_date);
+
+CREATE TABLE IF NOT EXISTS price_observations_default PARTITION OF price_observations DEFAULT;
+
+-- Календарь цен: минимум дня по маршруту (promo_code '' - без промокода)
+CREATE TABLE IF NOT EXISTS fare_calendar (
+    origin_city_code VARCHAR(10) NOT NULL,
+    destination_city_code VARCHAR(10) NOT NULL,
+    promo_code VARCHAR(50) NOT NULL DEFAULT '',
+    flight_date DATE NOT NULL,
+    min_price DECIMAL(10,2),
+    fare_family VARCHAR(50),
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    PRIMARY KEY (origin_city_code, destination_city_code, promo_code, flight_date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_fare_calendar_origin_date ON fare_calendar(origin_city_code, promo_code, flight_date);
+
+-- Очередь повторов для дат, не полученных из-за 403/429
+CREATE TABLE IF NOT EXISTS flight_retry_queue (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    job_id UUID NOT NULL,
+    origin_city_code VARCHAR(10) NOT NULL,
+    destination_city_code VARCHAR(10) NOT NULL,
+    flight_date DATE NOT NULL,
+    promo_code VARCHAR(50),
+    status VARCHAR(20) NOT NULL DEFAULT 'pending', -- 'pending', 'running', 'done', 'failed'
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    last_error VARCHAR(200),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ix_flight_retry_queue_job_id ON flight_retry_queue(job_id);
+CREATE INDEX IF NOT EXISTS idx_flight_retry_due ON flight_retry_queue(status, next_attempt_at);
+-- Одна активная задача на дату: повторный 403 по той же дате не плодит дубли
+CREATE UNIQUE INDEX IF NOT EXISTS uq_flight_retry_active
+    ON flight_retry_queue(origin_city_code, destination_city_code, flight_date, COALESCE(promo_code, ''))
+    WHERE status IN ('pending', 'running');
+
 -- Таблица промокодов
 CREATE TABLE IF NOT EXISTS promo_codes (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -0,0 +1,50 @@
+# json_codec.py
+"""Единая быстрая (де)сериализация JSON на orjson.
+
+Используется для ответов API, колонок JSONB (engine), значений в Redis
+и сообщений Kafka, чтобы большие ответы по 30 дням не проходили
+несколько раз через медленный стандартный json.
+"""
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from starlette.responses import JSONResponse
+
+# Ключи-не-строки (даты, числа) превращаются в строки, как у стандартного json
+DUMPS_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(value: Any) -> Any:
+    """Типы, которые orjson не умеет сам: Decimal из Numeric-колонок, остальное - строкой"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    return str(value)
+
+
+def dumps(value: Any) -> bytes:
+    """Объект -> UTF-8 JSON (bytes)"""
+    return orjson.dumps(value, default=_default, option=DUMPS_OPTIONS)
+
+
+def dumps_str(value: Any) -> str:
+    """Объект -> JSON-строка (для драйверов БД, которые ждут str)"""
+    return orjson.dumps(value, default=_default, option=DUMPS_OPTIONS).decode()
+
+
+def loads(data: Any) -> Any:
+    """bytes/str -> объект"""
+    return orjson.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse на orjson.
+
+    Если обработчик возвращает такой ответ сам, FastAPI не прогоняет
+    содержимое через jsonable_encoder - для больших ответов это основная экономия.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,66 +1,254 @@
 # logging_config.py
-import json
+import atexit
 import logging
-import logging.config
+import logging.handlers
+import queue
+import random
+import threading
+import time
+import urllib.request
+from collections import Counter, deque
+from typing import Dict, List, Optional
 
-from pythonjsonlogger import jsonlogger
+import json_codec
+from config import settings
+
+# Логгеры горячих путей: прогресс по датам и направлениям, DEBUG из них пропускается выборочно
+HOT_PATH_LOGGERS = ("flight_service", "anywhere_service", "anywhere_scheduler")
 
 
 # Настройка JSON логгера для ELK
-class ELKJsonFormatter(jsonlogger.JsonFormatter):
-    def add_fields(self, log_record, record, message_dict):
-        super().add_fields(log_record, record, message_dict)
-        log_record["timestamp"] = record.created
-        log_record["level"] = record.levelname
-        log_record["service"] = "pobeda-backend"
-        log_record["module"] = record.module
-        log_record["function"] = record.funcName
-
-
-LOGGING_CONFIG = {
-    "version": 1,
-    "disable_existing_loggers": False,
-    "formatters": {
-        "json": {
-            "()": ELKJsonFormatter,
-        },
-        "simple": {"format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s"},
-    },
-    "handlers": {
-        "elk": {
-            "class": "logging.handlers.HTTPHandler",
-            "host": "localhost:5000",  # Logstash
-            "url": "/logs",
-            "method": "POST",
-            "formatter": "json",
-        },
-        "console": {"class": "logging.StreamHandler", "formatter": "simple"},
-        "file": {
-            "class": "logging.handlers.RotatingFileHandler",
-            "filename": "app.log",
-            "maxBytes": 10485760,  # 10MB
-            "backupCount": 5,
-            "formatter": "json",
-        },
-    },
-    "loggers": {
-        "": {  # root logger
-            "handlers": ["console", "elk", "file"],
-            "level": "INFO",
-        },
-        "anywhere_service": {
-            "handlers": ["console", "elk", "file"],
-            "level": "DEBUG",
-            "propagate": False,
-        },
-        "flight_service": {
-            "handlers": ["console", "elk", "file"],
-            "level": "DEBUG",
-            "propagate": False,
-        },
-    },
-}
-
-# Инициализация логгера
-logging.config.dictConfig(LOGGING_CONFIG)
-logger = logging.getLogger(__name__)
+class ELKJsonFormatter(logging.Formatter):
+    def to_document(self, record: logging.LogRecord) -> Dict:
+        document = {
+            "message": record.getMessage(),
+            "timestamp": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "service": "pobeda-backend",
+            "module": record.module,
+            "function": record.funcName,
+        }
+        if record.exc_info:
+            document["exc_info"] = self.formatException(record.exc_info)
+        return document
+
+    def format(self, record: logging.LogRecord) -> str:
+        return json_codec.dumps_str(self.to_document(record))
+
+
+class HotPathSampler(logging.Filter):
+    """Пропускает только долю rate DEBUG-записей; INFO и выше - всегда"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1 or random.random() < self.rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler над ограниченной очередью.
+
+    Поток, который пишет лог (в том числе event loop), только кладет запись
+    в очередь. Если очередь полна, записи ниже WARNING выбрасываются сразу,
+    WARNING и выше ждут место не дольше block_timeout секунд.
+    """
+
+    def __init__(self, log_queue: queue.Queue, block_timeout: float):
+        super().__init__(log_queue)
+        self.block_timeout = block_timeout
+        self.dropped: Counter = Counter()
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        if record.levelno >= logging.WARNING and self.block_timeout:
+            try:
+                self.queue.put(record, timeout=self.block_timeout)
+                return
+            except queue.Full:
+                pass
+        self.dropped[record.levelname] += 1
+
+
+class BatchedELKHandler(logging.Handler):
+    """Отправка логов в Logstash/Elasticsearch пачками.
+
+    Работает в потоке QueueListener и в своем потоке досылки по таймеру.
+    URL на /_bulk - Elasticsearch bulk API (NDJSON), иначе - http input Logstash
+    (JSON-массив, каждый элемент - отдельное событие). Пока ELK недоступен,
+    неотправленная пачка возвращается в начало очереди, следующая попытка -
+    через паузу, растущую вдвое до MAX_RETRY_DELAY секунд. В памяти держится
+    не больше max_pending документов, лишнее выбрасывается.
+    """
+
+    MAX_RETRY_DELAY = 60.0
+
+    def __init__(self, url: str, index: str, batch_size: int, flush_seconds: float, timeout: float, max_pending: int):
+        super().__init__()
+        self.url = url
+        self.index = index
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.timeout = timeout
+        self.bulk = url.rstrip("/").endswith("/_bulk")
+        self._pending: deque = deque(maxlen=max_pending)
+        self._flush_lock = threading.Lock()
+        self._retry_delay = 0.0
+        self._retry_at = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._flush_periodically, name="elk-log-shipper", daemon=True)
+        self.stats = {"shipped": 0, "batches": 0, "failed_batches": 0, "dropped": 0}
+        self._thread.start()
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            document = self.formatter.to_document(record)
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self._pending) == self._pending.maxlen:
+            self.stats["dropped"] += 1
+        self._pending.append(document)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def _flush_periodically(self):
+        while not self._stop.wait(self.flush_seconds):
+            self.flush()
+
+    def _encode(self, documents: List[Dict]) -> bytes:
+        if not self.bulk:
+            return json_codec.dumps(documents)
+        action = json_codec.dumps({"index": {"_index": self.index}})
+        return b"".join(action + b"\n" + json_codec.dumps(document) + b"\n" for document in documents)
+
+    def flush(self, force: bool = False):
+        with self._flush_lock:
+            # ELK недавно не ответил - не ходим к нему на каждой пачке, ждем паузу
+            if not force and time.monotonic() < self._retry_at:
+                return
+            while self._pending:
+                documents = [self._pending.popleft() for _ in range(min(len(self._pending), self.batch_size))]
+                request = urllib.request.Request(
+                    self.url,
+                    data=self._encode(documents),
+                    headers={"Content-Type": "application/x-ndjson" if self.bulk else "application/json"},
+                    method="POST",
+                )
+                try:
+                    with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                        response.read()
+                except Exception:
+                    # Пачку - обратно в начало очереди; если места нет, deque выбросит самые новые записи
+                    self.stats["failed_batches"] += 1
+                    self.stats["dropped"] += max(len(self._pending) + len(documents) - self._pending.maxlen, 0)
+                    self._pending.extendleft(reversed(documents))
+                    self._retry_delay = min(max(self._retry_delay * 2, self.flush_seconds), self.MAX_RETRY_DELAY)
+                    self._retry_at = time.monotonic() + self._retry_delay
+                    return
+                self._retry_delay = 0.0
+                self.stats["batches"] += 1
+                self.stats["shipped"] += len(documents)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(self.timeout)
+        # Последняя попытка при остановке - без паузы; что не ушло, теряется вместе с процессом
+        self.flush(force=True)
+        super().close()
+
+
+class LoggingPipeline:
+    """Логирование процесса: все записи идут через одну ограниченную очередь
+    в отдельный поток QueueListener, а уже он пишет в консоль, файл и ELK.
+    """
+
+    def __init__(self):
+        self.listener: Optional[logging.handlers.QueueListener] = None
+        self.queue_handler: Optional[BoundedQueueHandler] = None
+        self.sampler: Optional[HotPathSampler] = None
+        self.elk_handler: Optional[BatchedELKHandler] = None
+
+    def setup(self):
+        """Настроить корневой логгер; повторный вызов перенастраивает (бенчмарки)"""
+        self.stop()
+        self.elk_handler = None
+
+        handlers = []
+        if settings.LOG_CONSOLE:
+            console = logging.StreamHandler()
+            console.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+            handlers.append(console)
+        if settings.LOG_FILE:
+            file_handler = logging.handlers.RotatingFileHandler(
+                settings.LOG_FILE, maxBytes=10485760, backupCount=5  # 10MB
+            )
+            file_handler.setFormatter(ELKJsonFormatter())
+            handlers.append(file_handler)
+        if settings.LOG_ELK_URL:
+            self.elk_handler = BatchedELKHandler(
+                settings.LOG_ELK_URL,
+                settings.LOG_ELK_INDEX,
+                settings.LOG_ELK_BATCH_SIZE,
+                settings.LOG_ELK_FLUSH_SECONDS,
+                settings.LOG_ELK_TIMEOUT_SECONDS,
+                settings.LOG_ELK_MAX_PENDING,
+            )
+            self.elk_handler.setFormatter(ELKJsonFormatter())
+            handlers.append(self.elk_handler)
+
+        log_queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+        self.queue_handler = BoundedQueueHandler(log_queue, settings.LOG_QUEUE_BLOCK_TIMEOUT_MS / 1000)
+        self.listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.queue_handler)
+        root.setLevel(settings.LOG_LEVEL)
+
+        self.sampler = HotPathSampler(settings.LOG_HOT_PATH_SAMPLE_RATE)
+        for name in HOT_PATH_LOGGERS:
+            hot_logger = logging.getLogger(name)
+            hot_logger.setLevel(settings.LOG_HOT_PATH_LEVEL)
+            hot_logger.filters = [f for f in hot_logger.filters if not isinstance(f, HotPathSampler)]
+            hot_logger.addFilter(self.sampler)
+
+        self.listener.start()
+
+    def stop(self):
+        """Дописать очередь и отправить остаток в ELK"""
+        if self.listener is None:
+            return
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+        logging.getLogger().removeHandler(self.queue_handler)
+        self.listener = None
+
+    def get_stats(self) -> Dict:
+        if self.queue_handler is None:
+            return {"configured": False}
+        return {
+            "configured": True,
+            "queued": self.queue_handler.queue.qsize(),
+            "queue_size": settings.LOG_QUEUE_SIZE,
+            "dropped_on_overflow": dict(self.queue_handler.dropped),
+            "hot_path_sampled_out": self.sampler.sampled_out if self.sampler else 0,
+            "elk": self.elk_handler.stats if self.elk_handler else None,
+        }
+
+
+# Логирование процесса
+log_pipeline = LoggingPipeline()
+atexit.register(log_pipeline.stop)
@@ -2,8 +2,20 @@ import uuid
 from datetime import datetime
 
 from database import Base
-from sqlalchemy import DECIMAL, JSON, Boolean, Column, Date, DateTime, Integer, String
-from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy import (
+    DECIMAL,
+    JSON,
+    Boolean,
+    Column,
+    Date,
+    DateTime,
+    Index,
+    Integer,
+    PrimaryKeyConstraint,
+    String,
+    UniqueConstraint,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, UUID
 from sqlalchemy.sql import func
 
 
@@ -23,6 +35,20 @@ class City(Base):
 
 class FlightCache(Base):
     __tablename__ = "flight_cache"
+    __table_args__ = (
+        # Одна запись на (маршрут, дата, промокод, пассажиры) - ключ для INSERT ... ON CONFLICT
+        UniqueConstraint(
+            "origin_city_code",
+            "destination_city_code",
+            "flight_date",
+            "promo_code",
+            "adults_count",
+            name="uq_flight_cache_key",
+            postgresql_nulls_not_distinct=True,
+        ),
+        # Самый дешевый день по направлению из города без чтения JSONB
+        Index("idx_flight_cache_origin_price", "origin_city_code", "destination_city_code", "min_price"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     origin_city_code = Column(String(10), nullable=False, index=True)
@@ -32,9 +58,87 @@ class FlightCache(Base):
     adults_count = Column(Integer, default=1)
     promo_code = Column(String(50), index=True)
     flight_data = Column(JSONB, nullable=False)
+    # Сжатая проекция дня для view=summary/calendar (см. project_day_summary)
+    summary = Column(JSONB)
+    # Самый дешевый тариф дня - заполняется при записи в кеш
     min_price = Column(DECIMAL(10, 2), index=True)
+    cheapest_flight_id = Column(String(100))
+    fare_family = Column(String(50))
+    # Отслеживание изменений дня (рейсы и цены) - от них зависит TTL строки
+    content_hash = Column(String(32))
+    last_changed_at = Column(DateTime(timezone=True))
+    fetch_count = Column(Integer, default=0)
+    change_count = Column(Integer, default=0)
     expires_at = Column(DateTime(timezone=True), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 
+class FlightRetryTask(Base):
+    """Дата, не полученная из-за 403/429 - ждет повтора в фоне (одна строка на дату)"""
+
+    __tablename__ = "flight_retry_queue"
+    __table_args__ = (
+        # Выборка готовых к повтору задач воркером
+        Index("idx_flight_retry_due", "status", "next_attempt_at"),
+        # Уникальность активной задачи на дату - частичный индекс uq_flight_retry_active (SCHEMA_UPGRADES)
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    job_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    origin_city_code = Column(String(10), nullable=False)
+    destination_city_code = Column(String(10), nullable=False)
+    flight_date = Column(Date, nullable=False)
+    promo_code = Column(String(50))
+    status = Column(String(20), nullable=False, default="pending")  # pending / running / done / failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False)
+    last_error = Column(String(200))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class PriceObservation(Base):
+    """История цен: одна строка на изменение цены дня, без JSONB.
+
+    Таблица секционирована по месяцу вылета (price_observations_YYYY_MM),
+    секции создает и удаляет PriceHistoryService.
+    """
+
+    __tablename__ = "price_observations"
+    __table_args__ = (
+        # Ключ секционированной таблицы обязан включать flight_date; он же индекс для истории маршрута
+        PrimaryKeyConstraint("origin_city_code", "destination_city_code", "flight_date", "observed_at"),
+        {"postgresql_partition_by": "RANGE (flight_date)"},
+    )
+
+    origin_city_code = Column(String(10), nullable=False)
+    destination_city_code = Column(String(10), nullable=False)
+    flight_date = Column(Date, nullable=False)
+    observed_at = Column(DateTime(timezone=True), nullable=False)
+    min_price = Column(DECIMAL(10, 2))
+    # Минимальная цена по каждому семейству тарифов - параллельные массивы
+    fare_families = Column(ARRAY(String(50)))
+    fare_prices = Column(ARRAY(DECIMAL(10, 2)))
+
+
+class FareCalendarDay(Base):
+    """Минимальная цена дня по маршруту - обновляется при каждой записи в кеш"""
+
+    __tablename__ = "fare_calendar"
+    __table_args__ = (
+        # promo_code без NULL ('' - без промокода), чтобы он мог входить в первичный ключ
+        PrimaryKeyConstraint("origin_city_code", "destination_city_code", "promo_code", "flight_date"),
+        # Все направления из города за месяц
+        Index("idx_fare_calendar_origin_date", "origin_city_code", "promo_code", "flight_date"),
+    )
+
+    origin_city_code = Column(String(10), nullable=False)
+    destination_city_code = Column(String(10), nullable=False)
+    promo_code = Column(String(50), nullable=False, default="")
+    flight_date = Column(Date, nullable=False)
+    min_price = Column(DECIMAL(10, 2))
+    fare_family = Column(String(50))
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+
+
 # Убери остальные модели пока
@@ -0,0 +1,223 @@
+# price_history.py
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from config import settings
+from models import PriceObservation
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+# Ключ pg_advisory_xact_lock для создания секций: поды стартуют одновременно
+PARTITION_DDL_LOCK_ID = 7301001
+
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _next_month(day: date) -> date:
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def partition_name(month: date) -> str:
+    return f"price_observations_{month:%Y_%m}"
+
+
+def partition_months(months_back: int = 1, months_ahead: int = None) -> List[date]:
+    """Месяцы вылета, для которых должны быть секции: вокруг текущего месяца"""
+    months_ahead = settings.PRICE_HISTORY_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    month = _month_start(date.today())
+    for _ in range(months_back):
+        month = _month_start(month - timedelta(days=1))
+
+    months = []
+    for _ in range(months_back + months_ahead + 1):
+        months.append(month)
+        month = _next_month(month)
+    return months
+
+
+def partition_ddl(month: date) -> str:
+    """Создать секцию месяца, если ее нет.
+
+    Строки этого месяца могли уже попасть в price_observations_default - тогда
+    CREATE TABLE ... PARTITION OF падает. Поэтому секция создается отдельной
+    таблицей, строки переносятся в нее из DEFAULT и только потом она подключается.
+
+    Поды выполняют это одновременно (create_tables при старте), поэтому проверка
+    и создание идут под advisory-блокировкой до конца транзакции.
+    """
+    name = partition_name(month)
+    start, end = month.isoformat(), _next_month(month).isoformat()
+    return f"""
+    DO $$
+    BEGIN
+        IF to_regclass('{name}') IS NULL THEN
+            PERFORM pg_advisory_xact_lock({PARTITION_DDL_LOCK_ID});
+        END IF;
+        -- После ожидания блокировки секцию мог уже создать другой под
+        IF to_regclass('{name}') IS NULL THEN
+            CREATE TABLE {name} (LIKE price_observations INCLUDING DEFAULTS INCLUDING CONSTRAINTS);
+            WITH moved AS (
+                DELETE FROM price_observations_default
+                WHERE flight_date >= DATE '{start}' AND flight_date < DATE '{end}'
+                RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved;
+            ALTER TABLE price_observations ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}');
+        END IF;
+    END $$;
+    """
+
+
+class PriceHistoryService:
+    """История цен по маршрутам: запись наблюдений, секции по месяцам, прореживание.
+
+    Наблюдение пишется, только когда ответ на день изменился (см. content_hash
+    в FlightService._cache_flights_batch), поэтому таблица растет со
+    скоростью изменения рейсов и цен, а не со скоростью запросов.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def record_observations(self, observations: List[Dict]):
+        """Добавить наблюдения в текущую транзакцию (commit делает вызывающий)"""
+        if not observations:
+            return
+        await self.db.execute(insert(PriceObservation).values(observations).on_conflict_do_nothing())
+
+    async def ensure_partitions(self, months_back: int = 1, months_ahead: int = None):
+        """Создать секции по месяцам вылета вокруг текущего месяца (при запуске это делает create_tables)"""
+        ensured = 0
+        for month in partition_months(months_back, months_ahead):
+            try:
+                await self.db.execute(text(partition_ddl(month)))
+                await self.db.commit()
+                ensured += 1
+            except Exception as e:
+                await self.db.rollback()
+                logger.warning(f"Could not create partition {partition_name(month)}: {e}")
+        return ensured
+
+    async def _month_partitions(self) -> List[Tuple[str, date]]:
+        """Подключенные секции по месяцам вылета: (имя, первое число месяца)"""
+        result = await self.db.execute(
+            text(
+                """
+                SELECT c.relname FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                JOIN pg_class p ON p.oid = i.inhparent
+                WHERE p.relname = 'price_observations' AND c.relname ~ '^price_observations_[0-9]{4}_[0-9]{2}$'
+                """
+            )
+        )
+        return [(name, datetime.strptime(name[-7:], "%Y_%m").date()) for (name,) in result.all()]
+
+    async def downsample(self) -> int:
+        """Старше PRICE_HISTORY_RAW_DAYS оставляем одно (самое дешевое) наблюдение в сутки.
+
+        Прореживаются только вылеты раньше границы PRICE_HISTORY_RAW_DAYS:
+        наблюдения делаются до вылета, значит все их строки уже старые, а скан
+        идет по секциям этих месяцев (и DEFAULT), не задевая секции с живыми
+        данными. Наблюдения дальних вылетов прорежутся, когда вылет перейдет границу.
+        """
+        cutoff = date.today() - timedelta(days=settings.PRICE_HISTORY_RAW_DAYS)
+        tables = [name for name, month in await self._month_partitions() if month < cutoff]
+        deleted = 0
+        for name in tables + ["price_observations_default"]:
+            result = await self.db.execute(
+                text(
+                    f"""
+                    WITH ranked AS (
+                        SELECT origin_city_code, destination_city_code, flight_date, observed_at,
+                               row_number() OVER (
+                                   PARTITION BY origin_city_code, destination_city_code, flight_date,
+                                                date_trunc('day', observed_at)
+                                   ORDER BY min_price NULLS LAST, observed_at
+                               ) AS rn
+                        FROM {name}
+                        WHERE flight_date < :cutoff
+                    )
+                    DELETE FROM {name} p
+                    USING ranked r
+                    WHERE r.rn > 1
+                      AND p.origin_city_code = r.origin_city_code
+                      AND p.destination_city_code = r.destination_city_code
+                      AND p.flight_date = r.flight_date
+                      AND p.observed_at = r.observed_at
+                    """
+                ),
+                {"cutoff": cutoff},
+            )
+            await self.db.commit()
+            deleted += result.rowcount
+        return deleted
+
+    async def drop_expired_partitions(self) -> List[str]:
+        """Удалить секции месяцев вылета, вышедших за PRICE_HISTORY_RETENTION_DAYS"""
+        cutoff = date.today() - timedelta(days=settings.PRICE_HISTORY_RETENTION_DAYS)
+        dropped = []
+        for name, month in await self._month_partitions():
+            if _next_month(month) <= cutoff:
+                await self.db.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                dropped.append(name)
+        await self.db.commit()
+        return dropped
+
+    async def run_maintenance(self) -> Dict:
+        """Ежедневное обслуживание: новые секции, прореживание, удаление старых секций"""
+        partitions = await self.ensure_partitions()
+        # Сначала удаляем секции за сроком хранения, чтобы не прореживать их зря
+        dropped = await self.drop_expired_partitions()
+        downsampled = await self.downsample()
+        logger.info(f"📈 Price history maintenance: {downsampled} observations downsampled, dropped {dropped}")
+        return {"partitions_ensured": partitions, "downsampled": downsampled, "dropped_partitions": dropped}
+
+    async def get_history(
+        self,
+        origin: str,
+        destination: str,
+        days_back: int = 365,
+        flight_date_from: Optional[date] = None,
+        flight_date_to: Optional[date] = None,
+    ) -> Dict:
+        """История маршрута в колоночном виде: параллельные массивы вместо списка объектов"""
+        since = datetime.now(timezone.utc) - timedelta(days=days_back)
+        # Наблюдения делаются до вылета, поэтому ранние месяцы вылета можно не сканировать
+        flight_date_from = max(flight_date_from or since.date(), since.date())
+
+        query = select(
+            PriceObservation.flight_date,
+            PriceObservation.observed_at,
+            PriceObservation.min_price,
+            PriceObservation.fare_families,
+            PriceObservation.fare_prices,
+        ).where(
+            PriceObservation.origin_city_code == origin,
+            PriceObservation.destination_city_code == destination,
+            PriceObservation.flight_date >= flight_date_from,
+            PriceObservation.observed_at >= since,
+        )
+        if flight_date_to:
+            query = query.where(PriceObservation.flight_date <= flight_date_to)
+
+        result = await self.db.execute(query.order_by(PriceObservation.flight_date, PriceObservation.observed_at))
+        rows = result.all()
+
+        return {
+            "origin": origin,
+            "destination": destination,
+            "observations": len(rows),
+            "flight_date": [row.flight_date.isoformat() for row in rows],
+            "observed_at": [row.observed_at.isoformat() for row in rows],
+            "min_price": [float(row.min_price) if row.min_price is not None else None for row in rows],
+            "fare_prices": [
+                {family: float(price) for family, price in zip(row.fare_families or [], row.fare_prices or [])}
+                for row in rows
+            ],
+        }
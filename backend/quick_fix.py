@@ -2,11 +2,12 @@
 import asyncio
 
 from city_service import CityService
-from database import SessionLocal
+from database import AsyncSessionLocal, async_engine
+from http_client import pobeda_http
 
 
 async def quick_fix():
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     city_service = CityService(db)
 
     # Обновляем города из API
@@ -25,7 +26,9 @@ async def quick_fix():
     await city_service.save_active_cities(active_codes)
     print("✅ Active cities saved to database")
 
-    db.close()
+    await pobeda_http.close()
+    await db.close()
+    await async_engine.dispose()
 
 
 if __name__ == "__main__":
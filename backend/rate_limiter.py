@@ -0,0 +1,244 @@
+# rate_limiter.py
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Dict, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Классы приоритета запросов к API Победы (меньше - важнее)"""
+
+    INTERACTIVE = 0  # пользователь ждет ответа /flights/search
+    ANYWHERE = 1  # веер запросов "Куда угодно"
+    BACKGROUND = 2  # фоновое обновление цен и городов
+
+
+class UpstreamRateLimiter:
+    """Общий на процесс token bucket + AIMD-лимит параллельности для API Победы.
+
+    Слоты выдаются по приоритету, так что пользовательские поиски обгоняют
+    фоновые задачи. При росте доли 403/429 лимиты уменьшаются вдвое,
+    на успешных ответах - плавно растут обратно. С Redis лимит по частоте
+    дополнительно соблюдается для всех подов сразу.
+    """
+
+    REDIS_PREFIX = "pobeda:ratelimit"
+
+    def __init__(
+        self,
+        rate_per_second: float,
+        burst: int,
+        max_concurrency: int,
+        min_concurrency: int = 1,
+    ):
+        self.max_rate = rate_per_second
+        self.min_rate = max(rate_per_second / 8, 0.1)
+        self.rate = rate_per_second
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency_limit = float(max_concurrency)
+
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._in_flight = 0
+        self._waiters: list = []
+        self._seq = itertools.count()
+        self._cooldown_until = 0.0
+        self._last_decrease = 0.0
+        self._recent_statuses: deque = deque(maxlen=settings.UPSTREAM_ERROR_WINDOW)
+        self._redis = None
+
+        self.stats = {
+            "granted": {p.name.lower(): 0 for p in Priority},
+            "waited": {p.name.lower(): 0 for p in Priority},
+            "responses_ok": 0,
+            "responses_blocked": 0,  # 403 / 429
+            "backoffs": 0,
+            "redis_throttled": 0,
+        }
+
+    def attach_redis(self, redis_client):
+        """Включить координацию между подами через Redis"""
+        self._redis = redis_client
+        logger.info("✅ Upstream rate limiter coordinated via Redis")
+
+    # --- слоты параллельности ---
+
+    def _can_grant(self, priority: Priority) -> bool:
+        limit = max(int(self.concurrency_limit), self.min_concurrency)
+        if priority == Priority.BACKGROUND:
+            # Один слот всегда оставляем для пользовательских запросов
+            limit = max(limit - settings.UPSTREAM_RESERVED_INTERACTIVE_SLOTS, 1)
+        return self._in_flight < limit
+
+    def _wake_waiters(self):
+        while self._waiters:
+            priority, _, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self._can_grant(priority):
+                break
+            heapq.heappop(self._waiters)
+            self._in_flight += 1
+            future.set_result(None)
+
+    async def _acquire_slot(self, priority: Priority):
+        if not self._waiters and self._can_grant(priority):
+            self._in_flight += 1
+            return
+
+        self.stats["waited"][priority.name.lower()] += 1
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (int(priority), next(self._seq), future))
+        # Очередь может стоять из-за фоновых запросов, упершихся в резерв слотов, - более
+        # важный запрос встает в ее голову и получает свободный слот сразу
+        self._wake_waiters()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Слот уже выдан, но запрос отменили - возвращаем его
+                self._release_slot()
+            raise
+
+    def _release_slot(self):
+        self._in_flight -= 1
+        self._wake_waiters()
+
+    # --- частота запросов ---
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    async def _take_token(self):
+        while True:
+            now = time.monotonic()
+            if now < self._cooldown_until:
+                await asyncio.sleep(self._cooldown_until - now)
+                continue
+
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                break
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+        if self._redis is not None:
+            await self._wait_global_budget()
+
+    async def _wait_global_budget(self):
+        """Общий на все поды лимит запросов в секунду (счетчик INCR на секунду)"""
+        while True:
+            second = int(time.time())
+            key = f"{self.REDIS_PREFIX}:{second}"
+            try:
+                pipe = self._redis.pipeline()
+                pipe.incr(key)
+                pipe.expire(key, 2)
+                pipe.get(f"{self.REDIS_PREFIX}:backoff_until")
+                count, _, backoff_until = await asyncio.to_thread(pipe.execute)
+            except Exception as e:
+                logger.warning(f"Redis rate limit unavailable, using local limits only: {e}")
+                return
+
+            if backoff_until and float(backoff_until) > time.time():
+                await asyncio.sleep(float(backoff_until) - time.time())
+                continue
+            if count <= settings.UPSTREAM_GLOBAL_RATE_PER_SECOND:
+                return
+
+            self.stats["redis_throttled"] += 1
+            await asyncio.sleep(second + 1 - time.time())
+
+    # --- адаптивная подстройка ---
+
+    def record_response(self, status: Optional[int]):
+        """Учесть ответ API: 403/429 уменьшают лимиты, успехи плавно их возвращают"""
+        blocked = status in (403, 429)
+        self._recent_statuses.append(blocked)
+
+        if not blocked:
+            self.stats["responses_ok"] += 1
+            self.concurrency_limit = min(
+                self.max_concurrency, self.concurrency_limit + 1 / max(self.concurrency_limit, 1)
+            )
+            self.rate = min(self.max_rate, self.rate + settings.UPSTREAM_RATE_INCREASE_STEP)
+            self._wake_waiters()
+            return
+
+        self.stats["responses_blocked"] += 1
+        error_ratio = sum(self._recent_statuses) / len(self._recent_statuses)
+        now = time.monotonic()
+        if error_ratio < settings.UPSTREAM_ERROR_RATIO_THRESHOLD or now - self._last_decrease < 1.0:
+            return
+
+        # Multiplicative decrease + пауза для всех запросов процесса
+        self._last_decrease = now
+        self.stats["backoffs"] += 1
+        self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit / 2)
+        self.rate = max(self.min_rate, self.rate / 2)
+        self._cooldown_until = now + settings.UPSTREAM_BACKOFF_SECONDS
+        logger.warning(
+            f"⚠️ Upstream blocked ratio {error_ratio:.0%}, backing off: "
+            f"concurrency={self.concurrency_limit:.1f}, rate={self.rate:.2f}/s"
+        )
+
+        if self._redis is not None:
+            asyncio.get_running_loop().run_in_executor(
+                None, self._share_backoff, time.time() + settings.UPSTREAM_BACKOFF_SECONDS
+            )
+
+    def _share_backoff(self, backoff_until: float):
+        """Сообщить остальным подам о паузе (выполняется в пуле потоков)"""
+        try:
+            self._redis.set(
+                f"{self.REDIS_PREFIX}:backoff_until",
+                backoff_until,
+                ex=int(settings.UPSTREAM_BACKOFF_SECONDS) + 1,
+            )
+        except Exception as e:
+            logger.warning(f"Failed to share backoff via Redis: {e}")
+
+    @asynccontextmanager
+    async def acquire(self, priority: Priority = Priority.INTERACTIVE):
+        """Получить право на один запрос к API Победы"""
+        await self._acquire_slot(priority)
+        try:
+            await self._take_token()
+            self.stats["granted"][priority.name.lower()] += 1
+            yield
+        finally:
+            self._release_slot()
+
+    def get_stats(self) -> Dict:
+        """Текущее состояние лимитера"""
+        return {
+            **self.stats,
+            "in_flight": self._in_flight,
+            "queued": sum(1 for _, _, f in self._waiters if not f.done()),
+            "concurrency_limit": round(self.concurrency_limit, 2),
+            "rate_per_second": round(self.rate, 2),
+            "redis_coordination": self._redis is not None,
+        }
+
+
+# Глобальный лимитер процесса
+upstream_limiter = UpstreamRateLimiter(
+    rate_per_second=settings.UPSTREAM_RATE_PER_SECOND,
+    burst=settings.UPSTREAM_BURST,
+    max_concurrency=settings.UPSTREAM_MAX_CONCURRENCY,
+    min_concurrency=settings.UPSTREAM_MIN_CONCURRENCY,
+)
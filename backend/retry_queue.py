@@ -0,0 +1,260 @@
+# retry_queue.py
+import asyncio
+import logging
+import random
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from config import settings
+from http_client import pobeda_http
+from models import FlightRetryTask
+from rate_limiter import Priority
+from sqlalchemy import and_, delete, func, or_, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+
+class RetryQueue:
+    """Очередь повторов для дат, на которые API Победы ответило 403/429.
+
+    Задачи лежат в Postgres (flight_retry_queue), поэтому переживают рестарт
+    и разбираются воркерами всех подов: выборка идет через FOR UPDATE SKIP
+    LOCKED. Повторы - с экспоненциальной паузой и случайным разбросом,
+    запросы идут через общий лимитер с фоновым приоритетом.
+    """
+
+    CLEANUP_INTERVAL_SECONDS = 3600
+    KEEP_FINISHED = timedelta(days=1)
+    ACTIVE_STATUSES = ("pending", "running")
+
+    def __init__(self):
+        self._last_cleanup = 0.0
+        self.stats = {
+            "enqueued": 0,
+            "deduplicated": 0,  # дата уже ждала повтора
+            "succeeded": 0,
+            "retried": 0,
+            "failed": 0,
+        }
+
+    @staticmethod
+    def backoff_seconds(attempts: int) -> float:
+        """Экспоненциальная пауза перед следующей попыткой, +-50% случайного разброса"""
+        delay = min(
+            settings.RETRY_QUEUE_BASE_DELAY_SECONDS * 2 ** max(attempts - 1, 0), settings.RETRY_QUEUE_MAX_DELAY_SECONDS
+        )
+        return delay * random.uniform(0.5, 1.5)
+
+    async def enqueue(
+        self, db: AsyncSession, origin: str, destination: str, dates: List[Dict], promo_code: Optional[str] = None
+    ) -> str:
+        """Поставить даты в очередь повторов, вернуть job_id для опроса клиентом.
+
+        Даты, которые уже ждут повтора (тот же поиск снова получил 403), второй
+        раз не ставятся: новые даты добавляются к существующему заданию, и
+        клиент получает его job_id. Гонку между подами закрывает частичный
+        уникальный индекс uq_flight_retry_active.
+        """
+        flight_dates = [datetime.strptime(date_info["db"], "%Y-%m-%d").date() for date_info in dates]
+        result = await db.execute(
+            select(FlightRetryTask.job_id, FlightRetryTask.flight_date).where(
+                FlightRetryTask.origin_city_code == origin,
+                FlightRetryTask.destination_city_code == destination,
+                func.coalesce(FlightRetryTask.promo_code, "") == (promo_code or ""),
+                FlightRetryTask.flight_date.in_(flight_dates),
+                FlightRetryTask.status.in_(self.ACTIVE_STATUSES),
+            )
+        )
+        active = result.all()
+        # Задание, в котором больше всего этих дат, - остальные даты добавятся к нему
+        job_id = Counter(row.job_id for row in active).most_common(1)[0][0] if active else uuid.uuid4()
+        queued = {row.flight_date for row in active}
+        now = datetime.now(timezone.utc)
+
+        new_dates = [flight_date for flight_date in flight_dates if flight_date not in queued]
+        inserted = 0
+        if new_dates:
+            result = await db.execute(
+                insert(FlightRetryTask)
+                .values(
+                    [
+                        {
+                            "id": uuid.uuid4(),
+                            "job_id": job_id,
+                            "origin_city_code": origin,
+                            "destination_city_code": destination,
+                            "flight_date": flight_date,
+                            "promo_code": promo_code,
+                            "status": "pending",
+                            "attempts": 0,
+                            "next_attempt_at": now + timedelta(seconds=self.backoff_seconds(1)),
+                        }
+                        for flight_date in new_dates
+                    ]
+                )
+                .on_conflict_do_nothing(
+                    index_elements=[
+                        FlightRetryTask.origin_city_code,
+                        FlightRetryTask.destination_city_code,
+                        FlightRetryTask.flight_date,
+                        func.coalesce(FlightRetryTask.promo_code, ""),
+                    ],
+                    index_where=FlightRetryTask.status.in_(self.ACTIVE_STATUSES),
+                )
+            )
+            inserted = result.rowcount
+        await db.commit()
+
+        self.stats["enqueued"] += inserted
+        self.stats["deduplicated"] += len(dates) - inserted
+        logger.info(
+            f"🕒 Queued {inserted} blocked dates {origin}-{destination} for retry "
+            f"({len(dates) - inserted} already queued), job {job_id}"
+        )
+        return str(job_id)
+
+    async def get_job(self, db: AsyncSession, job_id: str) -> Optional[Dict]:
+        """Состояние задания: сколько дат получено, ждет повтора или не удалось"""
+        try:
+            job_uuid = uuid.UUID(job_id)
+        except ValueError:
+            return None
+
+        result = await db.execute(
+            select(FlightRetryTask.status, func.count())
+            .where(FlightRetryTask.job_id == job_uuid)
+            .group_by(FlightRetryTask.status)
+        )
+        counts = dict(result.all())
+        if not counts:
+            return None
+
+        pending = counts.get("pending", 0) + counts.get("running", 0)
+        failed = counts.get("failed", 0)
+        if pending:
+            status = "running"
+        else:
+            status = "failed" if failed else "completed"
+
+        return {
+            "job_id": job_id,
+            "status": status,
+            "dates_total": sum(counts.values()),
+            "dates_done": counts.get("done", 0),
+            "dates_pending": pending,
+            "dates_failed": failed,
+            "is_complete": not pending and not failed,
+        }
+
+    async def _claim(self, db: AsyncSession) -> List[FlightRetryTask]:
+        """Забрать готовые к повтору задачи; другие поды их уже не увидят"""
+        stuck_before = datetime.now(timezone.utc) - timedelta(seconds=settings.RETRY_QUEUE_RUNNING_TIMEOUT_SECONDS)
+        result = await db.execute(
+            select(FlightRetryTask)
+            .where(
+                or_(
+                    and_(FlightRetryTask.status == "pending", FlightRetryTask.next_attempt_at <= func.now()),
+                    and_(FlightRetryTask.status == "running", FlightRetryTask.updated_at < stuck_before),
+                )
+            )
+            .order_by(FlightRetryTask.next_attempt_at)
+            .limit(settings.RETRY_QUEUE_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )
+        tasks = result.scalars().all()
+        for task in tasks:
+            task.status = "running"
+            task.attempts += 1
+        await db.commit()
+        return tasks
+
+    async def _process(self, db: AsyncSession, tasks: List[FlightRetryTask]):
+        from flight_service import FlightService
+
+        flight_service = FlightService(db, priority=Priority.BACKGROUND)
+        session = await pobeda_http.get_session()
+        results = await asyncio.gather(
+            *[
+                flight_service._search_single_flight(
+                    session,
+                    task.origin_city_code,
+                    task.destination_city_code,
+                    task.flight_date.strftime("%d.%m.%Y"),
+                    task.promo_code,
+                )
+                for task in tasks
+            ],
+            return_exceptions=True,
+        )
+
+        now = datetime.now(timezone.utc)
+        to_cache: Dict[tuple, List[Dict]] = {}
+        for task, result in zip(tasks, results):
+            if isinstance(result, dict):
+                task.status = "done"
+                task.last_error = None
+                self.stats["succeeded"] += 1
+                route = (task.origin_city_code, task.destination_city_code, task.promo_code)
+                to_cache.setdefault(route, []).append(result)
+                continue
+
+            task.last_error = str(result)[:200] if isinstance(result, Exception) else "upstream blocked"
+            if task.attempts >= settings.RETRY_QUEUE_MAX_ATTEMPTS:
+                task.status = "failed"
+                self.stats["failed"] += 1
+            else:
+                task.status = "pending"
+                task.next_attempt_at = now + timedelta(seconds=self.backoff_seconds(task.attempts + 1))
+                self.stats["retried"] += 1
+        await db.commit()
+
+        for (origin, destination, promo_code), route_results in to_cache.items():
+            await flight_service._cache_flights_batch(origin, destination, route_results, promo_code)
+
+        logger.info(f"🔁 Retry batch: {sum(isinstance(r, dict) for r in results)}/{len(tasks)} dates fetched")
+
+    async def _cleanup(self, db: AsyncSession):
+        """Удалить давно завершенные задачи"""
+        if time.monotonic() - self._last_cleanup < self.CLEANUP_INTERVAL_SECONDS:
+            return
+        self._last_cleanup = time.monotonic()
+        await db.execute(
+            delete(FlightRetryTask).where(
+                FlightRetryTask.status.in_(["done", "failed"]),
+                FlightRetryTask.updated_at < datetime.now(timezone.utc) - self.KEEP_FINISHED,
+            )
+        )
+        await db.commit()
+
+    async def run_worker(self):
+        """Фоновая задача: разбирать очередь, пока приложение работает"""
+        from database import AsyncSessionLocal
+
+        logger.info("✅ Retry queue worker started")
+        while True:
+            tasks = []
+            try:
+                async with AsyncSessionLocal() as db:
+                    await self._cleanup(db)
+                    tasks = await self._claim(db)
+                    if tasks:
+                        await self._process(db, tasks)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Retry queue worker error: {e}")
+
+            if not tasks:
+                await asyncio.sleep(settings.RETRY_QUEUE_POLL_SECONDS)
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats)
+
+
+# Очередь повторов процесса
+retry_queue = RetryQueue()
@@ -0,0 +1,147 @@
+# route_demand.py
+import asyncio
+import logging
+import math
+import time
+from typing import Dict, List, Tuple
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+Route = Tuple[str, str]  # (origin, destination)
+
+
+class RouteDemand:
+    """Популярность маршрутов по поискам пользователей.
+
+    Счетчик с экспоненциальным затуханием: каждый поиск добавляет 1,
+    а накопленное значение убывает вдвое за ROUTE_DEMAND_HALF_LIFE_HOURS.
+    Затухание считается лениво, при обращении к маршруту.
+
+    С Redis поиски всех подов складываются в общие корзины (sorted set на
+    1/24 периода полураспада), и top_shared ранжирует маршруты по всему
+    трафику: корзины за 5 периодов объединяются с весами затухания.
+    Локальный счетчик остается запасным вариантом, пока Redis недоступен.
+    """
+
+    MIN_SCORE = 0.01  # ниже - маршрут забываем
+    REDIS_PREFIX = "pobeda:route_demand"
+    BUCKETS_PER_HALF_LIFE = 24
+    HALF_LIVES_KEPT = 5  # старше - вклад меньше 1/32, корзины удаляются по TTL
+
+    def __init__(self, half_life_hours: float, max_routes: int = 10000):
+        self._decay_per_second = math.log(2) / (half_life_hours * 3600)
+        self._bucket_seconds = max(60, int(half_life_hours * 3600 / self.BUCKETS_PER_HALF_LIFE))
+        self._buckets_kept = self.BUCKETS_PER_HALF_LIFE * self.HALF_LIVES_KEPT
+        self.max_routes = max_routes
+        self._scores: Dict[Route, Tuple[float, float]] = {}  # маршрут -> (счет, время последнего обновления)
+        self._redis = None
+        self.stats = {"searches_recorded": 0, "redis_errors": 0}
+
+    def attach_redis(self, redis_client):
+        """Считать популярность по всем подам"""
+        self._redis = redis_client
+
+    def _decayed(self, score: float, updated_at: float, now: float) -> float:
+        return score * math.exp(-self._decay_per_second * (now - updated_at))
+
+    def record(self, origin: str, destination: str, weight: float = 1.0):
+        """Учесть поиск маршрута"""
+        now = time.monotonic()
+        route = (origin, destination)
+        score, updated_at = self._scores.get(route, (0.0, now))
+        self._scores[route] = (self._decayed(score, updated_at, now) + weight, now)
+        self.stats["searches_recorded"] += 1
+
+        if len(self._scores) > self.max_routes:
+            self._prune(now)
+
+        if self._redis is not None:
+            # Не ждем Redis на пути запроса
+            asyncio.get_running_loop().run_in_executor(None, self._record_shared, f"{origin}:{destination}", weight)
+
+    def record_anywhere(self, origin: str, destinations: List[str]):
+        """Поиск "Куда угодно" - один поиск, размазанный по найденным направлениям"""
+        if not destinations:
+            return
+        weight = 1.0 / len(destinations)
+        for destination in destinations:
+            self.record(origin, destination, weight)
+
+    def _bucket_key(self, bucket: int) -> str:
+        return f"{self.REDIS_PREFIX}:{bucket}"
+
+    def _record_shared(self, member: str, weight: float):
+        """Добавить поиск в текущую общую корзину (выполняется в пуле потоков)"""
+        key = self._bucket_key(int(time.time()) // self._bucket_seconds)
+        try:
+            pipe = self._redis.pipeline()
+            pipe.zincrby(key, weight, member)
+            pipe.expire(key, self._bucket_seconds * (self._buckets_kept + 1))
+            pipe.execute()
+        except Exception as e:
+            self.stats["redis_errors"] += 1
+            logger.warning(f"Failed to record route demand in Redis: {e}")
+
+    def _top_shared(self, limit: int) -> List[Tuple[Route, float]]:
+        now = time.time()
+        current_bucket = int(now) // self._bucket_seconds
+        weights = {}
+        for age in range(self._buckets_kept):
+            bucket = current_bucket - age
+            # Затухание от середины корзины до текущего момента
+            seconds_ago = now - (bucket + 0.5) * self._bucket_seconds
+            weights[self._bucket_key(bucket)] = math.exp(-self._decay_per_second * max(seconds_ago, 0.0))
+
+        union_key = f"{self.REDIS_PREFIX}:top:{current_bucket}:{id(self)}"
+        pipe = self._redis.pipeline()
+        pipe.zunionstore(union_key, weights)
+        pipe.zrevrangebyscore(union_key, "+inf", self.MIN_SCORE, start=0, num=limit, withscores=True)
+        pipe.delete(union_key)
+        _, top, _ = pipe.execute()
+
+        result = []
+        for member, score in top:
+            member = member.decode() if isinstance(member, bytes) else member
+            origin, destination = member.split(":", 1)
+            result.append(((origin, destination), float(score)))
+        return result
+
+    async def top_shared(self, limit: int) -> List[Tuple[Route, float]]:
+        """Самые востребованные маршруты по всем подам; без Redis - по своему трафику"""
+        if self._redis is not None:
+            try:
+                return await asyncio.to_thread(self._top_shared, limit)
+            except Exception as e:
+                self.stats["redis_errors"] += 1
+                logger.warning(f"Shared route demand unavailable, using local counters: {e}")
+        return self.top(limit)
+
+    def _prune(self, now: float):
+        current = {route: self._decayed(score, at, now) for route, (score, at) in self._scores.items()}
+        keep = sorted(current, key=current.get, reverse=True)[: self.max_routes // 2]
+        self._scores = {route: (current[route], now) for route in keep if current[route] >= self.MIN_SCORE}
+
+    def top(self, limit: int) -> List[Tuple[Route, float]]:
+        """Самые востребованные маршруты с текущей популярностью"""
+        now = time.monotonic()
+        current = [(route, self._decayed(score, at, now)) for route, (score, at) in self._scores.items()]
+        current = [(route, score) for route, score in current if score >= self.MIN_SCORE]
+        current.sort(key=lambda item: item[1], reverse=True)
+        return current[:limit]
+
+    def get_stats(self) -> Dict:
+        return {
+            **self.stats,
+            "routes_tracked": len(self._scores),
+            "shared": self._redis is not None,
+            "top": [
+                {"origin": origin, "destination": destination, "popularity": round(score, 2)}
+                for (origin, destination), score in self.top(10)
+            ],
+        }
+
+
+# Популярность маршрутов (наполняется из /flights/search и /flights/anywhere)
+route_demand = RouteDemand(half_life_hours=settings.ROUTE_DEMAND_HALF_LIFE_HOURS)
@@ -0,0 +1,190 @@
+# singleflight.py
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+import json_codec
+from config import settings
+from rate_limiter import Priority
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Объединение одинаковых одновременных запросов к API Победы.
+
+    Все вызывающие с одним ключом ждут один общий запрос. С Redis то же
+    самое работает между подами: запрос выполняет под, взявший блокировку,
+    остальные забирают его результат из Redis.
+
+    Запрос к API идет с приоритетом того, кто его начал. Более важный
+    вызывающий (пользователь против фонового обновления) не ждет менее
+    важного лидера, а выполняет свой запрос, к которому присоединяются
+    следующие такие же. Блокировка в Redis продлевается, пока лидер работает.
+    """
+
+    REDIS_PREFIX = "pobeda:singleflight"
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, Tuple[asyncio.Task, Priority]] = {}
+        self._redis = None
+        self.stats = {
+            "calls": 0,
+            "leaders": 0,  # реально выполненные запросы
+            "coalesced": 0,  # присоединились к запросу внутри процесса
+            "redis_coalesced": 0,  # получили результат другого пода
+            "redis_fallbacks": 0,  # не дождались другого пода и пошли сами
+            "priority_bypass": 0,  # не стали ждать менее приоритетного лидера
+        }
+
+    def attach_redis(self, redis_client):
+        """Включить дедупликацию между подами через Redis"""
+        self._redis = redis_client
+        logger.info("✅ Single-flight coordinated via Redis")
+
+    async def do(
+        self, key: Hashable, fn: Callable[[], Awaitable[Any]], priority: Priority = Priority.INTERACTIVE
+    ) -> Any:
+        """Выполнить fn один раз на ключ; остальные вызовы ждут тот же результат"""
+        self.stats["calls"] += 1
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            task, leader_priority = inflight
+            if leader_priority <= priority:
+                self.stats["coalesced"] += 1
+                return await asyncio.shield(task)
+            # Лидер стоит в очереди лимитера с низким приоритетом - идем сами
+            self.stats["priority_bypass"] += 1
+
+        # Отдельная задача: отмена первого вызывающего не отменяет запрос для остальных
+        task = asyncio.ensure_future(self._run(key, fn, priority))
+        self._inflight[key] = (task, priority)
+        task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        inflight = self._inflight.get(key)
+        if inflight is not None and inflight[0] is task:
+            del self._inflight[key]
+
+    async def _run(self, key: Hashable, fn: Callable[[], Awaitable[Any]], priority: Priority) -> Any:
+        if self._redis is None:
+            self.stats["leaders"] += 1
+            return await fn()
+        return await self._run_with_redis_lock(key, fn, priority)
+
+    async def _run_with_redis_lock(self, key: Hashable, fn: Callable[[], Awaitable[Any]], priority: Priority) -> Any:
+        key_str = ":".join(str(part) for part in key) if isinstance(key, tuple) else str(key)
+        lock_key = f"{self.REDIS_PREFIX}:lock:{key_str}"
+        result_key = f"{self.REDIS_PREFIX}:result:{key_str}"
+        # Приоритет лидера - в значении блокировки, чтобы другие поды знали, стоит ли его ждать
+        token = f"{uuid.uuid4().hex}:{int(priority)}"
+
+        try:
+            acquired = await asyncio.to_thread(
+                self._redis.set, lock_key, token, nx=True, px=settings.SINGLEFLIGHT_LOCK_TTL_MS
+            )
+        except Exception as e:
+            logger.warning(f"Redis single-flight unavailable, deduping in-process only: {e}")
+            self.stats["leaders"] += 1
+            return await fn()
+
+        if acquired:
+            self.stats["leaders"] += 1
+            renewer = asyncio.ensure_future(self._renew_lock(lock_key, token))
+            try:
+                result = await fn()
+                # Ответ уже получен: без Redis другие поды просто не дождутся его и сходят сами
+                try:
+                    await asyncio.to_thread(
+                        self._redis.set,
+                        result_key,
+                        json_codec.dumps(result),
+                        ex=settings.SINGLEFLIGHT_RESULT_TTL_SECONDS,
+                    )
+                except Exception as e:
+                    logger.warning(f"Failed to share single-flight result {result_key}: {e}")
+                return result
+            finally:
+                renewer.cancel()
+                await asyncio.to_thread(self._release_lock, lock_key, token)
+
+        # Этот запрос уже выполняет другой под - ждем его результат.
+        # В процессе его ждет только этот лидер, остальные вызывающие присоединены к нему
+        deadline = time.monotonic() + settings.SINGLEFLIGHT_MAX_WAIT_SECONDS
+        interval = settings.SINGLEFLIGHT_POLL_INTERVAL_SECONDS
+        while time.monotonic() < deadline:
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, settings.SINGLEFLIGHT_POLL_MAX_INTERVAL_SECONDS)
+            try:
+                pipe = self._redis.pipeline()
+                pipe.get(result_key)
+                pipe.get(lock_key)
+                cached, holder = await asyncio.to_thread(pipe.execute)
+            except Exception:
+                break
+            if cached is not None:
+                try:
+                    result = json_codec.loads(cached)
+                except ValueError as e:
+                    logger.warning(f"Corrupt single-flight result {result_key}: {e}")
+                    break
+                self.stats["redis_coalesced"] += 1
+                return result
+            if holder is None:
+                break
+            if self._holder_priority(holder) > priority:
+                self.stats["priority_bypass"] += 1
+                break
+
+        self.stats["redis_fallbacks"] += 1
+        self.stats["leaders"] += 1
+        return await fn()
+
+    @staticmethod
+    def _holder_priority(holder) -> Priority:
+        """Приоритет лидера другого пода из значения блокировки"""
+        try:
+            return Priority(int(holder.rsplit(":", 1)[1]))
+        except (IndexError, ValueError):
+            return Priority.INTERACTIVE
+
+    async def _renew_lock(self, lock_key: str, token: str):
+        """Продлевать блокировку, пока лидер ждет API: медленный поиск не должен ее потерять"""
+        period = settings.SINGLEFLIGHT_LOCK_TTL_MS / 3000
+        while True:
+            await asyncio.sleep(period)
+            try:
+                if not await asyncio.to_thread(self._extend_lock, lock_key, token):
+                    return
+            except Exception as e:
+                logger.warning(f"Failed to extend single-flight lock {lock_key}: {e}")
+
+    def _extend_lock(self, lock_key: str, token: str) -> bool:
+        if self._redis.get(lock_key) != token:
+            return False
+        return bool(self._redis.pexpire(lock_key, settings.SINGLEFLIGHT_LOCK_TTL_MS))
+
+    def _release_lock(self, lock_key: str, token: str):
+        """Снять блокировку, только если она все еще наша"""
+        try:
+            if self._redis.get(lock_key) == token:
+                self._redis.delete(lock_key)
+        except Exception as e:
+            logger.warning(f"Failed to release single-flight lock {lock_key}: {e}")
+
+    def get_stats(self) -> Dict:
+        """Счетчики объединения запросов"""
+        saved = self.stats["coalesced"] + self.stats["redis_coalesced"]
+        return {
+            **self.stats,
+            "in_flight": len(self._inflight),
+            "coalesce_ratio": round(saved / self.stats["calls"], 3) if self.stats["calls"] else 0.0,
+        }
+
+
+# Объединение одинаковых поисков (origin, destination, date, promo) в процессе
+flight_singleflight = SingleFlight()
@@ -0,0 +1,83 @@
+# stale_refresher.py
+import asyncio
+import logging
+from typing import Dict, List, Optional, Set
+
+from cache_key import CacheKey
+from rate_limiter import Priority
+
+logger = logging.getLogger(__name__)
+
+
+class StaleRefresher:
+    """Фоновое обновление устаревших дней для stale-while-revalidate.
+
+    Пользователь сразу получает просроченные строки кеша, а свежие данные
+    по этим датам запрашиваются здесь - со своей сессией БД и с фоновым
+    приоритетом в лимитере. Одна дата обновляется не больше одного раза
+    одновременно, сколько бы поисков ее ни запросили.
+    """
+
+    def __init__(self):
+        self._pending: Set[CacheKey] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.stats = {
+            "scheduled": 0,
+            "deduped": 0,
+            "refreshed": 0,
+            "failed": 0,
+        }
+
+    def schedule(self, origin: str, destination: str, dates: List[Dict], promo_code: Optional[str] = None):
+        """Поставить обновление дат в фон; уже обновляемые даты пропускаются"""
+        new_dates = []
+        for date_info in dates:
+            key = CacheKey.of(origin, destination, date_info["db"], promo_code)
+            if key in self._pending:
+                self.stats["deduped"] += 1
+                continue
+            self._pending.add(key)
+            new_dates.append(date_info)
+
+        if not new_dates:
+            return
+
+        self.stats["scheduled"] += len(new_dates)
+        task = asyncio.create_task(self._refresh(origin, destination, new_dates, promo_code))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refresh(self, origin: str, destination: str, dates: List[Dict], promo_code: Optional[str]):
+        from database import AsyncSessionLocal
+        from flight_service import FlightService
+
+        try:
+            async with AsyncSessionLocal() as db:
+                flight_service = FlightService(db, priority=Priority.BACKGROUND)
+                results = await flight_service._search_flights_parallel(origin, destination, dates, promo_code)
+                # Дни без рейсов тоже кешируем - иначе они так и остались бы просроченными
+                answered = [r for r in results if r]
+                if answered:
+                    await flight_service._cache_flights_batch(origin, destination, answered, promo_code)
+
+            self.stats["refreshed"] += len(answered)
+            self.stats["failed"] += len(dates) - len(answered)
+            logger.info(f"🔄 Revalidated {len(answered)}/{len(dates)} stale days {origin}-{destination}")
+        except Exception as e:
+            self.stats["failed"] += len(dates)
+            logger.error(f"Stale refresh {origin}-{destination} failed: {e}")
+        finally:
+            for date_info in dates:
+                self._pending.discard(CacheKey.of(origin, destination, date_info["db"], promo_code))
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def get_stats(self) -> Dict:
+        return {**self.stats, "in_progress": len(self._pending)}
+
+
+# Фоновые обновления устаревшего кеша процесса
+stale_refresher = StaleRefresher()
@@ -0,0 +1,79 @@
+# startup.py
+import asyncio
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+async def wait_for_dependency(
+    name: str,
+    probe: Callable[[], Awaitable[bool]],
+    timeout: float,
+    initial_delay: float = 0.05,
+    max_delay: float = 2.0,
+) -> bool:
+    """Проверять зависимость, пока probe() не вернет True или не выйдет timeout.
+
+    Пауза между попытками растет вдвое (с разбросом) от initial_delay до max_delay,
+    поэтому уже запущенная зависимость проходит с первой попытки без ожиданий,
+    а поднимающаяся - не засыпается запросами.
+    """
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            if await probe():
+                if attempt > 1:
+                    logger.info(f"✅ {name} ready after {attempt} attempts")
+                return True
+        except Exception as e:
+            logger.debug(f"{name} probe attempt {attempt} failed: {e}")
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            logger.warning(f"❌ {name} not ready after {timeout:.0f}s ({attempt} attempts)")
+            return False
+        await asyncio.sleep(min(delay * random.uniform(0.5, 1.0), remaining))
+        delay = min(delay * 2, max_delay)
+
+
+class StartupProfile:
+    """Время фаз запуска: что именно задерживает готовность пода"""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.phases: Dict[str, float] = {}
+        self.ready_after: Optional[float] = None
+        self.ready = False
+
+    @asynccontextmanager
+    async def phase(self, name: str):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] = round((time.monotonic() - started) * 1000, 1)
+
+    async def timed(self, name: str, awaitable: Awaitable) -> Any:
+        """То же, что phase, для фаз, которые идут одновременно через asyncio.gather"""
+        async with self.phase(name):
+            return await awaitable
+
+    def mark_ready(self):
+        self.ready = True
+        self.ready_after = round((time.monotonic() - self.started_at) * 1000, 1)
+        phases = ", ".join(f"{name} {ms:.0f}ms" for name, ms in self.phases.items())
+        logger.info(f"⏱️ Ready in {self.ready_after:.0f}ms: {phases}")
+
+    def mark_stopping(self):
+        """Под снимается с балансировки (/health/drain из preStop) - readiness отвечает 503"""
+        self.ready = False
+
+    def report(self) -> Dict:
+        return {"ready_after_ms": self.ready_after, "phases_ms": self.phases}
@@ -0,0 +1,122 @@
+# tests/conftest.py
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+# Модули бекенда лежат плоско в backend/ и импортируются по имени, как в app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeRedis:
+    """Синхронный клиент Redis в памяти (как redis.Redis с decode_responses=True): только нужные бекенду команды"""
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+
+    def _alive(self, key):
+        expires = self.expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def get(self, key):
+        return self.data.get(key) if self._alive(key) else None
+
+    def mget(self, keys):
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value, nx=False, ex=None, px=None):
+        if nx and self._alive(key):
+            return None
+        self.data[key] = value.decode() if isinstance(value, bytes) else str(value)
+        self.expires.pop(key, None)
+        if ex is not None or px is not None:
+            self.expires[key] = time.monotonic() + (ex if ex is not None else px / 1000)
+        return True
+
+    def exists(self, key):
+        return int(self._alive(key))
+
+    def delete(self, *keys):
+        removed = 0
+        for key in keys:
+            removed += int(self._alive(key))
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return removed
+
+    def pttl(self, key):
+        if not self._alive(key):
+            return -2
+        expires = self.expires.get(key)
+        return -1 if expires is None else int((expires - time.monotonic()) * 1000)
+
+    def pexpire(self, key, ms):
+        if not self._alive(key):
+            return 0
+        self.expires[key] = time.monotonic() + ms / 1000
+        return 1
+
+    def expire(self, key, seconds):
+        return self.pexpire(key, seconds * 1000)
+
+    def incrby(self, key, amount):
+        value = int(self.get(key) or 0) + amount
+        self.data[key] = str(value)
+        return value
+
+    def decrby(self, key, amount):
+        return self.incrby(key, -amount)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis_client):
+        self._redis = redis_client
+        self._calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self._calls.append((name, args, kwargs))
+            return self
+
+        return queue
+
+    def execute(self):
+        calls, self._calls = self._calls, []
+        return [getattr(self._redis, name)(*args, **kwargs) for name, args, kwargs in calls]
+
+
+@pytest.fixture
+def fake_redis():
+    return FakeRedis()
+
+
+@pytest.fixture
+def run_with_db():
+    """Выполнить async-тест с сессией Postgres; без DATABASE_URL тест пропускается"""
+    if "DATABASE_URL" not in os.environ:
+        pytest.skip("нужен Postgres: задайте DATABASE_URL")
+    from database import AsyncSessionLocal, async_engine, create_tables
+
+    create_tables()
+
+    def run(test):
+        async def main():
+            try:
+                async with AsyncSessionLocal() as db:
+                    return await test(db)
+            finally:
+                # Пул соединений привязан к циклу событий, а у каждого теста он свой
+                await async_engine.dispose()
+
+        return asyncio.run(main())
+
+    return run
@@ -0,0 +1,77 @@
+# tests/test_anywhere_stats.py
+from datetime import date
+
+import pytest
+from anywhere_stats import AnywherePriceStats
+
+ROWS = [
+    ("LED", date(2025, 3, 3), 2500.0),  # понедельник
+    ("LED", date(2025, 3, 1), 2500.0),  # суббота, та же цена раньше
+    ("LED", date(2025, 3, 2), 4000.0),
+    ("AER", date(2025, 3, 5), 1500.0),
+    ("AER", date(2025, 4, 7), 9000.0),
+    ("KZN", date(2025, 4, 2), 6000.0),
+]
+
+
+@pytest.fixture
+def stats():
+    destinations, flight_dates, prices = zip(*ROWS)
+    return AnywherePriceStats(destinations, flight_dates, prices)
+
+
+def test_per_destination_min_and_earliest_date(stats):
+    rows = stats.per_destination()
+
+    assert [row["destination"] for row in rows] == ["AER", "LED", "KZN"]
+    led = rows[1]
+    assert led["min_price"] == 2500.0
+    assert led["cheapest_date"] == "2025-03-01"
+    assert led["avg_price"] == 3000.0
+    assert led["days_with_prices"] == 3
+
+
+def test_filtered_by_max_price(stats):
+    cheap = stats.filtered(3000)
+
+    assert len(cheap) == 3
+    assert [row["destination"] for row in cheap.per_destination()] == ["AER", "LED"]
+    assert stats.filtered(None) is stats
+
+
+def test_percentiles(stats):
+    assert stats.percentiles((0, 50, 100)) == {"p0": 1500.0, "p50": 3250.0, "p100": 9000.0}
+
+
+def test_price_bands_count_days_and_destinations(stats):
+    bands = stats.price_bands((2000, 5000))
+
+    assert bands == [
+        {"from": 0.0, "to": 2000.0, "days": 1, "destinations": 1},
+        {"from": 2000.0, "to": 5000.0, "days": 3, "destinations": 1},
+        {"from": 5000.0, "to": None, "days": 2, "destinations": 1},
+    ]
+
+
+def test_weekday_stats(stats):
+    weekdays = {row["weekday"]: row for row in stats.weekday_stats()}
+
+    assert weekdays["Пн"]["days"] == 2
+    assert weekdays["Пн"]["min_price"] == 2500.0
+    assert weekdays["Сб"]["days"] == 1
+    assert weekdays["Пт"] == {"weekday": "Пт", "days": 0, "min_price": None, "avg_price": None}
+
+
+def test_monthly_cheapest(stats):
+    assert stats.monthly_cheapest() == [
+        {"month": "2025-03", "destination": "AER", "flight_date": "2025-03-05", "min_price": 1500.0},
+        {"month": "2025-04", "destination": "KZN", "flight_date": "2025-04-02", "min_price": 6000.0},
+    ]
+
+
+def test_empty_summary():
+    summary = AnywherePriceStats([], [], []).summary()
+
+    assert summary["prices_count"] == 0
+    assert summary["min_price"] is None
+    assert summary["top_destinations"] == []
@@ -0,0 +1,45 @@
+# tests/test_cache_key.py
+from datetime import date, datetime
+
+import pytest
+from cache_key import CacheKey, parse_flight_date
+
+
+@pytest.mark.parametrize(
+    "value",
+    ["2025-03-01", "01.03.2025", date(2025, 3, 1), datetime(2025, 3, 1, 14, 30)],
+)
+def test_parse_flight_date_formats(value):
+    assert parse_flight_date(value) == date(2025, 3, 1)
+
+
+@pytest.mark.parametrize("value", ["2025-13-01", "32.01.2025", "01/03/2025"])
+def test_parse_flight_date_rejects_garbage(value):
+    with pytest.raises(ValueError):
+        parse_flight_date(value)
+
+
+def test_cache_key_same_day_from_db_api_and_request():
+    from_db = CacheKey.of("MOW", "LED", date(2025, 3, 1))
+    from_api = CacheKey.of("mow", "led", "01.03.2025", promo_code=None)
+    from_request = CacheKey.of("MOW", "LED", "2025-03-01", promo_code="", adults=None)
+
+    assert from_db == from_api == from_request
+    assert hash(from_db) == hash(from_api)
+    assert from_db.promo_code == "" and from_db.adults == 1
+
+
+def test_cache_key_promo_code_distinguishes_keys():
+    plain = CacheKey.of("MOW", "LED", "2025-03-01")
+    promo = CacheKey.of("MOW", "LED", "2025-03-01", promo_code="SALE")
+
+    assert plain != promo
+    assert plain.promo_or_none is None
+    assert promo.promo_or_none == "SALE"
+
+
+def test_cache_key_date_formats():
+    key = CacheKey.of("MOW", "LED", "01.03.2025")
+
+    assert key.db_date == "2025-03-01"
+    assert key.api_date == "01.03.2025"
@@ -0,0 +1,91 @@
+# tests/test_cache_key_lookups.py
+import asyncio
+import os
+import subprocess
+import sys
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from cache_key import CacheKey
+from flight_cache import TieredFlightCache
+from singleflight import SingleFlight
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DAY = {"date": "01.03.2025", "flights": [{"number": "DP 123"}], "prices": [3500]}
+
+# Один и тот же день, как его видят БД, ответ API и запрос пользователя
+FROM_DB = CacheKey.of("MOW", "LED", date(2025, 3, 1))
+FROM_API = CacheKey.of("MOW", "LED", "01.03.2025", promo_code=None)
+FROM_REQUEST = CacheKey.of("mow", "led", "2025-03-01", promo_code="", adults=None)
+
+
+def expires_in_hour():
+    return datetime.now(timezone.utc) + timedelta(hours=1)
+
+
+def test_same_day_shares_l1_and_redis_entries(fake_redis):
+    cache = TieredFlightCache(max_entries=10, l1_ttl_seconds=60)
+    cache.attach_redis(fake_redis)
+
+    async def unexpected_db(keys):
+        raise AssertionError(f"Postgres must not be queried for {keys}")
+
+    asyncio.run(cache.set_many({FROM_API: (DAY, expires_in_hour())}))
+    assert list(fake_redis.data) == [f"{cache.REDIS_PREFIX}:{FROM_DB.storage_key()}"]
+
+    assert asyncio.run(cache.get_many([FROM_REQUEST], unexpected_db)) == {FROM_REQUEST: DAY}
+    cache.clear_l1()
+    assert asyncio.run(cache.get_many([FROM_DB], unexpected_db)) == {FROM_DB: DAY}
+    assert (cache.stats["l1_hits"], cache.stats["l2_hits"]) == (1, 1)
+
+
+def test_postgres_rows_answer_keys_from_requests():
+    cache = TieredFlightCache(max_entries=10, l1_ttl_seconds=60)
+    requested = []
+
+    async def db_loader(keys):
+        requested.extend(keys)
+        # Как _load_cached_flights_db: ключ строится из даты строки БД
+        return {FROM_DB: (DAY, expires_in_hour())}
+
+    assert asyncio.run(cache.get_many([FROM_REQUEST], db_loader)) == {FROM_REQUEST: DAY}
+    assert requested == [FROM_DB]
+
+    # Поднятое из Postgres в L1 находится по ключу в формате API
+    assert asyncio.run(cache.get_many([FROM_API], db_loader)) == {FROM_API: DAY}
+    assert len(requested) == 1
+
+
+def test_single_flight_coalesces_same_day_in_any_format(fake_redis):
+    flight = SingleFlight()
+    flight.attach_redis(fake_redis)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return DAY
+
+    async def main():
+        return await asyncio.gather(*(flight.do(key, fetch) for key in (FROM_DB, FROM_API, FROM_REQUEST)))
+
+    assert asyncio.run(main()) == [DAY] * 3
+    assert len(calls) == 1
+    assert list(fake_redis.data) == [f"{flight.REDIS_PREFIX}:result:{FROM_DB}"]
+
+
+def test_recorded_workload_calls_upstream_once_per_route_day():
+    """Повтор записанной нагрузки: запросы к API только при первом поиске маршрута"""
+    if "DATABASE_URL" not in os.environ:
+        pytest.skip("нужен Postgres: задайте DATABASE_URL")
+
+    result = subprocess.run(
+        [sys.executable, os.path.join("benchmarks", "replay_cache_hits.py")],
+        cwd=BACKEND_DIR,
+        env={**os.environ, "LOG_CONSOLE": "false", "LOG_FILE": ""},
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+
+    assert result.returncode == 0, result.stdout + result.stderr
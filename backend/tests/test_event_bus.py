@@ -0,0 +1,103 @@
+# tests/test_event_bus.py
+import os
+
+import json_codec
+import pytest
+from config import settings
+from event_bus import OVERFLOW_DROP_NEWEST, EventBus
+
+
+class FakeFuture:
+    def add_callback(self, fn, *args):
+        fn(*args, None)
+
+    def add_errback(self, fn, *args):
+        pass
+
+
+class FakeProducer:
+    def __init__(self, fail_on: int = None):
+        self.sent = []
+        self.fail_on = fail_on
+
+    def send(self, topic, event):
+        if self.fail_on is not None and len(self.sent) == self.fail_on:
+            raise RuntimeError("broker unavailable")
+        self.sent.append(event["n"])
+        return FakeFuture()
+
+    def close(self, timeout=None):
+        pass
+
+
+@pytest.fixture
+def spool_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "events.jsonl")
+    monkeypatch.setattr(settings, "EVENT_BUS_SPOOL_PATH", path)
+    monkeypatch.setattr(settings, "EVENT_BUS_BATCH_SIZE", 2)
+    return path
+
+
+def write_spool(path, numbers, corrupt_line=False):
+    with open(path, "wb") as f:
+        for n in numbers:
+            f.write(json_codec.dumps({"topic": "searches", "event": {"n": n}}) + b"\n")
+        if corrupt_line:
+            f.write(b'{"topic": "searc')
+
+
+def test_replay_sends_spool_in_chunks_and_removes_it(spool_path):
+    write_spool(spool_path, range(5), corrupt_line=True)
+    bus = EventBus()
+    bus._producer = FakeProducer()
+
+    bus._replay_spool()
+
+    assert bus._producer.sent == [0, 1, 2, 3, 4]
+    assert bus.stats["spool_replayed"] == 5
+    assert bus.stats["spool_corrupt"] == 1
+    assert not os.listdir(os.path.dirname(spool_path))
+
+
+def test_replay_resumes_after_broker_loss_without_duplicates(spool_path):
+    write_spool(spool_path, range(5))
+    bus = EventBus()
+    bus._producer = FakeProducer(fail_on=2)
+
+    # Kafka пропала на второй пачке: ее остаток уходит обратно в спул, позиция сохранена
+    bus._replay_spool()
+    assert bus._producer is None
+    assert os.path.exists(f"{spool_path}.replay")
+
+    producer = FakeProducer()
+    bus._producer = producer
+    bus._replay_spool()  # дочитываем старый файл досылки
+    bus._replay_spool()  # затем вернувшийся в спул остаток
+
+    assert producer.sent == [4, 2, 3]
+    assert not os.listdir(os.path.dirname(spool_path))
+
+
+def test_replay_yields_to_live_events(spool_path):
+    write_spool(spool_path, range(5))
+    bus = EventBus()
+    bus._producer = FakeProducer()
+    bus.publish("searches", {"n": 100})
+
+    bus._replay_spool()
+
+    assert bus._producer.sent == [0, 1]
+    assert os.path.exists(f"{spool_path}.replay.offset")
+
+
+def test_overflow_drops_oldest_or_newest(monkeypatch):
+    monkeypatch.setattr(settings, "EVENT_BUS_BUFFER_SIZE", 2)
+    bus = EventBus()
+    for n in range(3):
+        bus.publish("searches", {"n": n})
+    assert [event["n"] for _, event, _ in bus._buffer] == [1, 2]
+
+    monkeypatch.setattr(settings, "EVENT_BUS_OVERFLOW_POLICY", OVERFLOW_DROP_NEWEST)
+    assert bus.publish("searches", {"n": 3}) is False
+    assert [event["n"] for _, event, _ in bus._buffer] == [1, 2]
+    assert bus.stats["dropped"] == 2
@@ -0,0 +1,49 @@
+# tests/test_fare_model.py
+from fare_model import FareDay
+
+DAY = {
+    "date": "01.03.2025",
+    "origin": "MOW",
+    "destination": "LED",
+    "flights": [{"id": "F1"}, {"id": "F2"}, {"id": "F3"}],
+    "prices": [
+        {"F1": [{"brand": "BASIC", "price": 3990}, {"brand": "PLUS", "price": 5490}]},
+        {"F2": [{"brand": "BASIC", "price": 2990}, {"brand": "MAX", "price": 7990}, {"brand": "PLUS", "price": None}]},
+        {"F3": [{"price": 2990}]},
+    ],
+}
+
+
+def test_from_api_packs_fares():
+    day = FareDay.from_api(DAY)
+
+    assert day.date == "01.03.2025"
+    assert (day.origin, day.destination) == ("MOW", "LED")
+    assert day.flights_count == 3
+    assert day.flight_ids == ("F1", "F2", "F3")
+    assert day.families == ("BASIC", "PLUS", "MAX")
+    assert list(day.prices) == [3990.0, 5490.0, 2990.0, 7990.0, 2990.0]
+
+
+def test_cheapest_takes_first_of_equal_prices():
+    assert FareDay.from_api(DAY).cheapest() == (2990.0, "F2", "BASIC")
+
+
+def test_family_minimums_skip_fares_without_family():
+    assert FareDay.from_api(DAY).family_minimums() == {"BASIC": 2990.0, "PLUS": 5490.0, "MAX": 7990.0}
+
+
+def test_day_without_flights():
+    day = FareDay.from_api({"date": "02.03.2025", "flights": [], "prices": []})
+
+    assert not day.has_prices
+    assert day.min_price is None
+    assert day.cheapest() == (None, None, None)
+    assert day.to_summary("v1")["flights_count"] == 0
+
+
+def test_flight_without_priced_fares_is_dropped():
+    day = FareDay.from_api({"date": "03.03.2025", "prices": [{"F1": [{"brand": "BASIC", "price": None}]}]})
+
+    assert day.flight_ids == ()
+    assert not day.has_prices
@@ -0,0 +1,48 @@
+# tests/test_flight_cache.py
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+import json_codec
+from cache_key import CacheKey
+from flight_cache import TieredFlightCache
+
+KEY = CacheKey.of("MOW", "LED", "2025-03-01")
+DAY = {"date": "01.03.2025", "flights": [{"number": "DP 123"}], "prices": [3500]}
+
+
+async def no_db(keys):
+    return {}
+
+
+def test_l1_returns_copies():
+    cache = TieredFlightCache(max_entries=10, l1_ttl_seconds=60)
+    asyncio.run(cache.set_many({KEY: (DAY, datetime.now(timezone.utc) + timedelta(hours=1))}))
+
+    first = asyncio.run(cache.get_many([KEY], no_db))[KEY]
+    first["flights"].clear()
+
+    assert asyncio.run(cache.get_many([KEY], no_db))[KEY] == DAY
+    assert cache.stats["l1_hits"] == 2
+
+
+def test_l2_hit_lives_in_l1_no_longer_than_in_redis(fake_redis):
+    cache = TieredFlightCache(max_entries=10, l1_ttl_seconds=60)
+    cache.attach_redis(fake_redis)
+    fake_redis.set(f"{cache.REDIS_PREFIX}:{KEY.storage_key()}", json_codec.dumps(DAY), px=5000)
+
+    assert asyncio.run(cache.get_many([KEY], no_db)) == {KEY: DAY}
+
+    expires, _ = cache._lru[KEY.storage_key()]
+    assert expires - time.monotonic() <= 5
+
+
+def test_l2_hit_without_expiry_uses_l1_ttl(fake_redis):
+    cache = TieredFlightCache(max_entries=10, l1_ttl_seconds=60)
+    cache.attach_redis(fake_redis)
+    fake_redis.set(f"{cache.REDIS_PREFIX}:{KEY.storage_key()}", json_codec.dumps(DAY))
+
+    asyncio.run(cache.get_many([KEY], no_db))
+
+    expires, _ = cache._lru[KEY.storage_key()]
+    assert 55 < expires - time.monotonic() <= 60
@@ -0,0 +1,77 @@
+# tests/test_rate_limiter.py
+import asyncio
+
+from config import settings
+from rate_limiter import Priority, UpstreamRateLimiter
+
+
+def make_limiter(max_concurrency: int = 2) -> UpstreamRateLimiter:
+    return UpstreamRateLimiter(rate_per_second=1000, burst=1000, max_concurrency=max_concurrency)
+
+
+def test_waiting_slots_go_to_higher_priority_first():
+    limiter = make_limiter(max_concurrency=1)
+    order = []
+
+    async def request(name, priority, hold):
+        async with limiter.acquire(priority):
+            order.append(name)
+            await hold.wait()
+
+    async def main():
+        first_hold, other_hold = asyncio.Event(), asyncio.Event()
+        first = asyncio.ensure_future(request("first", Priority.INTERACTIVE, first_hold))
+        await asyncio.sleep(0)
+        waiting = [
+            asyncio.ensure_future(request("background", Priority.BACKGROUND, other_hold)),
+            asyncio.ensure_future(request("anywhere", Priority.ANYWHERE, other_hold)),
+            asyncio.ensure_future(request("interactive", Priority.INTERACTIVE, other_hold)),
+        ]
+        await asyncio.sleep(0)
+        other_hold.set()
+        first_hold.set()
+        await asyncio.gather(first, *waiting)
+
+    asyncio.run(main())
+    assert order == ["first", "interactive", "anywhere", "background"]
+
+
+def test_background_leaves_reserved_slots_for_users():
+    limiter = make_limiter(max_concurrency=2)
+
+    async def main():
+        hold = asyncio.Event()
+
+        async def background():
+            async with limiter.acquire(Priority.BACKGROUND):
+                await hold.wait()
+
+        tasks = [asyncio.ensure_future(background()) for _ in range(2)]
+        await asyncio.sleep(0)
+        in_flight = limiter._in_flight
+        async with limiter.acquire(Priority.INTERACTIVE):
+            interactive_in_flight = limiter._in_flight
+        hold.set()
+        await asyncio.gather(*tasks)
+        return in_flight, interactive_in_flight
+
+    in_flight, interactive_in_flight = asyncio.run(main())
+    assert in_flight == 2 - settings.UPSTREAM_RESERVED_INTERACTIVE_SLOTS
+    assert interactive_in_flight == in_flight + 1
+
+
+def test_blocked_responses_halve_limits_and_successes_restore_them():
+    limiter = make_limiter(max_concurrency=8)
+
+    async def main():
+        for _ in range(5):
+            limiter.record_response(403)
+
+    asyncio.run(main())
+    assert limiter.stats["backoffs"] == 1
+    assert limiter.concurrency_limit == 4
+    assert limiter.rate == 500
+
+    for _ in range(200):
+        limiter.record_response(200)
+    assert limiter.concurrency_limit == 8
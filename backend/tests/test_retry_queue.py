@@ -0,0 +1,44 @@
+# tests/test_retry_queue.py
+from config import settings
+from models import FlightRetryTask
+from retry_queue import RetryQueue
+from sqlalchemy import delete, func, select
+
+ROUTE = ("ZZA", "ZZB")
+
+
+def test_backoff_grows_and_is_capped():
+    first = [RetryQueue.backoff_seconds(1) for _ in range(50)]
+    capped = [RetryQueue.backoff_seconds(50) for _ in range(50)]
+
+    base = settings.RETRY_QUEUE_BASE_DELAY_SECONDS
+    assert all(base * 0.5 <= delay <= base * 1.5 for delay in first)
+    assert all(delay <= settings.RETRY_QUEUE_MAX_DELAY_SECONDS * 1.5 for delay in capped)
+
+
+def test_repeated_block_reuses_pending_job(run_with_db):
+    queue = RetryQueue()
+
+    async def scenario(db):
+        await db.execute(delete(FlightRetryTask).where(FlightRetryTask.origin_city_code == ROUTE[0]))
+        first = await queue.enqueue(db, *ROUTE, [{"db": "2030-01-01"}, {"db": "2030-01-02"}])
+        second = await queue.enqueue(db, *ROUTE, [{"db": "2030-01-02"}, {"db": "2030-01-03"}])
+        promo = await queue.enqueue(db, *ROUTE, [{"db": "2030-01-02"}], "PROMO")
+        rows = (
+            await db.execute(
+                select(FlightRetryTask.flight_date, FlightRetryTask.promo_code, func.count())
+                .where(FlightRetryTask.origin_city_code == ROUTE[0])
+                .group_by(FlightRetryTask.flight_date, FlightRetryTask.promo_code)
+            )
+        ).all()
+        job = await queue.get_job(db, second)
+        await db.execute(delete(FlightRetryTask).where(FlightRetryTask.origin_city_code == ROUTE[0]))
+        await db.commit()
+        return first, second, promo, rows, job
+
+    first, second, promo, rows, job = run_with_db(scenario)
+
+    assert first == second != promo
+    assert all(count == 1 for _, _, count in rows) and len(rows) == 4
+    assert job["dates_total"] == 3
+    assert queue.stats["deduplicated"] == 1
@@ -0,0 +1,31 @@
+# tests/test_route_etag.py
+from datetime import datetime, timezone
+
+from cache_key import CacheKey
+from flight_service import route_etag
+
+NOW = datetime(2025, 3, 1, tzinfo=timezone.utc)
+KEYS = [CacheKey.of("MOW", "LED", "2025-03-01"), CacheKey.of("MOW", "LED", "2025-03-02")]
+
+
+def versions(*hashes):
+    return {key: (content_hash, NOW) for key, content_hash in zip(KEYS, hashes)}
+
+
+def test_route_etag_is_weak_and_stable():
+    etag = route_etag(versions("a", "b"), KEYS, "full")
+
+    assert etag.startswith('W/"') and etag.endswith('"')
+    assert etag == route_etag(versions("a", "b"), KEYS, "full")
+
+
+def test_route_etag_changes_with_content_hash():
+    assert route_etag(versions("a", "b"), KEYS, "full") != route_etag(versions("a", "c"), KEYS, "full")
+
+
+def test_route_etag_depends_on_view():
+    assert route_etag(versions("a", "b"), KEYS, "full") != route_etag(versions("a", "b"), KEYS, "summary")
+
+
+def test_route_etag_missing_day_differs_from_cached_day():
+    assert route_etag(versions("a"), KEYS, "full") != route_etag(versions("a", "b"), KEYS, "full")
@@ -0,0 +1,109 @@
+# tests/test_singleflight.py
+import asyncio
+
+import json_codec
+from config import settings
+from rate_limiter import Priority
+from singleflight import SingleFlight
+
+KEY = ("MOW", "LED", "2025-03-01")
+
+
+def test_concurrent_calls_share_one_request():
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"prices": [3500]}
+
+    async def main():
+        return await asyncio.gather(*(flight.do(KEY, fetch) for _ in range(5)))
+
+    assert asyncio.run(main()) == [{"prices": [3500]}] * 5
+    assert len(calls) == 1
+    assert flight.stats["coalesced"] == 4
+
+
+def test_interactive_caller_does_not_wait_for_background_leader():
+    flight = SingleFlight()
+    calls = []
+
+    async def main():
+        background_release = asyncio.Event()
+
+        async def background_fetch():
+            calls.append("background")
+            await background_release.wait()
+            return "background"
+
+        async def interactive_fetch():
+            calls.append("interactive")
+            return "interactive"
+
+        background = asyncio.ensure_future(flight.do(KEY, background_fetch, Priority.BACKGROUND))
+        await asyncio.sleep(0)
+        interactive = await asyncio.gather(
+            flight.do(KEY, interactive_fetch, Priority.INTERACTIVE),
+            flight.do(KEY, interactive_fetch, Priority.INTERACTIVE),
+        )
+        background_release.set()
+        return interactive, await background
+
+    assert asyncio.run(main()) == (["interactive", "interactive"], "background")
+    assert calls == ["background", "interactive"]
+    assert flight.stats["priority_bypass"] == 1
+
+
+def test_follower_takes_result_of_other_pod(fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "SINGLEFLIGHT_POLL_INTERVAL_SECONDS", 0.01)
+    leader, follower = SingleFlight(), SingleFlight()
+    leader.attach_redis(fake_redis)
+    follower.attach_redis(fake_redis)
+
+    async def main():
+        async def slow_fetch():
+            await asyncio.sleep(0.1)
+            return {"prices": [3500]}
+
+        async def unexpected_fetch():
+            raise AssertionError("follower must not call the API")
+
+        first = asyncio.ensure_future(leader.do(KEY, slow_fetch))
+        await asyncio.sleep(0.02)
+        return await asyncio.gather(first, follower.do(KEY, unexpected_fetch))
+
+    assert asyncio.run(main()) == [{"prices": [3500]}] * 2
+    assert follower.stats["redis_coalesced"] == 1
+
+
+def test_interactive_follower_skips_background_leader_of_other_pod(fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "SINGLEFLIGHT_POLL_INTERVAL_SECONDS", 0.01)
+    flight = SingleFlight()
+    flight.attach_redis(fake_redis)
+    fake_redis.set(f"{flight.REDIS_PREFIX}:lock:MOW:LED:2025-03-01", f"other:{int(Priority.BACKGROUND)}", px=30000)
+
+    async def fetch():
+        return "own"
+
+    assert asyncio.run(flight.do(KEY, fetch, Priority.INTERACTIVE)) == "own"
+    assert flight.stats["priority_bypass"] == 1
+
+
+def test_leader_keeps_lock_while_request_runs(fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "SINGLEFLIGHT_LOCK_TTL_MS", 150)
+    flight = SingleFlight()
+    flight.attach_redis(fake_redis)
+    lock_key = f"{flight.REDIS_PREFIX}:lock:MOW:LED:2025-03-01"
+    result_key = f"{flight.REDIS_PREFIX}:result:MOW:LED:2025-03-01"
+
+    async def slow_fetch():
+        await asyncio.sleep(0.4)
+        # Без продления блокировка истекла бы через 150 мс
+        assert fake_redis.exists(lock_key)
+        return {"prices": [3500]}
+
+    assert asyncio.run(flight.do(KEY, slow_fetch)) == {"prices": [3500]}
+    assert not fake_redis.exists(lock_key)
+    assert json_codec.loads(fake_redis.get(result_key)) == {"prices": [3500]}
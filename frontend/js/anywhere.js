@@ -86,7 +86,7 @@
 
         try {
             // Формируем URL с правильными параметрами
-            let url = `${this.app.API_BASE}/flights/anywhere?origin=${encodeURIComponent(origin)}&months_ahead=${months}`;
+            let url = `${this.app.API_BASE}/flights/anywhere/stream?origin=${encodeURIComponent(origin)}&months_ahead=${months}`;
             if (promoCode) url += `&promo_code=${encodeURIComponent(promoCode)}`;
             if (maxPrice) url += `&max_price=${parseFloat(maxPrice)}`;
 
@@ -99,7 +99,25 @@
                 throw new Error(errorData.detail || `HTTP error! status: ${response.status}`);
             }
 
-            const data = await response.json();
+            // Читаем NDJSON поток: направления показываем сразу, как только они готовы
+            const data = { origin, months_ahead: months, cheapest_flights: [] };
+            await this.readEventStream(response, (event) => {
+                if (event.event === 'error') {
+                    throw new Error(event.error);
+                }
+                if (event.event === 'destination') {
+                    loading.style.display = 'none';
+                    data.cheapest_flights.push(event.data);
+                    this.displayDestinations(data);
+                }
+                if (event.event === 'progress') {
+                    this.updateStreamProgress(event.processed, event.total_destinations);
+                }
+                if (event.event === 'summary') {
+                    data.cheapest_flights = event.cheapest_flights;
+                }
+            });
+
             console.log('Response data:', data);
 
             loading.style.display = 'none';
@@ -112,6 +130,34 @@
         }
     }
 
+    async readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+
+            lines.filter(line => line.trim()).forEach(line => onEvent(JSON.parse(line)));
+        }
+
+        if (buffer.trim()) {
+            onEvent(JSON.parse(buffer));
+        }
+    }
+
+    updateStreamProgress(processed, total) {
+        const progress = document.querySelector('#anywhere-flights .results-subtitle');
+        if (progress && processed < total) {
+            progress.textContent = `Проверено ${processed} из ${total} направлений...`;
+        }
+    }
+
     createFullPowerLoading(origin, months) {
         const cityName = this.getCityName(origin);
         const monthText = this.getMonthText(months);
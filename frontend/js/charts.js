@@ -30,8 +30,8 @@
         `;
 
         try {
-            // Получаем данные за последние 30 дней
-            const response = await fetch(`${this.app.API_BASE}/flights/search?origin=${origin}&destination=${destination}`);
+            // Получаем данные за последние 30 дней (view=summary - только минимальные цены по дням)
+            const response = await fetch(`${this.app.API_BASE}/flights/search?origin=${origin}&destination=${destination}&view=summary`);
             const data = await response.json();
 
             if (!response.ok) {
@@ -114,9 +114,10 @@
 
         // Собираем минимальные цены по дням
         flights.forEach(dayData => {
-            if (!dayData || !dayData.prices || !Array.isArray(dayData.prices)) return;
+            if (!dayData) return;
 
-            const dayMinPrice = this.findDayMinPrice(dayData.prices);
+            // view=summary отдает min_price готовым, полный ответ - массив prices
+            const dayMinPrice = dayData.min_price != null ? dayData.min_price : this.findDayMinPrice(dayData.prices);
             if (dayMinPrice && !isNaN(dayMinPrice)) {
                 const date = dayData.date;
                 pricesByDate[date] = dayMinPrice;